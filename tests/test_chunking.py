@@ -0,0 +1,24 @@
+import numpy as np
+
+from whisper_vox import resolve_chunk_length, resolve_search_seconds
+from whisper_vox_vad import SAMPLE_RATE, find_split_points
+
+def speech_like_audio(seconds, seed=0):
+    """0.3〜8秒の発話と0.2〜1.5秒の無音が交互に続く音声"""
+    rng = np.random.default_rng(seed)
+    pieces = []
+    total = 0
+    while total < seconds * SAMPLE_RATE:
+        speech = int(rng.uniform(0.3, 8.0) * SAMPLE_RATE)
+        silence = int(rng.uniform(0.2, 1.5) * SAMPLE_RATE)
+        pieces.append(rng.normal(0, 0.1, speech).astype(np.float32))
+        pieces.append(rng.normal(0, 0.001, silence).astype(np.float32))
+        total += speech + silence
+    return np.concatenate(pieces)
+
+def test_default_sequential_chunks_fit_one_whisper_window():
+    audio = speech_like_audio(600)
+    chunks = find_split_points(audio, resolve_chunk_length(None), search_seconds=resolve_search_seconds(None))
+    lengths = [(end - start) / SAMPLE_RATE for start, end in chunks]
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(audio)
+    assert max(lengths) <= 30.0
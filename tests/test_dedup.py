@@ -0,0 +1,39 @@
+import numpy as np
+
+from whisper_vox_dedup import FINGERPRINT_HOP, FingerprintIndex, fingerprint
+from whisper_vox_vad import SAMPLE_RATE
+
+SETTINGS = {"model": "tiny", "language": "ja"}
+
+def noise(seconds, seed):
+    return np.random.default_rng(seed).normal(0, 0.1, int(seconds * SAMPLE_RATE)).astype(np.float32)
+
+def stored(text):
+    return {"text": text, "segments": [{"start": 0.0, "end": 1.0, "text": text}], "language": "ja"}
+
+def test_lookup_matches_shifted_audio_only(tmp_path):
+    index = FingerprintIndex(str(tmp_path / "index.sqlite"))
+    audio = noise(6, 0)
+    index.add(fingerprint(audio), 6.0, SETTINGS, stored("intro"))
+    index.add(fingerprint(noise(6, 1)), 6.0, SETTINGS, stored("other"))
+
+    match = index.lookup(fingerprint(audio[3 * FINGERPRINT_HOP:]), 6.0, SETTINGS)
+    assert match is not None
+    result, shift = match
+    assert result["text"] == "intro" and shift == -3
+    assert index.lookup(fingerprint(noise(6, 2)), 6.0, SETTINGS) is None
+    assert index.lookup(fingerprint(audio), 6.0, dict(SETTINGS, model="base")) is None
+    index.close()
+
+def test_index_is_evicted_to_its_share_of_the_cache_limit(tmp_path):
+    path = tmp_path / "index.sqlite"
+    # 容量上限を約200KBにする
+    index = FingerprintIndex(str(path), max_size_gb=200 * 1024 / 1024 ** 3 / 0.05)
+    first = fingerprint(noise(10, 0))
+    index.add(first, 10.0, SETTINGS, stored("first"))
+    for seed in range(1, 200):
+        index.add(fingerprint(noise(10, seed)), 10.0, SETTINGS, stored(f"span {seed}"))
+    assert index._used_bytes() <= index.max_bytes
+    # 最後に使われた時刻が古い区間から削除される
+    assert index.lookup(first, 10.0, SETTINGS) is None
+    index.close()
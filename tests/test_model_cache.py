@@ -0,0 +1,71 @@
+import threading
+import time
+
+from whisper_vox import ModelCache
+
+class FakeModelCache(ModelCache):
+    """Whisperを読み込まずに、ロードした回数を記録するModelCache"""
+    def __init__(self, max_models=2, slow_models=()):
+        super().__init__(max_models)
+        self.loads = []
+        self.slow_models = slow_models
+        self.loading = threading.Event()
+        self.finish = threading.Event()
+
+    def _load(self, model_size, device, dtype):
+        self.loads.append(model_size)
+        if model_size in self.slow_models:
+            self.loading.set()
+            self.finish.wait(5)
+        return f"model:{model_size}"
+
+    @staticmethod
+    def _release(key):
+        pass
+
+def test_loading_does_not_block_other_models():
+    cache = FakeModelCache(slow_models=("large",))
+    loader = threading.Thread(target=cache.get, args=("large", "cpu"))
+    loader.start()
+    try:
+        assert cache.loading.wait(5)
+        started = time.monotonic()
+        assert not cache.is_loaded("large", "cpu")
+        assert cache.loaded_keys() == []
+        assert cache.get("tiny", "cpu") == "model:tiny"
+        cache.inference_lock("tiny", "cpu")
+        assert time.monotonic() - started < 1.0
+    finally:
+        cache.finish.set()
+        loader.join()
+    assert cache.is_loaded("large", "cpu")
+
+def test_concurrent_callers_of_same_model_load_once():
+    cache = FakeModelCache(slow_models=("large",))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("large", "cpu"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert cache.loading.wait(5)
+    cache.finish.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["model:large"] * 3
+    assert cache.loads == ["large"]
+
+def test_pipeline_models_stay_loaded_across_files(monkeypatch, tmp_path):
+    import whisper_vox
+
+    cache = FakeModelCache(max_models=2)
+    monkeypatch.setattr(whisper_vox, "model_cache", cache)
+    # 入力が存在しないため文字起こしは行われないが、使うモデルの数に合わせてキャッシュの上限が決まる
+    whisper_vox.generate_subtitles(
+        str(tmp_path / "missing.mp4"), str(tmp_path / "out.srt"), model_size="large", language="auto",
+        device="cpu", cache=None, draft_model="small", detect_model="tiny")
+    assert cache.max_models == 3
+
+    # 2つのファイルを -l auto --draft-model small -m large で処理した場合のモデルの取得順
+    for _ in range(2):
+        for model_size in ("tiny", "small", "large"):
+            cache.get(model_size, "cpu")
+    assert cache.loads == ["tiny", "small", "large"]
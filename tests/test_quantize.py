@@ -0,0 +1,27 @@
+import os
+
+import torch
+import whisper
+from whisper.model import ModelDimensions, Whisper
+
+from whisper_vox_quantize import load_int8_model, quantized_model_path
+
+DIMS = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=2, n_audio_layer=1,
+                       n_vocab=51865, n_text_ctx=448, n_text_state=96, n_text_head=6, n_text_layer=4)
+
+def test_saved_int8_model_is_loaded_from_weights(monkeypatch, tmp_path):
+    loads = []
+    def load_model(name, device=None):
+        loads.append(name)
+        model = Whisper(DIMS)
+        model.set_alignment_heads(whisper._ALIGNMENT_HEADS[name])
+        return model
+    monkeypatch.setattr(whisper, "load_model", load_model)
+    first = load_int8_model("tiny", str(tmp_path))
+    assert os.path.exists(quantized_model_path("tiny", str(tmp_path)))
+    second = load_int8_model("tiny", str(tmp_path))
+    # 2回目は元のモデルを読まずに、保存した重みから組み立てる
+    assert loads == ["tiny"]
+    mel = torch.randn(1, 80, 3000)
+    assert torch.equal(first.encoder(mel), second.encoder(mel))
+    assert torch.equal(second.alignment_heads.to_dense(), first.alignment_heads.to_dense())
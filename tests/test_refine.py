@@ -0,0 +1,71 @@
+from whisper_vox_refine import merge_refined
+
+def segment(start, end, text):
+    return {"start": start, "end": end, "text": text}
+
+def assert_no_overlap(segments):
+    for previous, current in zip(segments, segments[1:]):
+        assert previous["end"] <= current["start"]
+
+def test_refined_segment_straddling_region_edge_is_clipped():
+    draft = [segment(0.0, 4.0, "a"), segment(4.0, 6.0, "b?"), segment(6.0, 10.0, "c")]
+    # 大きいモデルのセグメントが精査した区間 (4.0, 6.0) の外まで伸びている
+    refined = [segment(3.2, 5.0, "B1"), segment(5.0, 6.8, "B2")]
+    merged = merge_refined(draft, [((4.0, 6.0), refined)])
+    assert [s["text"] for s in merged] == ["a", "B1", "B2", "c"]
+    assert (merged[1]["start"], merged[2]["end"]) == (4.0, 6.0)
+    assert_no_overlap(merged)
+
+def test_draft_segment_reaching_into_region_is_trimmed():
+    draft = [segment(0.0, 4.6, "a"), segment(4.5, 6.0, "b?"), segment(6.0, 10.0, "c")]
+    merged = merge_refined(draft, [((4.5, 6.0), [segment(4.5, 6.0, "B")])])
+    assert [s["text"] for s in merged] == ["a", "B", "c"]
+    assert merged[0]["end"] == 4.5
+    assert draft[0]["end"] == 4.6
+    assert_no_overlap(merged)
+
+def words(start, end, probability):
+    return [{"word": "w", "start": start, "end": end, "probability": probability}]
+
+def window_segment(start, end, text, probability):
+    # avg_logprob などはWhisperが窓ごとに求めた値で、同じ窓のセグメントでは同じになる
+    return dict(segment(start, end, text), avg_logprob=-1.2, compression_ratio=1.1, no_speech_prob=0.1,
+                words=words(start, end, probability))
+
+class FakeModel:
+    def __init__(self, segments):
+        self.segments = segments
+        self.calls = []
+
+    def transcribe(self, audio, **options):
+        self.calls.append((len(audio), options))
+        segments = [dict(s) for s in self.segments]
+        return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": "ja"}
+
+def test_only_weak_segment_in_a_window_is_refined():
+    import numpy as np
+    from whisper_vox import transcribe_tiered
+    from whisper_vox_refine import REFINE_CONTEXT_SECONDS
+    from whisper_vox_vad import SAMPLE_RATE
+
+    draft = FakeModel([
+        window_segment(0.0, 8.0, "a", 0.95),
+        window_segment(8.0, 12.0, "b?", 0.2),
+        window_segment(12.0, 24.0, "c", 0.9),
+    ])
+    refine = FakeModel([segment(REFINE_CONTEXT_SECONDS, REFINE_CONTEXT_SECONDS + 4.0, "B")])
+    refined_seconds = []
+    audio = np.zeros(24 * SAMPLE_RATE, dtype=np.float32)
+    result = transcribe_tiered(draft, lambda: refine, threading_lock(), audio, [(0, len(audio))],
+                               on_refine=refined_seconds.append)
+
+    assert refined_seconds == [4.0]
+    assert len(refine.calls) == 1
+    assert refine.calls[0][0] == int((4.0 + 2 * REFINE_CONTEXT_SECONDS) * SAMPLE_RATE)
+    assert draft.calls[0][1]["word_timestamps"] is True
+    assert [s["text"] for s in result["segments"]] == ["a", "B", "c"]
+    assert all("words" not in s for s in result["segments"])
+
+def threading_lock():
+    import threading
+    return threading.Lock()
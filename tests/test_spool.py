@@ -0,0 +1,58 @@
+import os
+
+from whisper_vox_spool import LEASE_SUFFIX, RECORD_SUFFIX, Spool, _read_json, _write_json
+
+def claimed_spool(tmp_path, name="a.mp4", owner="w1"):
+    spool = Spool(str(tmp_path), owner=owner, lease_seconds=60.0, settle_seconds=0.0)
+    with open(spool.path("inbox", name), "wb") as f:
+        f.write(b"media")
+    return spool, spool.claim()
+
+def write_output(spool, name, filename, text):
+    path = os.path.join(spool.work_dir(name), filename)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+def expire_and_reclaim(spool, name):
+    """リースを期限切れにして、別のワーカーに回収させる"""
+    lease_path = spool.path("processing", name + LEASE_SUFFIX)
+    _write_json(lease_path, dict(_read_json(lease_path), expires=0.0))
+    Spool(spool.root, owner="w2", retry_delay=0.0).reclaim_expired(log=lambda message: None)
+
+def test_renew_fails_after_reclaim(tmp_path):
+    spool, record = claimed_spool(tmp_path)
+    assert spool.renew("a.mp4", record["attempts"])
+    assert not spool.renew("a.mp4", record["attempts"] + 1)
+    expire_and_reclaim(spool, "a.mp4")
+    assert not spool.renew("a.mp4", record["attempts"])
+    assert not os.path.exists(spool.path("processing", "a.mp4" + LEASE_SUFFIX))
+
+def test_complete_after_reclaim_publishes_nothing(tmp_path):
+    spool, record = claimed_spool(tmp_path)
+    output = write_output(spool, "a.mp4", "a.srt", "old")
+    expire_and_reclaim(spool, "a.mp4")
+    # 回収したワーカーが取得し直した後に、元のワーカーが完了しようとする
+    other = Spool(spool.root, owner="w2", lease_seconds=60.0, retry_delay=0.0, settle_seconds=0.0)
+    assert other.claim()["attempts"] == 2
+    assert spool.complete(record, {"output_paths": {"srt": output}}) is None
+    assert os.listdir(spool.path("outbox")) == []
+    assert os.path.exists(spool.path("processing", "a.mp4"))
+    assert os.path.exists(spool.path("processing", "a.mp4" + LEASE_SUFFIX))
+    assert os.path.exists(spool.path("processing", "a.mp4" + RECORD_SUFFIX))
+    assert os.path.exists(output)
+
+def test_outputs_are_separated_by_input_name(tmp_path):
+    spool, record = claimed_spool(tmp_path)
+    outputs = []
+    for name in ["a.mkv", "a.mp4"]:
+        outputs += spool.complete(record, {"output_paths": {"srt": write_output(spool, record["name"], "a.srt", record["name"])}})
+        with open(spool.path("inbox", name), "wb") as f:
+            f.write(b"media")
+        record = spool.claim()
+    outputs += spool.complete(record, {"output_paths": {"srt": write_output(spool, record["name"], "a.srt", record["name"])}})
+    assert [os.path.relpath(path, spool.path("outbox")) for path in outputs] == [
+        os.path.join("a.mp4", "a.srt"), os.path.join("a.mkv", "a.srt"), os.path.join("a.mp4.2", "a.srt")]
+    with open(os.path.join(spool.path("outbox", "a.mkv"), "a.srt"), encoding="utf-8") as f:
+        assert f.read() == "a.mkv"
+    assert os.path.exists(os.path.join(spool.path("outbox", "a.mp4.2"), "a.mp4" + RECORD_SUFFIX))
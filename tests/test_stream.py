@@ -0,0 +1,36 @@
+import numpy as np
+
+from whisper_vox_stream import StreamingTranscriber
+from whisper_vox_vad import SAMPLE_RATE
+
+class FakeModel:
+    """決まったセグメントを返すWhisperモデルの代わり"""
+    def __init__(self, segments):
+        self.segments = segments
+
+    def transcribe(self, audio, **options):
+        return {"segments": [dict(start=start, end=end, text=text) for start, end, text in self.segments]}
+
+def speech_like_audio(seconds, seed=0):
+    """1秒ごとに発話と無音が交互に続く音声"""
+    rng = np.random.default_rng(seed)
+    audio = rng.normal(0, 0.001, int(seconds * SAMPLE_RATE)).astype(np.float32)
+    for second in range(0, int(seconds), 2):
+        audio[second * SAMPLE_RATE:(second + 1) * SAMPLE_RATE] *= 100
+    return audio
+
+def test_pending_segment_is_committed_before_buffer_overflow():
+    messages = []
+    transcriber = StreamingTranscriber(FakeModel([(0.0, 5.0, "a"), (5.0, 29.0, "b")]), log=messages.append)
+    cues = transcriber.feed(speech_like_audio(45))
+    # "b" はウィンドウ末尾で保留される位置だが、捨てる音声（先頭15秒）にかかるため確定する
+    assert [(cue["start"], cue["end"], cue["text"]) for cue in cues] == [(0.0, 5.0, "a"), (5.0, 29.0, "b")]
+    assert transcriber.buffer_start == 29.0
+    assert messages == []
+
+def test_dropping_untranscribed_speech_is_reported():
+    messages = []
+    transcriber = StreamingTranscriber(FakeModel([]), log=messages.append)
+    assert transcriber.feed(speech_like_audio(45)) == []
+    assert transcriber.buffer_start == 15.0
+    assert len(messages) == 1 and "破棄" in messages[0]
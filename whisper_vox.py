@@ -1,18 +1,274 @@
 #!/usr/bin/env python3
 import argparse
+import glob
 import os
+import shutil
+import signal
+import socket
 import subprocess
+import sys
+import tempfile
+import threading
 import time
-import whisper
-import torch
+import wave
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+# torchとwhisperは読み込みに数秒かかるため、--helpや引数の検証、GUIの起動を待たせないよう
+# 推論に必要になった時点で各関数の中でインポートする
+from whisper_vox_autotune import DEFAULT_CALIBRATION_SECONDS, MODEL_SIZES, auto_tune
+from whisper_vox_batch import BatchDecoder, batch_chunks, transcribe_batched
+from whisper_vox_cache import ResultCache
+from whisper_vox_checkpoint import ChunkCheckpoint, audio_fingerprint, checkpoint_path
+from whisper_vox_dedup import (
+    FingerprintIndex, carve_chunks, dedup_spans, default_index_path, fingerprint, reused_result, span_result
+)
+from whisper_vox_events import JsonLinesWriter, ProgressReporter, PrometheusExporter, peak_rss_bytes, torch_num_threads
+from whisper_vox_langid import AUTO_LANGUAGE, DEFAULT_DETECT_MODEL, chunk_languages, identify_language, language_samples
+from whisper_vox_pcm import PcmFile, compact_speech_pcm, extract_pcm, ffmpeg_pcm_command, iter_windows
+from whisper_vox_probe import NoAudioStreamError, describe_stream, is_direct_wav, probe_media, read_wav, select_stream
+from whisper_vox_parallel import DEFAULT_CHUNK_LENGTH, default_threads_per_worker, shutdown_pools, transcribe_parallel
+from whisper_vox_quantize import CPU_DTYPES, bf16_supported, enable_bf16_autocast, load_int8_model
+from whisper_vox_refine import REFINE_CONTEXT_SECONDS, merge_refined, refine_regions
+from whisper_vox_segments import merge_results, remap_segments, shift_segments
+from whisper_vox_vad import (
+    DEFAULT_VAD_MIN_SILENCE, DEFAULT_VAD_PADDING, SAMPLE_RATE, compact_speech, detect_speech, find_split_points,
+    time_mapper
+)
+from whisper_vox_writers import OUTPUT_FORMATS, MultiFormatWriter
 
-def format_time(seconds):
-    """秒数を SRT 形式の時間文字列に変換"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((seconds % 1) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+# 単語のタイムスタンプの算出（whisper.timingのnumba関数）をメインスレッド以外で実行すると、
+# numbaのTBBスレッド層がプロセスの終了時に停止しなくなるため、既定のスレッド層を変更する
+# （この関数は並列化されていないため速度は変わらない）
+os.environ.setdefault("NUMBA_THREADING_LAYER", "workqueue")
+
+# ディレクトリ指定時に処理対象とする拡張子
+MEDIA_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm',
+                    '.mp3', '.wav', '.m4a', '.aac', '.flac', '.ogg', '.opus']
+
+# 逐次出力時のチャンク長の既定値と、境界を探す範囲（秒）。
+# 境界が目標より後ろにずれてもWhisperが一度に処理する長さ（30秒）に収まるようにする
+# （30秒を超えたチャンクは残りの数秒のために窓をもう1つ推論することになる）
+DEFAULT_SEQUENTIAL_CHUNK_LENGTH = 24.0
+DEFAULT_SEQUENTIAL_SEARCH_SECONDS = 6.0
+
+# 次のチャンクの文脈として渡す、直前のチャンクのテキストの長さ（文字数）
+PROMPT_CHARS = 200
+
+# 常駐させるモデル数の既定値（環境変数 WHISPERVOX_MAX_MODELS で変更可能）
+DEFAULT_MAX_MODELS = int(os.environ.get("WHISPERVOX_MAX_MODELS", "2"))
+
+class ModelCache:
+    """ロード済みWhisperモデルをプロセス内で保持するLRUキャッシュ
+
+    キーは (モデルサイズ, デバイス, dtype)。ジョブをまたいでモデルを常駐させ、
+    2回目以降の文字起こしではロード時間をゼロにする。
+    int8量子化済みのモデルはcache_dir（Noneはキャッシュディレクトリの既定値）のmodels/に保存する。
+    """
+    def __init__(self, max_models=DEFAULT_MAX_MODELS, cache_dir=None):
+        self.max_models = max_models
+        self.cache_dir = cache_dir
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._inference_locks = {}
+        self._load_locks = {}
+
+    @staticmethod
+    def make_key(model_size, device, dtype=None):
+        """キャッシュキーを生成"""
+        return (model_size, device, dtype or "float32")
+
+    def is_loaded(self, model_size, device, dtype=None):
+        """指定したモデルが常駐しているかどうか"""
+        with self._lock:
+            return self.make_key(model_size, device, dtype) in self._models
+
+    def get(self, model_size, device, dtype=None):
+        """モデルを取得する（未ロードならロードしてキャッシュに登録）
+
+        ロードはモデルごとのロックで行い、全体のロックは保持しない。同じモデルを同時に要求した
+        呼び出し元はロードの完了を待ち、他のモデルの取得や is_loaded・loaded_keys は待たされない。
+        """
+        key = self.make_key(model_size, device, dtype)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            # 待っている間に他の呼び出し元がロードを終えていればそれを使う
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key]
+            model = self._load(*key)
+            evicted = []
+            with self._lock:
+                self._models[key] = model
+                # LRU上限を超えた分を古い順に解放
+                while self.max_models > 0 and len(self._models) > self.max_models:
+                    old_key, _ = self._models.popitem(last=False)
+                    evicted.append(old_key)
+            for old_key in evicted:
+                self._release(old_key)
+            return model
+
+    def reserve(self, count):
+        """少なくともcount個のモデルを常駐できるよう上限を引き上げる（上限なしの場合は変更しない）"""
+        with self._lock:
+            if 0 < self.max_models < count:
+                self.max_models = count
+
+    def inference_lock(self, model_size, device, dtype=None):
+        """モデルごとの推論用ロックを返す
+
+        Whisperはデコードのたびにモデルへフックを登録するため、
+        同じモデルで複数のスレッドが同時に推論しないよう、このロックで排他する。
+        """
+        key = self.make_key(model_size, device, dtype)
+        with self._lock:
+            return self._inference_locks.setdefault(key, threading.Lock())
+
+    def evict(self, model_size, device, dtype=None):
+        """指定したモデルをキャッシュから明示的に解放する"""
+        key = self.make_key(model_size, device, dtype)
+        with self._lock:
+            if self._models.pop(key, None) is None:
+                return False
+        self._release(key)
+        return True
+
+    def clear(self):
+        """全モデルを解放する"""
+        with self._lock:
+            keys = list(self._models)
+            self._models.clear()
+        for key in keys:
+            self._release(key)
+
+    def loaded_keys(self):
+        """常駐中のモデルのキー一覧（古い順）"""
+        with self._lock:
+            return list(self._models)
+
+    def _load(self, model_size, device, dtype):
+        import whisper
+        if dtype == "int8":
+            return load_int8_model(model_size, self.cache_dir)
+        model = whisper.load_model(model_size, device=device)
+        if dtype == "float16":
+            model = model.half()
+        elif dtype == "bfloat16":
+            enable_bf16_autocast(model)
+        return model
+
+    @staticmethod
+    def _release(key):
+        if key[1] == "cuda":
+            import torch
+            torch.cuda.empty_cache()
+
+# プロセス全体で共有するモデルキャッシュ
+model_cache = ModelCache()
+
+def pipeline_model_keys(model_size, device, dtype=None, language=None, detect_model=DEFAULT_DETECT_MODEL,
+                        draft_model=None):
+    """1つの入力の文字起こしで使うモデルのキャッシュキーの集合（言語判定・下書き・本番のモデル）"""
+    keys = {ModelCache.make_key(model_size, device, dtype)}
+    if draft_model is not None:
+        keys.add(ModelCache.make_key(draft_model, device, dtype))
+    if language == AUTO_LANGUAGE:
+        # 言語判定のモデルは常にfloat32でロードする
+        keys.add(ModelCache.make_key(detect_model, device))
+    return keys
+
+# ジョブごとの一時作業ディレクトリの接頭辞と所有者情報ファイル名
+SCRATCH_PREFIX = "whispervox-"
+SCRATCH_OWNER_FILE = "owner"
+
+def _pid_alive(pid):
+    """同一ホスト上のプロセスが生存しているかどうか"""
+    if os.name == "nt":
+        # Windowsのos.killはプロセスを終了させてしまうため、OpenProcessで確認する
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def scratch_root_dir(root=None):
+    """一時作業ディレクトリのルートを決定（環境変数 WHISPERVOX_SCRATCH でも指定可能）"""
+    return root or os.environ.get("WHISPERVOX_SCRATCH") or tempfile.gettempdir()
+
+def cleanup_stale_scratch(root=None):
+    """クラッシュしたジョブが残した一時作業ディレクトリを削除する
+
+    所有者のプロセスが同一ホスト上で既に終了しているものだけを対象とする。
+    """
+    root = scratch_root_dir(root)
+    if not os.path.isdir(root):
+        return
+    hostname = socket.gethostname()
+    for name in os.listdir(root):
+        if not name.startswith(SCRATCH_PREFIX):
+            continue
+        path = os.path.join(root, name)
+        try:
+            with open(os.path.join(path, SCRATCH_OWNER_FILE), encoding="utf-8") as f:
+                host, pid = f.read().split()
+            if host != hostname or _pid_alive(int(pid)):
+                continue
+        except (OSError, ValueError):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+@contextmanager
+def job_scratch(root=None):
+    """ジョブ専用の一時作業ディレクトリを作成するコンテキストマネージャ
+
+    同じディレクトリから複数のジョブを同時に実行しても衝突しないよう、
+    ジョブごとに一意なディレクトリを作成し、終了時（例外発生時も含む）に削除する。
+    強制終了などで削除できなかったディレクトリは次回起動時に掃除される。
+
+    Args:
+        root: 一時作業ディレクトリを作成する場所（tmpfsなど）。Noneは環境変数またはOSの既定
+    """
+    root = scratch_root_dir(root)
+    os.makedirs(root, exist_ok=True)
+    cleanup_stale_scratch(root)
+    path = tempfile.mkdtemp(prefix=SCRATCH_PREFIX, dir=root)
+    with open(os.path.join(path, SCRATCH_OWNER_FILE), "w", encoding="utf-8") as f:
+        f.write(f"{socket.gethostname()} {os.getpid()}")
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def save_audio_wav(audio, output_path, scratch_root=None):
+    """抽出した音声を16bit PCMのWAVファイルとして保存する
+
+    一時作業ディレクトリに書き出してから移動するため、途中で失敗しても
+    不完全なファイルが出力先に残らない。
+    """
+    with job_scratch(scratch_root) as scratch:
+        temp_path = os.path.join(scratch, "audio.wav")
+        with wave.open(temp_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            # 長時間の音声でもメモリを使いすぎないよう、一定量ずつ変換して書き込む
+            for window in iter_windows(audio):
+                f.writeframes((np.clip(window, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+        shutil.move(temp_path, output_path)
 
 def format_duration(seconds):
     """秒数を読みやすい形式に変換"""
@@ -26,140 +282,1569 @@ def format_duration(seconds):
     minutes %= 60
     return f"{int(hours)}時間{int(minutes)}分{seconds:.2f}秒"
 
-def generate_subtitles(video_path, output_path="output.srt", model_size="large", language="ja", device=None, output_format="srt"):
-    """動画から字幕を生成する関数
-    
+def load_audio(video_path, sample_rate=SAMPLE_RATE, audio_track=None):
+    """動画から音声をモノラルfloat32 PCMとしてメモリ上に直接読み込む
+
+    一時ファイルを作らず、FFmpegの標準出力をパイプで受け取る。
+
     Args:
         video_path: 処理する動画ファイルのパス
-        output_path: 出力ファイルのパス
-        model_size: 使用するWhisperモデルのサイズ
-        language: 文字起こしの言語
-        device: 使用するデバイス（"cuda"または"cpu"）
-        output_format: 出力形式（"srt"または"txt"）
+        sample_rate: 出力サンプリングレート
+        audio_track: 音声トラックの番号（音声トラックだけを数えた0始まりの番号、Noneは既定のトラック）
+
+    Returns:
+        -1.0〜1.0に正規化されたnumpy.ndarray（float32, 1次元）
     """
-    start_time = time.time()
-    
+    cmd = ffmpeg_pcm_command(video_path, sample_rate, audio_track)
+    out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+    return np.frombuffer(out, np.float32).copy()
+
+def decode_audio(video_path, info=None, audio_track=None, low_memory=False, scratch_root=None):
+    """入力の音声を読み込み、(音声, FFmpegでの変換を省略したかどうか) を返す
+
+    16kHzモノラルの16bit PCM WAVはFFmpegを起動せずにそのまま読み込む。
+    infoはprobe_mediaの戻り値（Noneの場合は常にFFmpegで抽出する）。
+    low_memoryがTrueの場合は一時ファイルに書き出したPcmFileを返す。
+    """
+    if is_direct_wav(info, audio_track):
+        pcm = PcmFile(scratch_root) if low_memory else None
+        try:
+            return read_wav(video_path, pcm), True
+        except (wave.Error, EOFError):
+            # 拡張形式のヘッダーなど、waveモジュールで読めない場合はFFmpegで抽出する
+            if pcm is not None:
+                pcm.close()
+    if low_memory:
+        return extract_pcm(video_path, scratch_root, audio_track=audio_track), False
+    return load_audio(video_path, audio_track=audio_track), False
+
+def probe_duration(video_path):
+    """ffprobeで入力ファイルの長さ（秒）を取得する（取得できない場合はNone）"""
+    info = probe_media(video_path)
+    return info["duration"] if info is not None else None
+
+def track_output_path(output_path, audio_track):
+    """複数の音声トラックを処理する場合の、トラックごとの出力ファイルのパス（例: 動画.track1.srt）"""
+    base, extension = os.path.splitext(output_path)
+    return f"{base}.track{audio_track}{extension}"
+
+def audio_cache_digest(digest, audio_track=None):
+    """抽出音声のキャッシュのキー（音声トラックを指定した場合はトラック番号を付けて区別する）"""
+    return digest if audio_track is None else f"{digest}-a{audio_track}"
+
+def resolve_device(device=None, log=print):
+    """使用するデバイスを決定して表示する
+
+    Args:
+        device: 使用するデバイス（"cuda"、"cpu"、Noneは自動検出）
+        log: メッセージの出力先
+
+    Returns:
+        実際に使用するデバイス名
+    """
+    import torch
     # デバイスの自動検出と設定
     if device is None:
         device = "cuda" if torch.cuda.is_available() else "cpu"
     
     # GPUが使えるか確認
     if device == "cuda" and not torch.cuda.is_available():
-        print("警告: GPUが使えません。CPUで実行します。")
+        log("警告: GPUが使えません。CPUで実行します。")
         device = "cpu"
     
     if device == "cuda":
-        print(f"GPU使用: {torch.cuda.get_device_name(0)}")
-        print(f"VRAM容量: {torch.cuda.get_device_properties(0).total_memory / (1024**3):.2f} GB")
+        log(f"GPU使用: {torch.cuda.get_device_name(0)}")
+        log(f"VRAM容量: {torch.cuda.get_device_properties(0).total_memory / (1024**3):.2f} GB")
     else:
-        print("CPU使用")
-    
-    # 1. 動画から音声を抽出
-    audio_path = "temp_audio.mp3"
+        log("CPU使用")
+    return device
+
+def resolve_dtype(dtype, device, log=print):
+    """デバイスで使用できない精度が指定された場合はfloat32に切り替える"""
+    if dtype == "float16" and device != "cuda":
+        log("警告: float16はGPUでのみ使用できます。float32で実行します。")
+        return "float32"
+    if dtype in CPU_DTYPES and device != "cpu":
+        log(f"警告: {dtype}はCPUでのみ使用できます。float32で実行します。")
+        return "float32"
+    if dtype == "bfloat16" and not bf16_supported():
+        log("警告: このCPUはbfloat16の演算に対応していません。float32で実行します。")
+        return "float32"
+    return dtype
+
+# 保存メッセージに表示する出力形式の名前
+FORMAT_LABELS = {
+    "srt": "SRTファイル",
+    "vtt": "WebVTTファイル",
+    "txt": "テキストファイル",
+    "tsv": "TSVファイル",
+    "json": "JSONファイル",
+}
+
+def parse_formats(value):
+    """カンマ区切りの出力形式の指定をリストに変換する（重複は除く）"""
+    formats = list(dict.fromkeys(f.strip().lower() for f in value.split(",") if f.strip()))
+    unknown = [f for f in formats if f not in OUTPUT_FORMATS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(
+            f"未対応の出力形式です: {', '.join(unknown) or value}（指定可能: {', '.join(OUTPUT_FORMATS)}）")
+    return formats
+
+def parse_audio_tracks(value):
+    """--audio-trackの指定（カンマ区切りの音声トラックの番号、またはall）を解析する"""
+    if value.strip().lower() == "all":
+        return "all"
     try:
-        print(f"動画ファイル '{video_path}' から音声を抽出中...")
-        subprocess.run([
-            "ffmpeg", 
-            "-i", video_path, 
-            "-vn", 
-            "-acodec", "mp3", 
-            "-y",  # 既存ファイルを上書き
-            audio_path
-        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print("音声抽出完了")
-    except subprocess.CalledProcessError as e:
-        print(f"音声抽出エラー: {e}")
-        print(f"FFmpeg出力: {e.stderr.decode('utf-8', errors='replace')}")
-        return
-    except FileNotFoundError:
-        print("エラー: FFmpegが見つかりません。インストールしてパスを通してください。")
-        return
+        tracks = list(dict.fromkeys(int(t) for t in value.split(",") if t.strip()))
+    except ValueError:
+        tracks = []
+    if not tracks or min(tracks) < 0:
+        raise argparse.ArgumentTypeError(f"音声トラックの指定が正しくありません: {value}（0始まりの番号のカンマ区切り、またはall）")
+    return tracks
+
+def as_format_list(output_format):
+    """出力形式の指定（文字列またはリスト）をリストにする"""
+    return [output_format] if isinstance(output_format, str) else list(output_format)
+
+def output_paths(output_path, output_format="srt"):
+    """出力形式ごとの出力ファイルのパスの辞書を返す
+
+    形式が1つの場合はoutput_pathをそのまま使い、複数の場合はoutput_pathの拡張子を各形式のものに置き換える。
+    """
+    formats = as_format_list(output_format)
+    if len(formats) == 1:
+        return {formats[0]: output_path}
+    base = os.path.splitext(output_path)[0]
+    return {f: f"{base}.{f}" for f in formats}
+
+# CPUでは実時間より大幅に遅くなりやすいモデル
+SLOW_CPU_MODELS = ("medium", "large")
+
+class TranscriptionCancelled(Exception):
+    """文字起こしがキャンセルされたことを表す例外"""
+
+def write_output(result, output_path, output_format="srt", log=print):
+    """文字起こし結果を指定された形式で保存（logは保存メッセージの出力先）
+
+    output_formatにリストを指定した場合は、各形式のファイルをまとめて書き出す。
+    """
+    outputs = output_paths(output_path, output_format)
+    with MultiFormatWriter(outputs, result.get("language")) as writer:
+        writer.write(result["segments"])
+    for f, path in outputs.items():
+        log(f"{FORMAT_LABELS[f]}保存: {path}")
+
+def resolve_chunk_length(chunk_length, parallel_workers=0):
+    """チャンク長の指定（Noneは処理方式ごとの既定値）を秒数に解決する"""
+    if chunk_length is not None:
+        return chunk_length
+    return DEFAULT_CHUNK_LENGTH if parallel_workers > 1 else DEFAULT_SEQUENTIAL_CHUNK_LENGTH
+
+def resolve_search_seconds(chunk_length, parallel_workers=0):
+    """チャンクの境界を探す範囲（秒、Noneはfind_split_pointsの既定値）"""
+    if chunk_length is None and parallel_workers <= 1:
+        return DEFAULT_SEQUENTIAL_SEARCH_SECONDS
+    return None
+
+def transcribe_sequential(model, audio, chunks, language="ja", fp16=False, on_chunk=None, completed=(),
+                          word_timestamps=False, languages=None):
+    """チャンクに分割した音声を先頭から順に文字起こしする
+
+    チャンクごとに直前のチャンクのテキストを文脈（initial_prompt）として渡し、
+    分割による認識精度の低下を抑える。乱数のシードをチャンクごとに固定するため、
+    途中から再開しても最初から実行した場合と同じ結果になる。
+
+    Args:
+        model: Whisperモデル
+        audio: float32のモノラル音声
+        chunks: (開始サンプル, 終了サンプル) のリスト（find_split_pointsの戻り値）
+        language: 文字起こしの言語
+        fp16: 半精度で推論するかどうか
+        on_chunk: チャンクが終わるたびに (番号, 開始サンプル, 終了サンプル, 結果) で呼ばれる関数
+        completed: 先頭から順に文字起こし済みのチャンクの結果（チェックポイントからの再開用）
+        word_timestamps: 単語ごとのタイムスタンプを求めるかどうか
+        languages: チャンクごとの言語のリスト（Noneの要素と省略時はlanguageを使う）
+
+    Returns:
+        model.transcribeと同じ形式の辞書
+    """
+    import torch
+    parts = [(start / SAMPLE_RATE, result) for (start, _), result in zip(chunks, completed)]
+    prompt = None
+    for _, result in parts:
+        prompt = chunk_prompt(result, prompt)
+    for index in range(len(completed), len(chunks)):
+        start, end = chunks[index]
+        torch.manual_seed(index)
+        chunk_language = (languages[index] if languages else None) or language
+        result = model.transcribe(audio[start:end], language=chunk_language, fp16=fp16, initial_prompt=prompt,
+                                  word_timestamps=word_timestamps)
+        parts.append((start / SAMPLE_RATE, result))
+        prompt = chunk_prompt(result, prompt)
+        if on_chunk is not None:
+            on_chunk(index, start, end, result)
+    return merge_results(parts, language)
+
+def transcribe_tiered(draft_model, load_refine_model, refine_lock, audio, chunks, language="ja", fp16=False,
+                      on_chunk=None, completed=(), word_timestamps=False, languages=None, on_refine=None):
+    """チャンクごとに速いモデルで下書きし、確信度の低い区間だけを大きいモデルで文字起こしし直す
+
+    チャンクの分割・文脈の引き継ぎ・乱数のシードはtranscribe_sequentialと同じで、
+    精査した区間のセグメントを置き換えた結果をチャンクの結果とする。
+    精査の対象はセグメントごとに単語の確率で判定するため、下書きは常に単語のタイムスタンプ付きで行う
+    （word_timestampsがFalseの場合、結果からは単語を取り除く）。
+
+    Args:
+        draft_model: 下書きに使うWhisperモデル
+        load_refine_model: 精査に使うWhisperモデルを返す関数（精査する区間が最初に見つかった時点で呼ぶ）
+        refine_lock: 精査に使うモデルの推論用ロック
+        audio: float32のモノラル音声
+        chunks: (開始サンプル, 終了サンプル) のリスト（find_split_pointsの戻り値）
+        language: 文字起こしの言語
+        fp16: 半精度で推論するかどうか
+        on_chunk: チャンクが終わるたびに (番号, 開始サンプル, 終了サンプル, 結果) で呼ばれる関数
+        completed: 先頭から順に文字起こし済みのチャンクの結果（チェックポイントからの再開用）
+        word_timestamps: 単語ごとのタイムスタンプを求めるかどうか
+        languages: チャンクごとの言語のリスト（Noneの要素と省略時はlanguageを使う）
+        on_refine: 区間を精査するたびに、その長さ（秒）で呼ばれる関数
+
+    Returns:
+        model.transcribeと同じ形式の辞書
+    """
+    import torch
+    parts = [(start / SAMPLE_RATE, result) for (start, _), result in zip(chunks, completed)]
+    prompt = None
+    for _, result in parts:
+        prompt = chunk_prompt(result, prompt)
+    refine_model = None
+    for index in range(len(completed), len(chunks)):
+        start, end = chunks[index]
+        chunk_audio = audio[start:end]
+        chunk_language = (languages[index] if languages else None) or language
+        torch.manual_seed(index)
+        result = draft_model.transcribe(chunk_audio, language=chunk_language, fp16=fp16, initial_prompt=prompt,
+                                        word_timestamps=True)
+        replacements = []
+        for region_start, region_end in refine_regions(result["segments"]):
+            if refine_model is None:
+                refine_model = load_refine_model()
+            # 区間の前後も文脈として文字起こしし、区間内のセグメントだけを採用する
+            context_start = max(0, int((region_start - REFINE_CONTEXT_SECONDS) * SAMPLE_RATE))
+            context_end = min(len(chunk_audio), int((region_end + REFINE_CONTEXT_SECONDS) * SAMPLE_RATE))
+            torch.manual_seed(index)
+            with refine_lock:
+                refined = refine_model.transcribe(chunk_audio[context_start:context_end],
+                                                  language=chunk_language or result.get("language"), fp16=fp16,
+                                                  initial_prompt=prompt, word_timestamps=word_timestamps)
+            replacements.append(((region_start, region_end),
+                                 shift_segments(refined["segments"], context_start / SAMPLE_RATE)))
+            if on_refine is not None:
+                on_refine(region_end - region_start)
+        segments = merge_refined(result["segments"], replacements) if replacements else result["segments"]
+        if not word_timestamps:
+            segments = [{key: value for key, value in segment.items() if key != "words"} for segment in segments]
+        result = {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": result.get("language"),
+        }
+        parts.append((start / SAMPLE_RATE, result))
+        prompt = chunk_prompt(result, prompt)
+        if on_chunk is not None:
+            on_chunk(index, start, end, result)
+    return merge_results(parts, language)
+
+def chunk_prompt(result, previous=None):
+    """チャンクの結果から、次のチャンクに文脈として渡すテキストを返す（空の場合は直前のものを引き継ぐ）"""
+    text = "".join(segment["text"] for segment in result["segments"]).strip()
+    return text[-PROMPT_CHARS:] if text else previous
+
+def result_key_options(model_size="large", language="ja", dtype=None, parallel_workers=0,
+                       chunk_length=None, vad=False, vad_threshold=None,
+                       vad_padding=DEFAULT_VAD_PADDING, vad_min_silence=DEFAULT_VAD_MIN_SILENCE,
+                       word_timestamps=False, audio_track=None, batch_size=0,
+                       detect_model=DEFAULT_DETECT_MODEL, detect_per_chunk=False, draft_model=None, dedup_index=None,
+                       **_):
+    """generate_subtitlesの引数のうち、文字起こし結果に影響する設定を返す（キャッシュのキー用）"""
+    import whisper
+    options = {
+        "model": model_size,
+        "dtype": dtype or "float32",
+        "language": language,
+        "chunk_length": resolve_chunk_length(chunk_length, parallel_workers),
+        "vad": [vad_threshold, vad_padding, vad_min_silence] if vad else None,
+        "whisper_version": whisper.__version__,
+    }
+    # 単語のタイムスタンプを求めない場合は、以前のキャッシュと同じキーになるよう項目を加えない
+    if word_timestamps:
+        options["word_timestamps"] = True
+    if audio_track is not None:
+        options["audio_track"] = audio_track
+    # 並列処理は直前のチャンクの文脈を引き継がないため、同じチャンク長でも結果が逐次の文字起こしと異なる
+    # （ワーカー数には依存しない）
+    if parallel_workers > 1:
+        options["parallel"] = True
+    # バッチ推論は文脈なしで窓ごとにデコードするため、結果が逐次の文字起こしと異なる（バッチサイズには依存しない）
+    if batch_size > 1:
+        options["batched"] = True
+    if draft_model is not None and draft_model != model_size:
+        options["draft_model"] = draft_model
+    # 重複音声の再利用では、一致した区間を独立したチャンクとして扱うため結果が異なる
+    if dedup_index is not None:
+        options["dedup"] = True
+    # 言語を自動判定する場合は、判定に使うモデルと判定の単位によって結果が変わる
+    if language == AUTO_LANGUAGE:
+        options["language_detection"] = {"model": detect_model, "per_chunk": detect_per_chunk}
+    return options
+
+def dedup_settings(key_options, language):
+    """重複音声の索引で結果を区別する設定（チャンクの分割や入力に依存する項目は含めない）"""
+    settings = {key: key_options[key] for key in ("model", "dtype", "whisper_version", "word_timestamps", "draft_model")
+                if key in key_options}
+    settings["language"] = language
+    return settings
+
+def resolve_word_timestamps(word_timestamps, output_format):
+    """単語のタイムスタンプを求めるかどうか（Noneは出力形式にJSONが含まれる場合のみ）"""
+    if word_timestamps is None:
+        return "json" in as_format_list(output_format)
+    return word_timestamps
+
+def cache_keys(cache, video_path, key_options):
+    """キャッシュ用の (入力ハッシュ, 文字起こし結果のキー) を返す
+
+    key_optionsはresult_key_optionsの戻り値
+    """
+    digest = cache.input_digest(video_path)
+    return digest, cache.result_key(digest, **key_options)
+
+def detect_input_language(audio, device, detect_model=DEFAULT_DETECT_MODEL, cache=None, digest=None,
+                          audio_track=None, log=print):
+    """発話区間の一部を小さいモデルで判定し、入力の言語を返す
+
+    判定結果は入力ハッシュ（と音声トラック）ごとにキャッシュし、モデルサイズなどの設定を変えて
+    文字起こしし直す場合は判定を省略する。
+
+    Args:
+        audio: float32のモノラル音声（numpy.ndarrayまたはPcmFile）
+        device: 使用するデバイス
+        detect_model: 判定に使うモデルのサイズ
+        cache: 判定結果のキャッシュ（ResultCache、Noneはキャッシュを使わない）
+        digest: 入力ハッシュ（cache指定時）
+        audio_track: 音声トラックの番号
+        log: メッセージの出力先
+
+    Returns:
+        (言語コード, 確率)
+    """
+    language_key = None
+    if cache is not None and digest is not None:
+        import whisper
+        language_key = cache.result_key(audio_cache_digest(digest, audio_track), language_detection=detect_model,
+                                        whisper_version=whisper.__version__)
+        cached = cache.load_result(language_key)
+        if cached is not None:
+            log(f"言語: {cached['language']}（キャッシュ済みの判定結果、確率 {cached['probability']:.2f}）")
+            return cached["language"], cached["probability"]
+
+    samples = language_samples(audio, detect_speech(audio))
+    model = model_cache.get(detect_model, device)
+    with model_cache.inference_lock(detect_model, device):
+        language, probability, candidates = identify_language(model, samples, fp16=(device == "cuda"))
+    log(f"言語を判定しました: {language}（確率 {probability:.2f}、{detect_model}モデル、{len(samples)}か所の発話）")
+    if language_key is not None:
+        cache.store_result(language_key, {
+            "language": language,
+            "probability": probability,
+            "candidates": candidates,
+        })
+    return language, probability
+
+def generate_subtitles(video_path, output_path="output.srt", model_size="large", language="ja", device=None, output_format="srt",
+                       dtype=None, audio=None, keep_audio=False, scratch_root=None, cache=None,
+                       parallel_workers=0, threads_per_worker=None, chunk_length=None,
+                       vad=False, vad_threshold=None, vad_padding=DEFAULT_VAD_PADDING,
+                       vad_min_silence=DEFAULT_VAD_MIN_SILENCE, reporter=None, resume=False,
+                       word_timestamps=None, cancel_event=None, low_memory=False, audio_track=None,
+                       batch_size=0, batch_decoder=None, detect_model=DEFAULT_DETECT_MODEL, detect_per_chunk=False,
+                       draft_model=None, dedup_index=None):
+    """動画から字幕を生成する関数
+    
+    Args:
+        video_path: 処理する動画ファイルのパス
+        output_path: 出力ファイルのパス（複数の形式を指定した場合は、拡張子を各形式のものに置き換えて保存する）
+        model_size: 使用するWhisperモデルのサイズ
+        language: 文字起こしの言語（"auto"は小さいモデルで判定した言語を使う）
+        device: 使用するデバイス（"cuda"または"cpu"）
+        output_format: 出力形式（"srt"、"vtt"、"txt"、"tsv"、"json"、またはそのリスト）。
+            複数の形式は1回の文字起こし結果から同時に書き出す
+        dtype: モデルの精度（"float32"、"float16"（GPUのみ）、"int8"・"bfloat16"（CPUのみ）、Noneはfloat32）
+        audio: 抽出済みの音声（load_audioの戻り値）。指定時は音声抽出を省略する
+        keep_audio: Trueの場合、抽出した音声を出力ファイルと同じ場所にWAVとして保存する
+        scratch_root: 一時作業ディレクトリを作成する場所（Noneは環境変数またはOSの既定）
+        cache: 抽出音声と文字起こし結果のキャッシュ（ResultCache、Noneはキャッシュを使わない）
+        parallel_workers: 2以上の場合、無音部分で分割したチャンクをこの数のCPUプロセスで並列に文字起こしする
+        threads_per_worker: 並列処理時のワーカー1つあたりのtorchスレッド数（Noneはコア数から自動設定）
+        chunk_length: 文字起こしの単位とする目標チャンク長（秒）。チャンクが終わるたびに出力ファイルへ追記する。
+            Noneは並列処理時120秒、それ以外は24秒（境界を探す範囲と合わせてWhisperの窓の30秒に収まる長さ）。0は分割せずに一度に文字起こしする
+        vad: Trueの場合、発話のない区間を除いてから文字起こしする
+        vad_threshold: 発話とみなすエネルギーのしきい値（dBFS、Noneは自動設定）
+        vad_padding: 発話区間の前後に残す余白（秒）
+        vad_min_silence: 除外する無音の最小の長さ（秒）
+        reporter: 進捗と計測値の通知先（ProgressReporter、Noneは標準出力に表示）
+        resume: Trueの場合、前回中断したときのチェックポイントが残っていれば続きから文字起こしする
+        word_timestamps: 単語ごとのタイムスタンプを求めるかどうか（Noneは出力形式にJSONが含まれる場合のみ）
+        cancel_event: セットされるとチャンクの区切りで文字起こしを中止するthreading.Event。
+            中止時も確定済みの字幕とチェックポイントは残るため、resumeで続きから再開できる
+        low_memory: Trueの場合、抽出した音声を一時ファイルに置き、必要な範囲だけを読み込んで処理する。
+            入力の長さによらず常駐メモリをほぼ一定に抑える（抽出音声のキャッシュは使わない）
+        audio_track: 文字起こしする音声トラックの番号（音声トラックだけを数えた0始まりの番号、Noneは既定のトラック）
+        batch_size: 2以上の場合、音声を30秒以内の窓に分割し、最大この数の窓をまとめて推論する（並列処理時は使用できない）
+        batch_decoder: 他のファイルの文字起こしと共有するBatchDecoder（指定時はbatch_sizeの代わりにこのバッチサイズを使う）
+        detect_model: 言語を自動判定する場合に判定に使うモデルのサイズ
+        detect_per_chunk: Trueの場合、言語の自動判定時にチャンクごとにも言語を判定する（複数の言語が混在する入力用）
+        draft_model: 指定した場合、このサイズのモデルで下書きし、確信度の低い区間だけをmodel_sizeのモデルで
+            文字起こしし直す（並列処理・バッチ推論時は使用できない）
+        dedup_index: 指定した場合、このFingerprintIndexに登録済みの音声と一致する発話区間は推論せずに
+            結果を再利用し、新たに文字起こしした発話区間を登録する
+
+    Returns:
+        処理時間などの統計情報と文字起こし結果（"result"）の辞書（失敗時・キャンセル時はNone）
+    """
+    start_time = time.time()
+    if reporter is None:
+        reporter = ProgressReporter()
+    log = reporter.log
+    
+    device = resolve_device(device, log)
+    
+    dtype = resolve_dtype(dtype, device, log)
+    
+    if parallel_workers > 1 and device != "cpu":
+        log("警告: 並列処理はCPUでのみ使用できます。通常の文字起こしを行います。")
+        parallel_workers = 0
+    
+    if batch_decoder is not None:
+        batch_size = batch_decoder.batch_size
+    if batch_size > 1 and parallel_workers > 1:
+        log("警告: バッチ推論は並列処理と同時に使用できません。並列処理のみを行います。")
+        batch_size = 0
+    
+    if draft_model == model_size:
+        draft_model = None
+    if draft_model is not None and (parallel_workers > 1 or batch_size > 1):
+        log("警告: 下書きと精査の2段階の文字起こしは並列処理・バッチ推論と同時に使用できません。通常の文字起こしを行います。")
+        draft_model = None
+    
+    # 入力ごとに使うモデルがすべて常駐できるようにする（LRUの上限が足りないと、複数の入力を処理するたびに
+    # 言語判定・下書き・本番のモデルを順に追い出してロードし直すことになる）
+    model_cache.reserve(len(pipeline_model_keys(model_size, device, dtype, language, detect_model, draft_model)))
+    
+    if low_memory and chunk_length == 0:
+        log("警告: 省メモリモードでは音声を分割して文字起こしします。既定のチャンク長を使用します。")
+        chunk_length = None
+    
+    if device == "cpu" and model_size in SLOW_CPU_MODELS and draft_model is None:
+        log(f"警告: CPUで{model_size}モデルを使用すると、音声の長さの数倍以上の時間がかかる場合があります"
+            "（--auto-tune で実行環境に合ったモデルを選択できます）")
+    
+    outputs = output_paths(output_path, output_format)
+    word_timestamps = resolve_word_timestamps(word_timestamps, output_format)
+    
+    # 文字起こし結果に影響する設定（キャッシュとチェックポイントの照合に使う）
+    key_options = result_key_options(
+        model_size, language, dtype, parallel_workers, chunk_length,
+        vad, vad_threshold, vad_padding, vad_min_silence, word_timestamps, audio_track, batch_size,
+        detect_model, detect_per_chunk, draft_model, dedup_index
+    )
+    
+    # キャッシュの確認（同じ入力・設定の結果があれば推論を省略する）
+    digest = result_key = cached = None
+    if cache is not None:
+        with reporter.stage("cache_lookup"):
+            digest, result_key = cache_keys(cache, video_path, key_options)
+            cached = cache.load_result(result_key)
+    if cached is not None:
+        log("キャッシュ済みの文字起こし結果を使用します")
+        with reporter.stage("write"):
+            write_output(cached, output_path, output_format, log)
+        if keep_audio:
+            if audio is None and not low_memory:
+                audio = cache.load_audio(audio_cache_digest(digest, audio_track), SAMPLE_RATE)
+            if audio is None:
+                audio, _ = decode_audio(video_path, probe_media(video_path), audio_track, low_memory, scratch_root)
+            audio_output_path = os.path.splitext(output_path)[0] + ".wav"
+            save_audio_wav(audio, audio_output_path, scratch_root)
+            log(f"抽出した音声を保存: {audio_output_path}")
+        total_time = time.time() - start_time
+        audio_duration = cached["audio_duration"]
+        log(f"合計処理時間: {format_duration(total_time)}")
+        stats = {
+            "video_path": video_path,
+            "output_path": output_path,
+            "output_paths": outputs,
+            "audio_duration": audio_duration,
+            "extract_time": 0.0,
+            "model_load_time": 0.0,
+            "transcribe_time": 0.0,
+            "total_time": total_time,
+            "rtf": total_time / audio_duration if audio_duration > 0 else 0.0,
+            "language": cached.get("language"),
+            "cached": True,
+        }
+        reporter.emit("summary", **stats)
+        stats["result"] = cached
+        return stats
+    
+    # 1. 動画から音声をメモリ上に抽出（一時ファイルを経由しない）
+    extract_time = 0.0
+    if audio is None and cache is not None and not low_memory:
+        audio = cache.load_audio(audio_cache_digest(digest, audio_track), SAMPLE_RATE)
+        if audio is not None:
+            log("キャッシュ済みの音声を使用します")
+    if audio is None:
+        # 入力を調べ、音声トラックがなければモデルをロードする前に終了する
+        info = probe_media(video_path)
+        if info is not None:
+            try:
+                stream = select_stream(info, audio_track)
+            except (NoAudioStreamError, ValueError) as e:
+                log(f"エラー: {e}: {video_path}")
+                reporter.emit("error", message=str(e))
+                return None
+            if len(info["audio_streams"]) > 1:
+                log(describe_stream(info["audio_streams"].index(stream), stream))
+            # 進捗の表示用に、抽出の前に入力の長さを通知しておく
+            if info["duration"] is not None:
+                log(f"入力の長さ: {format_duration(info['duration'])}")
+                reporter.progress(0.0, info["duration"])
+        direct = False
+        try:
+            log(f"動画ファイル '{video_path}' から音声を抽出中...")
+            with reporter.stage("extract") as stage:
+                # 省メモリモードでは音声をメモリに載せず一時ファイルに書き出す
+                audio, direct = decode_audio(video_path, info, audio_track, low_memory, scratch_root)
+                stage["audio_seconds"] = len(audio) / SAMPLE_RATE
+                stage["direct"] = direct
+            extract_time = stage["duration"]
+            if direct:
+                log(f"音声抽出完了 ({format_duration(extract_time)}、16kHzモノラルのWAVのためFFmpegでの変換を省略)")
+            else:
+                log(f"音声抽出完了 ({format_duration(extract_time)})")
+        except subprocess.CalledProcessError as e:
+            log(f"音声抽出エラー: {e}")
+            log(f"FFmpeg出力: {e.stderr.decode('utf-8', errors='replace')}")
+            return None
+        except FileNotFoundError:
+            log("エラー: FFmpegが見つかりません。インストールしてパスを通してください。")
+            return None
+        # そのまま読み込めるWAVは、キャッシュから読み込んでも速くならないため保存しない
+        if cache is not None and not low_memory and not direct:
+            cache.store_audio(audio_cache_digest(digest, audio_track), SAMPLE_RATE, audio)
+    
+    if keep_audio:
+        audio_output_path = os.path.splitext(output_path)[0] + ".wav"
+        save_audio_wav(audio, audio_output_path, scratch_root)
+        log(f"抽出した音声を保存: {audio_output_path}")
+    
+    # 処理した音声の長さを取得（抽出したサンプル数から算出）
+    audio_duration = len(audio) / SAMPLE_RATE
+    
+    # 言語の自動判定（小さいモデルで発話の一部から判定し、文字起こしにはその言語を指定する）
+    detect_per_chunk = detect_per_chunk and language == AUTO_LANGUAGE
+    if language == AUTO_LANGUAGE:
+        if len(audio) == 0:
+            language = None
+        else:
+            with reporter.stage("language_detect", model=detect_model) as stage:
+                language, probability = detect_input_language(audio, device, detect_model, cache, digest,
+                                                              audio_track, log)
+                stage["language"] = language
+                stage["probability"] = probability
+    
+    # 発話のない区間を除外し、発話区間だけをつなげた音声を文字起こしする
+    speech_audio = audio
+    map_time = None
+    vad_skipped = 0.0
+    if vad:
+        with reporter.stage("vad", audio_seconds=audio_duration) as stage:
+            spans = detect_speech(audio, vad_threshold, vad_padding, vad_min_silence)
+            if low_memory:
+                speech_audio, time_map = compact_speech_pcm(audio, spans, scratch_root)
+            else:
+                speech_audio, time_map = compact_speech(audio, spans)
+            map_time = time_mapper(time_map)
+            vad_skipped = (len(audio) - len(speech_audio)) / SAMPLE_RATE
+            stage["skipped_seconds"] = vad_skipped
+        skipped_ratio = vad_skipped / audio_duration * 100 if audio_duration > 0 else 0.0
+        log(f"発話区間検出: {len(spans)}区間、{format_duration(vad_skipped)}の非発話区間をスキップ ({skipped_ratio:.1f}%)")
+    speech_seconds = len(speech_audio) / SAMPLE_RATE
     
     # 2. Whisperで文字起こし
+    # 確定したセグメントはチャンクごとに出力ファイルへ追記する（中断しても途中までの字幕が残る）
+    # あわせてチャンクごとの結果をチェックポイントに保存し、中断した位置から再開できるようにする
+    writer = checkpoint = None
     try:
-        print(f"{model_size}モデルをロード中...")
-        model_load_start = time.time()
-        model = whisper.load_model(model_size)
-        if device == "cuda":
-            model = model.cuda()
-        model_load_time = time.time() - model_load_start
-        print(f"モデルロード完了 ({format_duration(model_load_time)})")
-        
-        print(f"文字起こし中... (言語: {language})")
-        transcribe_start = time.time()
-        result = model.transcribe(audio_path, language=language)
-        transcribe_time = time.time() - transcribe_start
-        print(f"文字起こし完了 ({format_duration(transcribe_time)})")
-        
-        # 3. 指定された形式で保存
-        if output_format == "srt":
-            # SRT形式で保存
-            with open(output_path, "w", encoding="utf-8") as f:
-                for i, segment in enumerate(result["segments"]):
-                    start = segment["start"]
-                    end = segment["end"]
-                    text = segment["text"]
-                    f.write(f"{i+1}\n")
-                    f.write(f"{format_time(start)} --> {format_time(end)}\n")
-                    f.write(f"{text.strip()}\n\n")
-            print(f"SRTファイル保存: {output_path}")
-        elif output_format == "txt":
-            # テキスト形式で保存
-            with open(output_path, "w", encoding="utf-8") as f:
-                # 全文を連結して保存
-                full_text = result["text"]
-                f.write(full_text)
-            print(f"テキストファイル保存: {output_path}")
+        writer = MultiFormatWriter(outputs, language)
+        if batch_size > 1:
+            # バッチ推論ではWhisperの窓（30秒）に収まるチャンクに分割する（チャンク長の指定は使わない）
+            chunks = batch_chunks(speech_audio)
+        else:
+            chunks = find_split_points(speech_audio, resolve_chunk_length(chunk_length, parallel_workers),
+                                       search_seconds=resolve_search_seconds(chunk_length, parallel_workers))
+        
+        # 以前に文字起こしした音声と一致する発話区間を探し、独立したチャンクとして切り出して結果を再利用する
+        reused = {}
+        unmatched = []
+        dedup_stats = None
+        if dedup_index is not None and len(speech_audio) > 0:
+            settings = dedup_settings(key_options, language)
+            with reporter.stage("dedup_lookup") as stage:
+                spans = dedup_spans(speech_audio)
+                matches = {}
+                for span in spans:
+                    audio_print = fingerprint(speech_audio[span[0]:span[1]])
+                    match = dedup_index.lookup(audio_print, (span[1] - span[0]) / SAMPLE_RATE, settings)
+                    if match is None:
+                        unmatched.append((span, audio_print))
+                    else:
+                        matches[span] = match
+                if matches:
+                    matched_spans = sorted(matches)
+                    carved = carve_chunks(chunks, matched_spans)
+                    chunks = [(start, end) for start, end, _ in carved]
+                    for index, (start, end, number) in enumerate(carved):
+                        if number is not None:
+                            stored, shift = matches[matched_spans[number]]
+                            reused[index] = reused_result(stored, start, end, matched_spans[number][0], shift)
+                saved_seconds = sum(chunks[index][1] - chunks[index][0] for index in reused) / SAMPLE_RATE
+                dedup_stats = {"dedup_spans": len(spans), "dedup_hits": len(matches), "dedup_saved_seconds": saved_seconds}
+                stage.update(dedup_stats)
+            hit_rate = len(matches) / len(spans) * 100 if spans else 0.0
+            log(f"重複音声の照合: {len(matches)}/{len(spans)}区間が一致（一致率 {hit_rate:.1f}%）、"
+                f"{format_duration(saved_seconds)}の推論を省略")
+        completed = []
+        if len(speech_audio) > 0:
+            checkpoint = ChunkCheckpoint(checkpoint_path(output_path), dict(
+                key_options,
+                input_size=os.path.getsize(video_path) if os.path.exists(video_path) else None,
+                audio=audio_fingerprint(speech_audio),
+                chunks=chunks,
+            ))
+            records = checkpoint.load() if resume else []
+            completed = [record["result"] for record in records]
+            if resume and completed:
+                log(f"チェックポイントから再開します: {len(completed)}/{len(chunks)}チャンク完了済み")
+            elif resume:
+                log("再開できるチェックポイントがないため、最初から文字起こしします")
+            checkpoint.start(records)
+        
+        # 複数の言語が混在する入力向けに、文字起こしが済んでいないチャンクの言語を判定する
+        languages = None
+        if detect_per_chunk and len(completed) < len(chunks):
+            with reporter.stage("language_detect", model=detect_model, chunks=len(chunks) - len(completed)):
+                detector = model_cache.get(detect_model, device)
+                with model_cache.inference_lock(detect_model, device):
+                    languages = chunk_languages(
+                        detector, speech_audio,
+                        [None if index < len(completed) or index in reused else chunk
+                         for index, chunk in enumerate(chunks)],
+                        fp16=(device == "cuda"))
+            counts = Counter(code for code in languages if code is not None)
+            log("チャンクごとの言語: " + ", ".join(f"{code} x{count}" for code, count in counts.most_common()))
+        
+        def write_chunk(start, end, result):
+            segments = shift_segments(result["segments"], start / SAMPLE_RATE)
+            processed_seconds = end / SAMPLE_RATE
+            # 発話区間だけの音声上のタイムスタンプを元の音声の時刻に戻す
+            if map_time is not None:
+                segments = remap_segments(segments, map_time)
+                processed_seconds = map_time(processed_seconds)
+            writer.write(segments)
+            percent = reporter.progress(processed_seconds, audio_duration)
+            log(f"進捗: {percent:.1f}% ({format_duration(processed_seconds)} / {format_duration(audio_duration)})")
+        
+        def check_cancelled():
+            if cancel_event is not None and cancel_event.is_set():
+                raise TranscriptionCancelled()
+        
+        chunk_results = dict(enumerate(completed))
+        
+        def on_chunk(index, start, end, result):
+            chunk_results[index] = result
+            if languages is not None:
+                # チャンクごとに判定した言語をセグメントに記録する（JSONに出力される）
+                for segment in result["segments"]:
+                    segment["language"] = result.get("language")
+            write_chunk(start, end, result)
+            # 書き込みはバッファにまとめ、チャンクの区切りでだけファイルへ書き出す
+            writer.flush()
+            checkpoint.append(index, start, end, result)
+            check_cancelled()
+        
+        # 再開時は保存済みのチャンクの字幕を書き出し直してから続きを処理する
+        for (start, end), result in zip(chunks, completed):
+            write_chunk(start, end, result)
+        writer.flush()
+        check_cancelled()
+        
+        # 再利用するチャンクを除いて文字起こしし、字幕は元のチャンクの順に書き出す
+        pending = [index for index in range(len(chunks)) if index not in reused]
+        pending_chunks = [chunks[index] for index in pending]
+        pending_completed = [completed[index] for index in pending if index < len(completed)]
+        pending_languages = [languages[index] for index in pending] if languages else None
+        next_index = len(completed)
+        
+        def emit_reused(limit):
+            nonlocal next_index
+            while next_index < limit:
+                start, end = chunks[next_index]
+                on_chunk(next_index, start, end, reused[next_index])
+                next_index += 1
+        
+        def on_pending_chunk(position, start, end, result):
+            nonlocal next_index
+            index = pending[position]
+            emit_reused(index)
+            on_chunk(index, start, end, result)
+            next_index = index + 1
+        
+        model_load_time = 0.0
+        transcribe_time = 0.0
+        refined_seconds = []
+        
+        def load_model(size):
+            nonlocal model_load_time
+            with reporter.stage("model_load", model=size, device=device) as stage:
+                stage["cached"] = model_cache.is_loaded(size, device, dtype)
+                if stage["cached"]:
+                    model = model_cache.get(size, device, dtype)
+                    log(f"{size}モデルはロード済みです（キャッシュを使用）")
+                else:
+                    log(f"{size}モデルをロード中...")
+                    model = model_cache.get(size, device, dtype)
+            model_load_time += stage["duration"]
+            log(f"モデルロード完了 ({format_duration(stage['duration'])})")
+            return model
+        
+        if len(speech_audio) == 0:
+            log("発話が検出されなかったため、文字起こしを省略します")
+            result = {"text": "", "segments": [], "language": language}
+        elif not pending:
+            log("すべてのチャンクで以前の文字起こし結果を再利用します")
+            result = {"text": "", "segments": [], "language": language}
+        elif parallel_workers > 1:
+            # チャンクごとにワーカープロセスで並列に文字起こし（モデルは各ワーカーが常駐させる）
+            threads = threads_per_worker or default_threads_per_worker(parallel_workers)
+            log(f"文字起こし中... (言語: {language}, 並列: {parallel_workers}プロセス x {threads}スレッド)")
+            with reporter.stage("transcribe", audio_seconds=speech_seconds, workers=parallel_workers,
+                                threads_per_worker=threads) as stage:
+                with job_scratch(scratch_root) as scratch:
+                    result = transcribe_parallel(
+                        speech_audio, scratch, pending_chunks,
+                        model_size=model_size,
+                        language=language,
+                        dtype=dtype,
+                        workers=parallel_workers,
+                        threads_per_worker=threads,
+                        on_chunk=on_pending_chunk,
+                        completed=pending_completed,
+                        word_timestamps=word_timestamps,
+                        languages=pending_languages
+                    )
+            transcribe_time = stage["duration"]
+        elif draft_model is not None:
+            # 下書き用のモデルで文字起こしし、確信度の低い区間だけを大きいモデルで文字起こしし直す
+            # （大きいモデルは精査する区間が見つかった時点でロードする）
+            model = load_model(draft_model)
+            log(f"文字起こし中... (言語: {language}, 下書き: {draft_model}モデル, 精査: {model_size}モデル)")
+            load_time_before = model_load_time
+            with reporter.stage("transcribe", audio_seconds=speech_seconds, draft_model=draft_model) as stage:
+                with model_cache.inference_lock(draft_model, device, dtype):
+                    result = transcribe_tiered(
+                        model, lambda: load_model(model_size), model_cache.inference_lock(model_size, device, dtype),
+                        speech_audio, pending_chunks,
+                        language=language,
+                        fp16=(device == "cuda"),
+                        on_chunk=on_pending_chunk,
+                        completed=pending_completed,
+                        word_timestamps=word_timestamps,
+                        languages=pending_languages,
+                        on_refine=refined_seconds.append
+                    )
+                stage["refined_seconds"] = sum(refined_seconds)
+            # 文字起こしの途中で行った精査用のモデルのロード時間は含めない
+            transcribe_time = stage["duration"] - (model_load_time - load_time_before)
+        else:
+            model = load_model(model_size)
+            
+            if batch_size > 1:
+                # 30秒以内の窓をまとめて推論する（他のファイルと共有するBatchDecoderがあればそれを使う）
+                log(f"文字起こし中... (言語: {language}, バッチ推論: 最大{batch_size}窓)")
+                decoder = batch_decoder or BatchDecoder(
+                    model, model_cache.inference_lock(model_size, device, dtype), device == "cuda", batch_size)
+                try:
+                    with reporter.stage("transcribe", audio_seconds=speech_seconds, batch_size=batch_size) as stage:
+                        result = transcribe_batched(
+                            decoder, speech_audio, pending_chunks,
+                            language=language,
+                            on_chunk=on_pending_chunk,
+                            completed=pending_completed,
+                            word_timestamps=word_timestamps,
+                            languages=pending_languages
+                        )
+                finally:
+                    if batch_decoder is None:
+                        decoder.close()
+                if batch_decoder is None:
+                    log(decoder.stats_message())
+            else:
+                log(f"文字起こし中... (言語: {language})")
+                with reporter.stage("transcribe", audio_seconds=speech_seconds) as stage:
+                    with model_cache.inference_lock(model_size, device, dtype):
+                        result = transcribe_sequential(
+                            model, speech_audio, pending_chunks,
+                            language=language,
+                            fp16=(device == "cuda"),
+                            on_chunk=on_pending_chunk,
+                            completed=pending_completed,
+                            word_timestamps=word_timestamps,
+                            languages=pending_languages
+                        )
+            transcribe_time = stage["duration"]
+        log(f"文字起こし完了 ({format_duration(transcribe_time)})")
+        
+        # 再利用したチャンクの結果を合わせて、チャンクの順に結果をまとめ直す
+        if reused:
+            emit_reused(len(chunks))
+            result = merge_results(
+                [(start / SAMPLE_RATE, chunk_results[index]) for index, (start, _) in enumerate(chunks)], language
+            )
+        
+        # 大きいモデルで文字起こしし直した音声の割合（再開時は今回文字起こししたチャンクに対する割合）
+        draft_seconds = refined_ratio = None
+        if draft_model is not None and len(speech_audio) > 0:
+            draft_seconds = sum(end - start for start, end in pending_chunks[len(pending_completed):]) / SAMPLE_RATE
+            refined_ratio = sum(refined_seconds) / draft_seconds if draft_seconds > 0 else 0.0
+            log(f"精査: {len(refined_seconds)}区間 {format_duration(sum(refined_seconds))}"
+                f"（下書きした音声の{refined_ratio * 100:.1f}%）を{model_size}モデルで文字起こし")
+        
+        # 一致しなかった発話区間を、文字起こし結果とともに索引へ登録する
+        if unmatched:
+            registered = 0
+            for span, audio_print in unmatched:
+                stored = span_result(result["segments"], span, result.get("language"))
+                if stored is not None:
+                    dedup_index.add(audio_print, (span[1] - span[0]) / SAMPLE_RATE, settings, stored,
+                                    os.path.basename(video_path))
+                    registered += 1
+            log(f"重複音声の索引に{registered}区間を登録しました")
+        
+        if map_time is not None:
+            result["segments"] = remap_segments(result["segments"], map_time)
+        
+        if cache is not None:
+            cache.store_result(result_key, {
+                "text": result["text"],
+                "segments": result["segments"],
+                "language": result.get("language"),
+                "audio_duration": audio_duration,
+            })
+        
+        # 3. 出力ファイルを閉じる（内容はチャンクごとに書き出し済み）
+        with reporter.stage("write"):
+            writer.close()
+        if checkpoint is not None:
+            checkpoint.remove()
+        reporter.progress(audio_duration, audio_duration)
+        for f, path in outputs.items():
+            log(f"{FORMAT_LABELS[f]}保存: {path} ({writer.count}セグメント)")
         
         total_time = time.time() - start_time
-        print(f"合計処理時間: {format_duration(total_time)}")
+        log(f"合計処理時間: {format_duration(total_time)}")
         
-        # 処理した音声の長さを取得
-        audio_duration = result["segments"][-1]["end"] if result["segments"] else 0
+        # 処理時間の内訳（音声抽出は計測した所要時間と合計に占める割合を表示する）
+        extract_share = extract_time / total_time * 100 if total_time > 0 else 0.0
+        log(f"  音声抽出: {format_duration(extract_time)} (合計の{extract_share:.1f}%)")
+        log(f"  モデルロード: {format_duration(model_load_time)}")
+        log(f"  文字起こし: {format_duration(transcribe_time)}")
+        if vad:
+            log(f"  スキップした非発話区間: {format_duration(vad_skipped)}")
+        
+        processing_ratio = total_time / audio_duration if audio_duration > 0 else 0.0
+        throughput = audio_duration / total_time if total_time > 0 else 0.0
         if audio_duration > 0:
-            processing_ratio = total_time / audio_duration
-            print(f"音声長: {format_duration(audio_duration)}")
-            print(f"処理速度比: {processing_ratio:.2f}x (1分の音声を{processing_ratio * 60:.2f}秒で処理)")
+            log(f"音声長: {format_duration(audio_duration)}")
+            log(f"処理速度比: {processing_ratio:.2f}x (1分の音声を{processing_ratio * 60:.2f}秒で処理)")
+            log(f"スループット: {throughput:.2f} 音声秒/秒")
+        log(f"最大メモリ使用量: {peak_rss_bytes() / 1024 ** 2:.0f} MB")
+        
+        stats = {
+            "video_path": video_path,
+            "output_path": output_path,
+            "output_paths": outputs,
+            "audio_duration": audio_duration,
+            "extract_time": extract_time,
+            "model_load_time": model_load_time,
+            "transcribe_time": transcribe_time,
+            "total_time": total_time,
+            "rtf": processing_ratio,
+            "throughput": throughput,
+            "language": result.get("language"),
+            "vad_skipped": vad_skipped,
+            "draft_seconds": draft_seconds,
+            "refined_seconds": sum(refined_seconds),
+            "refined_ratio": refined_ratio,
+            **(dedup_stats or {}),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "cached": False,
+        }
+        reporter.emit("summary", **stats)
+        stats["result"] = result
+        return stats
     
+    except TranscriptionCancelled:
+        log("文字起こしをキャンセルしました")
+        reporter.emit("cancelled")
+        return None
     except Exception as e:
-        print(f"文字起こしエラー: {e}")
+        log(f"文字起こしエラー: {e}")
+        reporter.emit("error", message=str(e))
+        return None
     finally:
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-            print(f"一時ファイル削除: {audio_path}")
+        if writer is not None:
+            writer.close()
+        if checkpoint is not None:
+            checkpoint.close()
+
+def expand_inputs(inputs, recursive=False, log=print):
+    """ファイル・ディレクトリ・globパターンを処理対象のファイル一覧に展開する
+
+    Args:
+        inputs: パスまたはglobパターンのリスト
+        recursive: ディレクトリをサブディレクトリまで探索するかどうか
+        log: 見つからなかった入力の警告の出力先
+
+    Returns:
+        重複を除いたファイルパスのリスト（指定順）
+    """
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                found = []
+                for root, _, names in os.walk(item):
+                    found.extend(os.path.join(root, name) for name in names)
+            else:
+                found = [os.path.join(item, name) for name in os.listdir(item)]
+            files.extend(sorted(p for p in found
+                                if os.path.isfile(p) and os.path.splitext(p)[1].lower() in MEDIA_EXTENSIONS))
+        elif os.path.exists(item):
+            files.append(item)
+        elif glob.has_magic(item):
+            # Windowsのシェルはglobを展開しないためここで展開する
+            files.extend(sorted(p for p in glob.glob(item, recursive=recursive) if os.path.isfile(p)))
+        else:
+            log(f"警告: ファイルが見つかりません: {item}")
+    
+    seen = set()
+    unique = []
+    for path in files:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+def default_output_path(video_path, output_format="srt", output_dir=None):
+    """入力ファイル名から出力ファイルのパスを生成（複数の形式を指定した場合は最初の形式の拡張子）"""
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    # 出力形式に応じた拡張子を設定
+    extension = as_format_list(output_format)[0]
+    return os.path.join(output_dir or "", f"{base_name}.{extension}")
+
+def prefetch_audio(video_path, cache=None, key_options=None, low_memory=False, scratch_root=None, audio_track=None):
+    """音声を抽出し、(音声, 抽出時間) を返す（次のファイルを先読みするワーカースレッド用）
+
+    キャッシュに文字起こし結果があれば抽出を省略して (None, 0.0) を、
+    音声があればキャッシュから読み込んだ音声を返す。
+    low_memoryがTrueの場合は音声を一時ファイルに書き出したPcmFileを返す（抽出音声のキャッシュは使わない）。
+
+    Raises:
+        NoAudioStreamError: 入力に音声トラックがない場合
+        ValueError: 指定した音声トラックがない場合
+    """
+    start = time.time()
+    if cache is not None:
+        digest, result_key = cache_keys(cache, video_path, key_options)
+        if cache.has_result(result_key):
+            return None, 0.0
+        if not low_memory:
+            audio = cache.load_audio(audio_cache_digest(digest, audio_track), SAMPLE_RATE)
+            if audio is not None:
+                return audio, time.time() - start
+    info = probe_media(video_path)
+    if info is not None:
+        select_stream(info, audio_track)
+    audio, direct = decode_audio(video_path, info, audio_track, low_memory, scratch_root)
+    if cache is not None and not low_memory and not direct:
+        cache.store_audio(audio_cache_digest(digest, audio_track), SAMPLE_RATE, audio)
+    return audio, time.time() - start
+
+def generate_subtitles_tracks(video_path, output_path, audio_tracks, reporter=None, **options):
+    """1つのファイルの複数の音声トラックを並行して文字起こしする
+
+    トラックごとの音声抽出・発話区間検出・文字起こしをスレッドで並行して実行し、
+    出力ファイル名にトラック番号を付けて書き出す（動画.track1.srtなど）。
+    モデルはトラック間で共有する。推論はモデルごとのロックで1トラックずつ行われるが、
+    並列処理時は各トラックのチャンクが同じワーカープロセスのプールで並行して処理される。
+
+    Args:
+        video_path: 処理する動画ファイルのパス
+        output_path: 出力ファイルのパス（トラック番号を付ける前のもの）
+        audio_tracks: 音声トラックの番号のリスト
+        reporter: 進捗と計測値の通知先（メッセージにはトラック番号が付く）
+        options: generate_subtitlesに渡すその他の引数
+
+    Returns:
+        トラックごとの統計情報の辞書のリスト（失敗したトラックはNone）
+    """
+    reporter = reporter or ProgressReporter()
+    # バッチ推論時は各トラックの窓を同じバッチにまとめる
+    decoder = shared_batch_decoder(options, reporter.log)
+    try:
+        with ThreadPoolExecutor(max_workers=len(audio_tracks)) as pool:
+            futures = [
+                pool.submit(
+                    generate_subtitles,
+                    video_path=video_path,
+                    output_path=track_output_path(output_path, track),
+                    audio_track=track,
+                    reporter=reporter.child(f"[トラック{track}] ", audio_track=track),
+                    batch_decoder=decoder,
+                    **options
+                )
+                for track in audio_tracks
+            ]
+            return [future.result() for future in futures]
+    finally:
+        if decoder is not None:
+            decoder.close()
+            reporter.log(decoder.stats_message())
+
+def shared_batch_decoder(options, log=print):
+    """複数のファイル・音声トラックで共有するBatchDecoderを作成する（バッチ推論を使わない場合はNone）
+
+    optionsはgenerate_subtitlesに渡す引数の辞書で、デバイスと精度は決定した値に置き換える。
+    """
+    batch_size = options.get("batch_size", 0)
+    if batch_size <= 1 or options.get("parallel_workers", 0) > 1:
+        return None
+    options["device"] = device = resolve_device(options.get("device"), log)
+    options["dtype"] = dtype = resolve_dtype(options.get("dtype"), device, log)
+    model_size = options.setdefault("model_size", "large")
+    model = model_cache.get(model_size, device, dtype)
+    return BatchDecoder(model, model_cache.inference_lock(model_size, device, dtype), device == "cuda", batch_size)
+
+def transcribe_jobs_batched(jobs, decoder, output_format, options):
+    """(ファイル, 音声トラック, 出力先) のジョブを並行して文字起こしし、窓を1つのBatchDecoderでまとめて推論する
+
+    短いファイルが多い場合も複数のファイルの窓が同じバッチに入るよう、最大でバッチサイズと同じ数の
+    ジョブを同時に処理する（音声抽出も並行して行われる）。
+
+    Returns:
+        ジョブごとの統計情報の辞書のリスト（失敗したものはNone）
+    """
+    reporter = options["reporter"]
+    
+    def run(index, job):
+        video_path, track, output_path = job
+        return generate_subtitles(
+            video_path=video_path,
+            output_path=output_path,
+            output_format=output_format,
+            audio_track=track,
+            batch_decoder=decoder,
+            **dict(options, reporter=reporter.child(f"[{index + 1}/{len(jobs)}] "))
+        )
+    
+    with ThreadPoolExecutor(max_workers=min(decoder.batch_size, len(jobs))) as pool:
+        futures = [pool.submit(run, index, job) for index, job in enumerate(jobs)]
+        return [future.result() for future in futures]
+
+def inspect_inputs(video_paths, audio_tracks=None, log=print):
+    """モデルをロードする前に入力を調べ、(処理できるファイルのリスト, ファイルごとの音声トラックの番号のリストの辞書) を返す
+
+    音声トラックがないファイルや、指定した番号の音声トラックがないファイルはエラーを表示して除外する。
+    ffprobeがない場合は調べずにすべてのファイルを処理対象とする。
+
+    Args:
+        video_paths: 入力ファイルのパスのリスト
+        audio_tracks: 音声トラックの番号のリスト、または"all"（Noneは既定のトラック）
+        log: メッセージの出力先
+    """
+    valid = []
+    tracks = {}
+    for video_path in video_paths:
+        info = probe_media(video_path)
+        if info is None:
+            if audio_tracks == "all":
+                log(f"警告: ffprobeで音声トラックを調べられないため、既定の音声トラックのみを処理します: {video_path}")
+            valid.append(video_path)
+            tracks[video_path] = [None] if audio_tracks in (None, "all") else audio_tracks
+            continue
+        count = len(info["audio_streams"])
+        if count == 0:
+            log(f"エラー: 音声トラックがありません: {video_path}")
+            continue
+        if audio_tracks is None:
+            selected = [None]
+        elif audio_tracks == "all":
+            # 音声トラックが1つだけの場合は、既定のトラックと同じ扱い（出力ファイル名も変えない）
+            selected = list(range(count)) if count > 1 else [None]
+        else:
+            missing = [t for t in audio_tracks if t >= count]
+            if missing:
+                log(f"エラー: 音声トラック{', '.join(map(str, missing))}がありません（音声トラック数: {count}）: {video_path}")
+                continue
+            selected = audio_tracks
+        valid.append(video_path)
+        tracks[video_path] = selected
+    return valid, tracks
+
+def generate_subtitles_batch(video_paths, output_dir=None, output_format="srt", extract_workers=2, audio_tracks=None,
+                             **options):
+    """複数の動画をまとめて文字起こしする
+
+    モデルは最初に1回だけロードし、次以降のファイルの音声抽出を
+    FFmpegワーカーのプールで現在の文字起こしと並行して先読みする。
+
+    Args:
+        video_paths: 処理する動画ファイルのパスのリスト
+        output_dir: 出力先ディレクトリ（Noneはカレントディレクトリ）
+        output_format: 出力形式（複数の形式のリストも指定可能）
+        extract_workers: 音声抽出を並行実行するFFmpegワーカー数
+        audio_tracks: 入力ファイルのパスから音声トラックの番号のリストへの辞書（含まれないファイルは既定のトラック）。
+            複数のトラックを指定したファイルは、トラックごとに出力ファイル名にトラック番号を付けて書き出す
+        options: generate_subtitlesに渡すその他の引数
+
+    Returns:
+        ファイル（複数のトラックを指定した場合はトラック）ごとの統計情報の辞書のリスト（失敗したものはNone）
+    """
+    batch_start = time.time()
+    reporter = options.get("reporter") or ProgressReporter()
+    options["reporter"] = reporter
+    log = reporter.log
+    options["device"] = device = resolve_device(options.get("device"), log)
+    model_size = options.setdefault("model_size", "large")
+    options["dtype"] = dtype = resolve_dtype(options.get("dtype"), device, log)
+    parallel = options.get("parallel_workers", 0) > 1 and device == "cpu"
+    if not parallel:
+        options["parallel_workers"] = 0
+    cache = options.get("cache")
+    low_memory = options.get("low_memory", False)
+    scratch_root = options.get("scratch_root")
+    key_options = result_key_options(**dict(
+        options, word_timestamps=resolve_word_timestamps(options.get("word_timestamps"), output_format)))
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    # 処理の単位は (ファイル, 音声トラック)。同じファイルの別のトラックも先読みの対象になる
+    audio_tracks = audio_tracks or {}
+    jobs = []
+    for video_path in video_paths:
+        tracks = audio_tracks.get(video_path, [None])
+        output_path = default_output_path(video_path, output_format, output_dir)
+        for track in tracks:
+            jobs.append((video_path, track, output_path if len(tracks) == 1 else track_output_path(output_path, track)))
+    
+    # モデルを先にロードしておく（以降のファイルはキャッシュを使用）
+    # 並列処理時は各ワーカープロセスがモデルを常駐させる
+    if not parallel:
+        log(f"{model_size}モデルをロード中...")
+        with reporter.stage("model_load", model=model_size, device=device) as stage:
+            model_cache.get(model_size, device, dtype)
+        log(f"モデルロード完了 ({format_duration(stage['duration'])})")
+    
+    # バッチ推論時は複数のファイルを並行して処理し、各ファイルの窓を同じバッチにまとめる
+    decoder = shared_batch_decoder(options, log)
+    if decoder is not None:
+        log(f"{min(decoder.batch_size, len(jobs))}ファイルずつ並行して処理します（バッチ推論: 最大{decoder.batch_size}窓）")
+        try:
+            results = transcribe_jobs_batched(jobs, decoder, output_format, options)
+        finally:
+            decoder.close()
+        log(decoder.stats_message())
+    else:
+        results = []
+        extract_workers = max(1, extract_workers)
+        with ThreadPoolExecutor(max_workers=extract_workers) as pool:
+            def prefetch(job):
+                video_path, track, _ = job
+                job_key_options = key_options if track is None else dict(key_options, audio_track=track)
+                return pool.submit(prefetch_audio, video_path, cache, job_key_options, low_memory, scratch_root, track)
+            
+            # 先読みするファイル数をワーカー数+1に抑え、メモリ上の音声を制限する
+            lookahead = extract_workers + 1
+            futures = {}
+            for index in range(min(lookahead, len(jobs))):
+                futures[index] = prefetch(jobs[index])
+            
+            for index, (video_path, track, output_path) in enumerate(jobs):
+                label = video_path if track is None else f"{video_path} (音声トラック{track})"
+                log(f"\n[{index + 1}/{len(jobs)}] {label}")
+                future = futures.pop(index)
+                next_index = index + lookahead
+                if next_index < len(jobs):
+                    futures[next_index] = prefetch(jobs[next_index])
+                
+                wait_start = time.time()
+                try:
+                    audio, extract_time = future.result()
+                except (NoAudioStreamError, ValueError) as e:
+                    log(f"エラー: {e}: {video_path}")
+                    results.append(None)
+                    continue
+                except subprocess.CalledProcessError as e:
+                    log(f"音声抽出エラー: {e}")
+                    log(f"FFmpeg出力: {e.stderr.decode('utf-8', errors='replace')}")
+                    results.append(None)
+                    continue
+                except FileNotFoundError:
+                    log("エラー: FFmpegが見つかりません。インストールしてパスを通してください。")
+                    results.append(None)
+                    continue
+                wait_time = time.time() - wait_start
+                if audio is not None:
+                    log(f"音声抽出完了 ({format_duration(extract_time)}, 待ち時間 {format_duration(wait_time)})")
+                    # 先読みワーカーで実行した抽出は、ここで段階の終了として通知する
+                    reporter.emit("stage_end", stage="extract", duration=extract_time, ok=True, prefetched=True,
+                                  wait_seconds=wait_time, audio_seconds=len(audio) / SAMPLE_RATE,
+                                  peak_rss_bytes=peak_rss_bytes(), torch_threads=torch_num_threads())
+                
+                stats = generate_subtitles(
+                    video_path=video_path,
+                    output_path=output_path,
+                    output_format=output_format,
+                    audio=audio,
+                    audio_track=track,
+                    **options
+                )
+                if stats is not None:
+                    # 先読みで隠れなかった抽出の待ち時間を処理時間に含める
+                    stats["extract_time"] = extract_time
+                    stats["total_time"] += wait_time
+                    if stats["audio_duration"] > 0:
+                        stats["rtf"] = stats["total_time"] / stats["audio_duration"]
+                results.append(stats)
+                del audio
+        
+    wall_time = time.time() - batch_start
+    reporter.emit("batch_summary", files=len(video_paths), succeeded=sum(r is not None for r in results),
+                  wall_time=wall_time)
+    print_batch_summary([path if track is None else f"{path} (音声トラック{track})" for path, track, _ in jobs],
+                        results, wall_time)
+    return results
+
+def print_batch_summary(video_paths, results, wall_time):
+    """バッチ処理の結果をファイルごと・全体の処理速度比とともに表示"""
+    print("\n===== バッチ処理結果 =====")
+    total_audio = 0.0
+    draft_seconds = refined_seconds = 0.0
+    dedup_spans = dedup_hits = dedup_saved = 0
+    succeeded = 0
+    for video_path, stats in zip(video_paths, results):
+        name = os.path.basename(video_path)
+        if stats is None:
+            print(f"  失敗  {name}")
+            continue
+        succeeded += 1
+        total_audio += stats["audio_duration"]
+        refined = ""
+        if stats.get("refined_ratio") is not None:
+            draft_seconds += stats["draft_seconds"]
+            refined_seconds += stats["refined_seconds"]
+            refined = f", 精査 {stats['refined_ratio'] * 100:.1f}%"
+        if stats.get("dedup_spans") is not None:
+            dedup_spans += stats["dedup_spans"]
+            dedup_hits += stats["dedup_hits"]
+            dedup_saved += stats["dedup_saved_seconds"]
+            refined += f", 重複 {stats['dedup_hits']}/{stats['dedup_spans']}区間"
+        print(f"  成功  {name}: 音声長 {format_duration(stats['audio_duration'])}, "
+              f"処理時間 {format_duration(stats['total_time'])}, 処理速度比 {stats['rtf']:.2f}x{refined}")
+    print(f"成功: {succeeded}/{len(video_paths)} ファイル")
+    print(f"合計音声長: {format_duration(total_audio)}")
+    print(f"合計処理時間: {format_duration(wall_time)}")
+    if total_audio > 0:
+        print(f"全体の処理速度比: {wall_time / total_audio:.2f}x (1分の音声を{wall_time / total_audio * 60:.2f}秒で処理)")
+    if wall_time > 0:
+        print(f"全体のスループット: {total_audio / wall_time:.2f} 音声秒/秒")
+    if draft_seconds > 0:
+        print(f"大きいモデルで精査した音声: {format_duration(refined_seconds)}"
+              f"（下書きした音声の{refined_seconds / draft_seconds * 100:.1f}%）")
+    if dedup_spans > 0:
+        print(f"重複音声の再利用: {dedup_hits}/{dedup_spans}区間が一致（一致率 {dedup_hits / dedup_spans * 100:.1f}%）、"
+              f"{format_duration(dedup_saved)}の推論を省略")
+
+def tune_for_inputs(video_paths, args, device, reporter, audio_tracks=None):
+    """コマンドラインの指定に従って自動調整を行い、(モデルサイズ, 計測に使った音声) を返す
+
+    選んだスレッド数はtorchに設定する。計測には最初のファイルの（最初の音声トラックの）音声を使い、
+    締め切りの指定は全ファイル・全トラックの合計の長さに対する処理速度比に換算する。
+    音声抽出に失敗した場合は (None, None) を返す。
+    audio_tracksはinspect_inputsが返すファイルごとの音声トラックの番号のリストの辞書。
+    """
+    log = reporter.log
+    device = resolve_device(device, log)
+    dtype = resolve_dtype(args.dtype, device, log)
+    audio_tracks = audio_tracks or {}
+    first_tracks = audio_tracks.get(video_paths[0], [None])
+    try:
+        with reporter.stage("extract"):
+            audio, _ = decode_audio(video_paths[0], probe_media(video_paths[0]), first_tracks[0],
+                                    args.low_memory, args.scratch_dir)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        log(f"音声抽出エラー: {e}")
+        return None, None
+    
+    target_rtf = args.target_rtf if args.target_rtf is not None else 1.0
+    if args.deadline is not None:
+        durations = [(probe_duration(p) or 0.0) * len(audio_tracks.get(p, [None])) for p in video_paths[1:]]
+        total_duration = len(audio) / SAMPLE_RATE * len(first_tracks) + sum(durations)
+        if total_duration > 0:
+            target_rtf = args.deadline / total_duration
+        log(f"締め切り {format_duration(args.deadline)}、音声長 {format_duration(total_duration)}")
+    
+    with reporter.stage("auto_tune", target_rtf=target_rtf) as stage:
+        tuned = auto_tune(
+            audio, device,
+            # 言語を自動判定する場合は、計測でもWhisperに判定させる
+            language=None if args.language == AUTO_LANGUAGE else args.language,
+            dtype=dtype,
+            target_rtf=target_rtf,
+            max_model=args.model or "large",
+            calibration_seconds=args.calibration_seconds,
+            recalibrate=args.recalibrate,
+            cache_dir=args.cache_dir,
+            log=log
+        )
+        stage.update(tuned)
+    import torch
+    torch.set_num_threads(tuned["threads"])
+    # 複数ファイル・複数トラックの処理時、計測に使った音声は先読みで改めて抽出する
+    return tuned["model_size"], None if len(video_paths) > 1 or len(first_tracks) > 1 else audio
 
 def main():
     """メイン関数"""
     parser = argparse.ArgumentParser(description="WhisperVox - GPU加速による高速文字起こしツール")
-    parser.add_argument("video", help="処理する動画ファイルのパス")
-    parser.add_argument("-o", "--output", help="出力ファイルのパス", default=None)
-    parser.add_argument("-m", "--model", help="使用するWhisperモデルのサイズ",
-                        choices=["tiny", "base", "small", "medium", "large"], default="large")
-    parser.add_argument("-l", "--language", help="文字起こしの言語", default="ja")
-    parser.add_argument("-f", "--format", help="出力形式", choices=["srt", "txt"], default="srt")
+    parser.add_argument("video", nargs="*",
+                        help="処理する動画ファイルのパス（複数ファイル・ディレクトリ・globパターンも指定可能）")
+    parser.add_argument("-o", "--output", help="出力ファイルのパス（単一ファイル処理時のみ）", default=None)
+    parser.add_argument("--output-dir", help="出力先ディレクトリ（複数ファイル処理時）", default=None)
+    parser.add_argument("-m", "--model", help="使用するWhisperモデルのサイズ（既定: large、--auto-tune時は候補の上限）",
+                        choices=MODEL_SIZES, default=None)
+    parser.add_argument("--draft-model",
+                        help="このサイズのモデルで下書きし、確信度の低い区間だけを -m のモデルで文字起こしし直す",
+                        choices=MODEL_SIZES, default=None)
+    parser.add_argument("-l", "--language", help="文字起こしの言語（autoで自動判定）", default="ja")
+    parser.add_argument("-f", "--format",
+                        help=f"出力形式（カンマ区切りで複数指定すると1回の文字起こしからまとめて書き出す: {', '.join(OUTPUT_FORMATS)}）",
+                        type=parse_formats, default=["srt"])
+    parser.add_argument("--detect-model", help="言語の自動判定（-l auto）に使うモデルのサイズ",
+                        choices=MODEL_SIZES, default=DEFAULT_DETECT_MODEL)
+    parser.add_argument("--detect-per-chunk",
+                        help="言語の自動判定時に、チャンクごとにも言語を判定する（複数の言語が混在する入力用）",
+                        action="store_true")
     parser.add_argument("--cpu", help="CPUを強制的に使用する", action="store_true")
+    parser.add_argument("--dtype", help="モデルの精度（float16はGPUのみ、int8・bfloat16はCPUのみ）",
+                        choices=["float32", "float16", "int8", "bfloat16"], default=None)
+    parser.add_argument("-r", "--recursive", help="ディレクトリをサブディレクトリまで探索する", action="store_true")
+    parser.add_argument("--extract-workers", help="複数ファイル処理時に音声抽出を先読みするFFmpegワーカー数",
+                        type=int, default=2)
+    parser.add_argument("--keep-audio", help="抽出した音声を出力ファイルと同じ場所にWAVとして保存する",
+                        action="store_true")
+    parser.add_argument("--scratch-dir", help="一時作業ディレクトリを作成する場所（tmpfsなど）", default=None)
+    parser.add_argument("--no-cache", help="抽出音声と文字起こし結果のキャッシュを使用しない", action="store_true")
+    parser.add_argument("--purge-cache", help="キャッシュ（重複音声の索引を含む）をすべて削除する", action="store_true")
+    parser.add_argument("--cache-dir", help="キャッシュディレクトリ（既定: ~/.cache/whispervox）", default=None)
+    parser.add_argument("--cache-max-size", help="キャッシュの容量上限（GB）", type=float, default=None)
+    parser.add_argument("--parallel", help="無音部分で分割したチャンクを指定した数のCPUプロセスで並列に文字起こしする",
+                        type=int, default=0, metavar="WORKERS")
+    parser.add_argument("--threads-per-worker", help="並列処理時のワーカー1つあたりのtorchスレッド数",
+                        type=int, default=None)
+    parser.add_argument("--batch-size",
+                        help="2以上の場合、音声を30秒以内の窓に分割し、この数までの窓（複数ファイル処理時は複数のファイルの窓）"
+                             "をまとめて推論する",
+                        type=int, default=0)
+    parser.add_argument("--chunk-length",
+                        help="文字起こしの単位とする目標チャンク長（秒、既定: 並列処理時120、それ以外24、0で分割しない）",
+                        type=float, default=None)
+    parser.add_argument("--vad", help="発話のない区間（無音・音楽など）を除外してから文字起こしする", action="store_true")
+    parser.add_argument("--vad-threshold", help="発話とみなすエネルギーのしきい値（dBFS、既定は背景雑音から自動設定）",
+                        type=float, default=None)
+    parser.add_argument("--vad-padding", help="発話区間の前後に残す余白（秒）",
+                        type=float, default=DEFAULT_VAD_PADDING)
+    parser.add_argument("--vad-min-silence", help="除外する無音の最小の長さ（秒）",
+                        type=float, default=DEFAULT_VAD_MIN_SILENCE)
+    parser.add_argument("--auto-tune",
+                        help="入力の一部で処理速度を計測し、目標を満たす最も精度の高いモデルとスレッド数を自動で選ぶ",
+                        action="store_true")
+    parser.add_argument("--target-rtf", help="自動調整の目標の処理速度比（処理時間 / 音声長、既定: 1.0）",
+                        type=float, default=None)
+    parser.add_argument("--deadline", help="自動調整の目標とする全体の処理時間（秒）。目標の処理速度比は音声長から求める",
+                        type=float, default=None)
+    parser.add_argument("--calibration-seconds", help="自動調整の計測に使う音声の長さ（秒）",
+                        type=float, default=DEFAULT_CALIBRATION_SECONDS)
+    parser.add_argument("--recalibrate", help="保存済みの計測値を使わずに計測し直す", action="store_true")
+    parser.add_argument("--audio-track",
+                        help="文字起こしする音声トラックの番号（音声トラックだけを数えた0始まり、カンマ区切りで複数指定、"
+                             "allですべて）。複数のトラックは並行して処理し、出力ファイル名にトラック番号を付ける",
+                        type=parse_audio_tracks, default=None)
+    parser.add_argument("--low-memory",
+                        help="音声を一時ファイルに置き、必要な範囲だけを読み込んで処理する（長時間の入力でメモリ使用量を一定に抑える）",
+                        action="store_true")
+    parser.add_argument("--dedup",
+                        help="以前に文字起こしした音声と一致する発話区間（番組のオープニングなど）は推論せずに結果を再利用する"
+                             "（索引はキャッシュディレクトリに保存）",
+                        action="store_true")
+    parser.add_argument("--resume", help="中断した文字起こしをチェックポイントから再開する", action="store_true")
+    parser.add_argument("--events-jsonl", help="処理段階ごとの計測値などのイベントをJSON Lines形式で追記するファイル",
+                        default=None)
+    parser.add_argument("--metrics-prom", help="処理段階ごとの所要時間をPrometheusのテキスト形式で書き出すファイル",
+                        default=None)
     
     args = parser.parse_args()
     
-    # 出力ファイル名が指定されていない場合、入力ファイル名から自動生成
-    if args.output is None:
-        base_name = os.path.splitext(os.path.basename(args.video))[0]
-        # 出力形式に応じた拡張子を設定
-        extension = ".srt" if args.format == "srt" else ".txt"
-        args.output = f"{base_name}{extension}"
+    # SIGTERMでもfinallyによる後片付けが実行されるようにする
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    
+    cache = None if args.no_cache else ResultCache(args.cache_dir, args.cache_max_size)
+    model_cache.cache_dir = args.cache_dir
+    if args.purge_cache:
+        purge_target = cache or ResultCache(args.cache_dir)
+        freed = purge_target.purge()
+        index_path = default_index_path(args.cache_dir)
+        if os.path.exists(index_path):
+            freed += os.path.getsize(index_path)
+            os.remove(index_path)
+        print(f"キャッシュを削除しました: {purge_target.cache_dir} ({freed / 1024 ** 2:.1f} MB)")
+        if not args.video:
+            return
+    if not args.video:
+        parser.error("処理する動画ファイルを指定してください")
+    
+    # 進捗と計測値の通知先
+    reporter = ProgressReporter()
+    events_writer = prometheus = None
+    if args.events_jsonl:
+        events_writer = JsonLinesWriter(args.events_jsonl)
+        reporter.add_callback(events_writer)
+    if args.metrics_prom:
+        prometheus = PrometheusExporter()
+        reporter.add_callback(prometheus)
+    
+    video_paths = expand_inputs(args.video, recursive=args.recursive, log=reporter.log)
+    if not video_paths:
+        parser.error("処理対象のファイルが見つかりません")
+    batch_mode = len(video_paths) > 1 or any(os.path.isdir(p) for p in args.video)
+    if batch_mode and args.output is not None:
+        parser.error("複数ファイル処理時は -o ではなく --output-dir を指定してください")
+    if args.auto_tune and args.parallel > 1:
+        parser.error("--auto-tune は --parallel と同時に指定できません")
+    if args.batch_size > 1 and args.parallel > 1:
+        parser.error("--batch-size は --parallel と同時に指定できません")
+    if args.draft_model is not None and (args.parallel > 1 or args.batch_size > 1):
+        parser.error("--draft-model は --parallel・--batch-size と同時に指定できません")
+    if args.detect_per_chunk and args.language != AUTO_LANGUAGE:
+        parser.error("--detect-per-chunk は -l auto と一緒に指定してください")
+    if (args.target_rtf is not None or args.deadline is not None) and not args.auto_tune:
+        parser.error("--target-rtf と --deadline は --auto-tune と一緒に指定してください")
     
     # デバイスの設定
     device = "cpu" if args.cpu else None
     
-    # 字幕生成実行
-    generate_subtitles(
-        video_path=args.video,
-        output_path=args.output,
-        model_size=args.model,
+    # モデルをロードする前に入力を調べ、音声トラックのないファイルを除外する
+    video_paths, audio_tracks = inspect_inputs(video_paths, args.audio_track, reporter.log)
+    if not video_paths:
+        sys.exit(1)
+    
+    # 自動調整（入力の一部で計測してモデルとスレッド数を選ぶ）
+    model_size = args.model or "large"
+    audio = None
+    if args.auto_tune:
+        model_size, audio = tune_for_inputs(video_paths, args, device, reporter, audio_tracks)
+        if model_size is None:
+            return
+    
+    # 各ファイルの文字起こしに共通の設定
+    options = dict(
+        model_size=model_size,
         language=args.language,
         device=device,
-        output_format=args.format
+        dtype=args.dtype,
+        keep_audio=args.keep_audio,
+        scratch_root=args.scratch_dir,
+        cache=cache,
+        parallel_workers=args.parallel,
+        threads_per_worker=args.threads_per_worker,
+        batch_size=args.batch_size,
+        chunk_length=args.chunk_length,
+        vad=args.vad,
+        vad_threshold=args.vad_threshold,
+        vad_padding=args.vad_padding,
+        vad_min_silence=args.vad_min_silence,
+        reporter=reporter,
+        resume=args.resume,
+        low_memory=args.low_memory,
+        detect_model=args.detect_model,
+        detect_per_chunk=args.detect_per_chunk,
+        draft_model=args.draft_model,
+        dedup_index=FingerprintIndex(default_index_path(args.cache_dir), args.cache_max_size) if args.dedup else None
     )
+    
+    try:
+        if batch_mode:
+            generate_subtitles_batch(
+                video_paths,
+                output_dir=args.output_dir,
+                output_format=args.format,
+                extract_workers=args.extract_workers,
+                audio_tracks=audio_tracks,
+                **options
+            )
+        else:
+            # 出力ファイル名が指定されていない場合、入力ファイル名から自動生成
+            if args.output is None:
+                args.output = default_output_path(video_paths[0], args.format, args.output_dir)
+            
+            # 字幕生成実行
+            tracks = audio_tracks[video_paths[0]]
+            if len(tracks) > 1:
+                generate_subtitles_tracks(
+                    video_paths[0],
+                    args.output,
+                    tracks,
+                    output_format=args.format,
+                    **options
+                )
+            else:
+                generate_subtitles(
+                    video_path=video_paths[0],
+                    output_path=args.output,
+                    output_format=args.format,
+                    audio=audio,
+                    audio_track=tracks[0],
+                    **options
+                )
+    finally:
+        # 並列処理のワーカープロセスはそれぞれモデルを常駐させているため、終了前に停止する
+        shutdown_pools()
+        if options["dedup_index"] is not None:
+            options["dedup_index"].close()
+        if events_writer is not None:
+            events_writer.close()
+        if prometheus is not None:
+            prometheus.write(args.metrics_prom)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+WhisperVox 自動調整 - 実行環境で計測した処理速度からモデルサイズとスレッド数を選ぶ
+
+入力音声の一部（数秒）をモデルサイズとtorchスレッド数の組み合わせごとに文字起こしして
+処理速度比（処理時間 / 音声長）を計測し、目標の処理速度比（または締め切り）を満たす
+最も大きい（精度の高い）モデルと、そのモデルで最も速いスレッド数を選ぶ。
+計測値はホストごとにキャッシュディレクトリへ保存し、次回以降は計測を省略する。
+"""
+import json
+import os
+import platform
+import socket
+import time
+
+from whisper_vox_cache import _atomic_write, default_cache_dir
+from whisper_vox_vad import SAMPLE_RATE
+
+# 精度の低い（速い）順のモデルサイズ
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large"]
+
+# 計測に使う音声の長さの既定値（秒）
+DEFAULT_CALIBRATION_SECONDS = 10.0
+
+# 計測値を保存するファイル名（キャッシュディレクトリ内）
+PROFILE_FILE = "autotune.json"
+
+def profile_path(cache_dir=None):
+    """計測値を保存するファイルのパス"""
+    return os.path.join(cache_dir or default_cache_dir(), PROFILE_FILE)
+
+def host_key(device):
+    """計測値を区別するための実行環境のキー（ホスト・CPU・デバイス・ライブラリのバージョン）"""
+    import torch
+    import whisper
+    if device == "cuda":
+        device_name = torch.cuda.get_device_name(0)
+    else:
+        device_name = f"{platform.processor() or platform.machine()} x{os.cpu_count()}"
+    return "|".join([socket.gethostname(), device, device_name, torch.__version__, whisper.__version__])
+
+def candidate_threads(device):
+    """計測するtorchスレッド数（GPUでは現在の値のみ）"""
+    import torch
+    if device == "cuda":
+        return [torch.get_num_threads()]
+    cpu_count = os.cpu_count() or 1
+    counts = {cpu_count}
+    n = 1
+    while n < cpu_count:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+def calibration_sample(audio, seconds=DEFAULT_CALIBRATION_SECONDS):
+    """計測に使う音声（冒頭の無音などを避けるため、中央付近から切り出す）"""
+    length = int(seconds * SAMPLE_RATE)
+    if len(audio) <= length:
+        return audio
+    start = (len(audio) - length) // 2
+    return audio[start:start + length]
+
+def load_profile(path):
+    """保存済みの計測値を読み込む（ホストのキーから計測値の辞書への辞書）"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_profile(path, profile):
+    _atomic_write(path, lambda f: json.dump(profile, f, ensure_ascii=False, indent=2), mode="w")
+
+def measure_rtf(model, sample, language, device, threads):
+    """サンプルを1回文字起こしして処理速度比を返す"""
+    import torch
+    previous = torch.get_num_threads()
+    torch.set_num_threads(threads)
+    try:
+        start = time.perf_counter()
+        # 温度による再試行が起きると計測値がばらつくため、温度0の1回だけで計測する
+        model.transcribe(sample, language=language, fp16=(device == "cuda"), temperature=0.0)
+        return (time.perf_counter() - start) / (len(sample) / SAMPLE_RATE)
+    finally:
+        torch.set_num_threads(previous)
+
+def auto_tune(audio, device, language="ja", dtype=None, target_rtf=1.0, max_model="large",
+              calibration_seconds=DEFAULT_CALIBRATION_SECONDS, recalibrate=False, cache_dir=None, log=print):
+    """目標の処理速度比を満たす最も大きいモデルとスレッド数を選ぶ
+
+    モデルは小さい順に計測し、目標を満たさなくなった時点で打ち切る（大きいモデルほど遅いため）。
+
+    Args:
+        audio: 入力の音声（load_audioの戻り値）。この一部を計測に使う
+        device: 使用するデバイス
+        language: 文字起こしの言語
+        dtype: モデルの精度
+        target_rtf: 目標の処理速度比（処理時間 / 音声長）
+        max_model: 候補とする最も大きいモデル
+        calibration_seconds: 計測に使う音声の長さ（秒）
+        recalibrate: Trueの場合、保存済みの計測値を使わずに計測し直す
+        cache_dir: 計測値を保存するディレクトリ（Noneはキャッシュディレクトリの既定値）
+        log: メッセージの出力先
+
+    Returns:
+        {"model_size", "threads", "rtf", "met_target"} の辞書
+    """
+    from whisper_vox import model_cache
+
+    path = profile_path(cache_dir)
+    profile = load_profile(path)
+    host = host_key(device)
+    measurements = profile.setdefault(host, {})
+    sample = calibration_sample(audio, calibration_seconds)
+    log(f"自動調整: 目標の処理速度比 {target_rtf:.2f}x 以下（計測用の音声 {len(sample) / SAMPLE_RATE:.1f}秒）")
+
+    candidates = MODEL_SIZES[:MODEL_SIZES.index(max_model) + 1]
+    chosen = None
+    fastest = None
+    for model_size in candidates:
+        best = None
+        warmed = False
+        for threads in candidate_threads(device):
+            key = f"{model_size}/{dtype or 'float32'}/{threads}"
+            rtf = None if recalibrate else measurements.get(key)
+            if rtf is None:
+                model = model_cache.get(model_size, device, dtype)
+                with model_cache.inference_lock(model_size, device, dtype):
+                    if not warmed:
+                        # 初回の推論に含まれる初期化の時間を計測値から除くため、先に短い音声で1回実行する
+                        measure_rtf(model, sample[:SAMPLE_RATE], language, device, threads)
+                        warmed = True
+                    rtf = measure_rtf(model, sample, language, device, threads)
+                measurements[key] = rtf
+                save_profile(path, profile)
+                log(f"  {model_size} / {threads}スレッド: 処理速度比 {rtf:.2f}x")
+            else:
+                log(f"  {model_size} / {threads}スレッド: 処理速度比 {rtf:.2f}x（保存済みの計測値）")
+            if best is None or rtf < best["rtf"]:
+                best = {"model_size": model_size, "threads": threads, "rtf": rtf}
+        if fastest is None or best["rtf"] < fastest["rtf"]:
+            fastest = best
+        if best["rtf"] > target_rtf:
+            break
+        chosen = best
+
+    if chosen is None:
+        log(f"警告: 目標の処理速度比を満たす設定がありません。最も速い設定を使用します"
+            f"（{fastest['model_size']} / {fastest['threads']}スレッド、{fastest['rtf']:.2f}x）")
+        return dict(fastest, met_target=False)
+    log(f"自動調整の結果: {chosen['model_size']}モデル / {chosen['threads']}スレッド（処理速度比 {chosen['rtf']:.2f}x）")
+    return dict(chosen, met_target=True)
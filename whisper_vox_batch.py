@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+WhisperVox バッチ推論 - 複数の音声の窓（30秒以内）をまとめてエンコーダー・デコーダーに通す
+
+model.transcribeは30秒の窓を1つずつ推論するため、多コアのCPUやGPUでは計算資源が余る。
+BatchDecoderは複数のスレッド（1つのファイルの複数のチャンクや、並行して処理する複数のファイル）から
+投入された窓を集め、メル スペクトログラムを積み重ねて1回のwhisper.decodeで推論し、結果を投入元へ返す。
+
+窓は無音部分で30秒以内に分割したチャンクで、直前のテキストを文脈に使わず温度0でデコードする。
+平均対数確率や圧縮率がmodel.transcribeの既定のしきい値を満たさない窓は、
+その窓だけmodel.transcribeで推論し直す（温度を上げて再試行される）。
+"""
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+
+from whisper_vox_segments import merge_results
+from whisper_vox_vad import SAMPLE_RATE, find_split_points
+
+# バッチ推論時の目標チャンク長と境界を探す範囲（秒）。合計をWhisperの窓の長さ（30秒）に収める
+BATCH_CHUNK_SECONDS = 24.0
+BATCH_SEARCH_SECONDS = 6.0
+
+# バッチを組むときに、次の窓の投入を待つ最大時間（秒）
+COLLECT_TIMEOUT = 0.05
+
+# model.transcribeの既定値と同じしきい値
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+# タイムスタンプトークン1つあたりの秒数
+TIME_PRECISION = 0.02
+
+def batch_chunks(audio):
+    """バッチ推論用に、音声を無音部分で30秒以内のチャンクに分割する"""
+    return find_split_points(audio, BATCH_CHUNK_SECONDS, search_seconds=BATCH_SEARCH_SECONDS)
+
+def split_segments(tokens, tokenizer, duration, decoded):
+    """タイムスタンプ付きのトークン列をセグメントに分割する（時刻は窓の先頭からの秒）
+
+    model.transcribeと同じく、テキストの後のタイムスタンプをセグメントの終了時刻、
+    次のタイムスタンプを開始時刻とする。窓は発話の途中で切れないよう分割済みのため、
+    最後のタイムスタンプより後のテキストも窓の終わりまでのセグメントとして含める。
+    """
+    begin = tokenizer.timestamp_begin
+    segments = []
+
+    def add(start, end, part):
+        text_tokens = [t for t in part if t < tokenizer.eot]
+        text = tokenizer.decode(text_tokens)
+        if not text.strip():
+            return
+        segments.append({
+            "seek": 0,
+            "start": start,
+            "end": max(start, end),
+            "text": text,
+            "tokens": part,
+            "temperature": decoded.temperature,
+            "avg_logprob": decoded.avg_logprob,
+            "compression_ratio": decoded.compression_ratio,
+            "no_speech_prob": decoded.no_speech_prob,
+        })
+
+    start = 0.0
+    part = []
+    has_text = False
+    for token in tokens:
+        if token >= begin:
+            time = min((token - begin) * TIME_PRECISION, duration)
+            if has_text:
+                add(start, time, part + [token])
+                part = []
+                has_text = False
+            else:
+                part = [token]
+            start = time
+        else:
+            part.append(token)
+            has_text = True
+    if has_text:
+        add(start, duration, part)
+    return segments
+
+class _Request:
+    def __init__(self, audio, language, seed, word_timestamps):
+        self.audio = audio
+        self.language = language
+        self.seed = seed
+        self.word_timestamps = word_timestamps
+        self.future = Future()
+
+class BatchDecoder:
+    """複数のスレッドから投入された音声の窓を、最大batch_size個ずつまとめて推論するクラス
+
+    推論は専用のスレッドで行い、推論中はモデルの推論用ロックを保持する。
+
+    Args:
+        model: Whisperモデル
+        lock: モデルの推論用ロック（ModelCache.inference_lockの戻り値）
+        fp16: 半精度で推論するかどうか
+        batch_size: 1回の推論にまとめる最大の窓数
+    """
+    def __init__(self, model, lock, fp16=False, batch_size=8):
+        self.model = model
+        self.lock = lock
+        self.fp16 = fp16
+        self.batch_size = batch_size
+        self.requests = queue.Queue()
+        # 推論した窓数・バッチ数・model.transcribeで推論し直した窓数
+        self.windows = 0
+        self.batches = 0
+        self.fallbacks = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, audio, language="ja", seed=0, word_timestamps=False):
+        """30秒以内の音声を投入し、model.transcribeと同じ形式の結果を返すFutureを受け取る
+
+        seedは推論し直す場合の乱数のシード（同じ窓は同じ結果になるよう、窓ごとに固定する）
+        """
+        request = _Request(np.asarray(audio, dtype=np.float32), language, seed, word_timestamps)
+        self.requests.put(request)
+        return request.future
+
+    def close(self):
+        """推論スレッドを終了する（投入済みの窓は推論してから終了する）"""
+        self.requests.put(None)
+        self.thread.join()
+
+    def stats_message(self):
+        """推論した窓数などの表示用の文字列"""
+        average = self.windows / self.batches if self.batches else 0.0
+        return (f"バッチ推論: {self.windows}窓を{self.batches}回で推論（平均 {average:.1f}窓/回、"
+                f"再推論 {self.fallbacks}窓）")
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            request = self.requests.get()
+            if request is None:
+                break
+            batch = [request]
+            # 投入が続いている間は、batch_sizeに達するまで窓を集める
+            while len(batch) < self.batch_size:
+                try:
+                    request = self.requests.get(timeout=COLLECT_TIMEOUT)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            # 言語と単語のタイムスタンプの有無が同じ窓ごとに推論する
+            groups = {}
+            for r in batch:
+                groups.setdefault((r.language, r.word_timestamps), []).append(r)
+            for (language, word_timestamps), group in groups.items():
+                try:
+                    results = self._decode(group, language, word_timestamps)
+                except BaseException as e:
+                    for r in group:
+                        r.future.set_exception(e)
+                    continue
+                for r, result in zip(group, results):
+                    r.future.set_result(result)
+
+    def _decode(self, group, language, word_timestamps):
+        import torch
+        import whisper
+        from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+        from whisper.timing import add_word_timestamps
+        from whisper.tokenizer import get_tokenizer
+
+        model = self.model
+        mel = torch.stack([
+            pad_or_trim(log_mel_spectrogram(r.audio, model.dims.n_mels, padding=N_SAMPLES, device=model.device),
+                        N_FRAMES)
+            for r in group
+        ])
+        if self.fp16:
+            mel = mel.half()
+        options = whisper.DecodingOptions(task="transcribe", language=language, temperature=0.0, fp16=self.fp16)
+        results = []
+        with self.lock, torch.no_grad():
+            decoded_list = whisper.decode(model, mel, options)
+            self.windows += len(group)
+            self.batches += 1
+            for r, window_mel, decoded in zip(group, mel, decoded_list):
+                duration = len(r.audio) / SAMPLE_RATE
+                window_language = language or decoded.language
+                if decoded.no_speech_prob > NO_SPEECH_THRESHOLD and decoded.avg_logprob < LOGPROB_THRESHOLD:
+                    # 発話のない窓（model.transcribeと同じ判定）
+                    results.append({"text": "", "segments": [], "language": window_language})
+                    continue
+                if (decoded.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+                        or decoded.avg_logprob < LOGPROB_THRESHOLD):
+                    # 繰り返しや確信度の低い結果は、温度による再試行を含むmodel.transcribeで推論し直す
+                    torch.manual_seed(r.seed)
+                    results.append(model.transcribe(r.audio, language=language, fp16=self.fp16,
+                                                    word_timestamps=word_timestamps))
+                    self.fallbacks += 1
+                    continue
+                tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                          language=window_language, task="transcribe")
+                segments = split_segments(decoded.tokens, tokenizer, duration, decoded)
+                if word_timestamps and segments:
+                    add_word_timestamps(segments=segments, model=model, tokenizer=tokenizer, mel=window_mel,
+                                        num_frames=len(r.audio) // HOP_LENGTH, last_speech_timestamp=0.0)
+                results.append({
+                    "text": "".join(segment["text"] for segment in segments),
+                    "segments": segments,
+                    "language": window_language,
+                })
+        return results
+
+def transcribe_batched(decoder, audio, chunks, language="ja", on_chunk=None, completed=(), word_timestamps=False,
+                       languages=None):
+    """チャンクに分割した音声をBatchDecoderでまとめて文字起こしする
+
+    投入する窓はバッチサイズの2倍までに抑え、音声全体の窓を一度にメモリに載せない。
+
+    Args:
+        decoder: BatchDecoder（他のファイルの文字起こしと共有してよい）
+        audio: float32のモノラル音声（numpy.ndarrayまたはPcmFile）
+        chunks: 30秒以内の (開始サンプル, 終了サンプル) のリスト（batch_chunksの戻り値）
+        language: 文字起こしの言語
+        on_chunk: チャンクの結果が先頭から順に揃うたびに (番号, 開始サンプル, 終了サンプル, 結果) で呼ばれる関数
+        completed: 先頭から順に文字起こし済みのチャンクの結果（チェックポイントからの再開用）
+        word_timestamps: 単語ごとのタイムスタンプを求めるかどうか
+        languages: チャンクごとの言語のリスト（Noneの要素と省略時はlanguageを使う）
+
+    Returns:
+        model.transcribeと同じ形式の辞書（タイムスタンプは元の音声の時刻）
+    """
+    parts = [(start / SAMPLE_RATE, result) for (start, _), result in zip(chunks, completed)]
+    in_flight = max(2, decoder.batch_size * 2)
+    futures = {}
+    next_index = len(completed)
+    try:
+        for index in range(len(completed), len(chunks)):
+            while next_index < len(chunks) and next_index < index + in_flight:
+                start, end = chunks[next_index]
+                chunk_language = (languages[next_index] if languages else None) or language
+                futures[next_index] = decoder.submit(audio[start:end], chunk_language, next_index, word_timestamps)
+                next_index += 1
+            start, end = chunks[index]
+            result = futures.pop(index).result()
+            parts.append((start / SAMPLE_RATE, result))
+            if on_chunk is not None:
+                on_chunk(index, start, end, result)
+    except BaseException:
+        # 中断時はまだ推論していない窓を取り消す
+        for future in futures.values():
+            future.cancel()
+        raise
+    return merge_results(parts, language)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+WhisperVox ベンチマーク - 処理段階ごとの実時間比をモデル・スレッド数ごとに計測する
+
+音声デコード、モデルロード、推論、出力の各段階の時間を個別に計測し、
+JSON/CSVで保存する。モデルの精度（float32、int8、bfloat16など）ごとに、
+float32に対する推論速度とモデルのメモリ使用量の削減率も表示する。
+あわせて、CLIの起動（--help）とモジュールのインポートにかかる時間を新しいプロセスで計測する。
+音声の読み込みは、FFmpegからパイプで受け取る現在の方法と、以前のMP3一時ファイルを経由する方法の時間を比較する。
+前回の結果と比較して性能の劣化を検出できる。
+テスト音声はFFmpegでローカルに生成するため、音声のダウンロードは不要。
+（Whisperモデルは事前にダウンロードされている必要がある）
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import torch
+import whisper
+
+from whisper_vox import (
+    SAMPLE_RATE, format_duration, job_scratch, load_audio, model_cache, resolve_device, resolve_dtype, write_output
+)
+
+# 計測する処理段階
+STAGES = ["decode", "model_load", "inference", "write"]
+
+# このスクリプトと同じ場所にあるWhisperVoxのモジュール
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 起動時間を計測するコマンド（いずれも新しいPythonプロセスで実行する）
+STARTUP_COMMANDS = {
+    "cli_help": [sys.executable, os.path.join(PACKAGE_DIR, "whisper_vox.py"), "--help"],
+    "import_whisper_vox": [sys.executable, "-c", "import whisper_vox"],
+    "import_gui": [sys.executable, "-c", "import whisper_vox_gui"],
+    "import_torch_whisper": [sys.executable, "-c", "import torch, whisper"],
+}
+
+def measure_startup(repeat):
+    """起動時間（秒、中央値）を計測する（実行できなかったコマンドは含めない）"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PACKAGE_DIR, os.environ.get("PYTHONPATH")])))
+    results = {}
+    for name, cmd in STARTUP_COMMANDS.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            completed = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if completed.returncode != 0:
+                # PyQt6が入っていない環境のGUIなど
+                break
+            times.append(time.perf_counter() - start)
+        if times:
+            results[name] = round(statistics.median(times), 4)
+    return results
+
+def generate_test_audio(output_path, duration):
+    """ベンチマーク用の音声ファイルをFFmpegで生成する
+
+    音程と音量が変化するトーンに雑音を重ねたものをAACでエンコードし、
+    実際の動画の音声トラックと同様にデコード処理が発生するようにする。
+    """
+    subprocess.run([
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=220:beep_factor=4:duration={duration}:sample_rate=44100",
+        "-f", "lavfi", "-i", f"anoisesrc=duration={duration}:amplitude=0.02:seed=1:sample_rate=44100",
+        "-filter_complex", "[0][1]amix=inputs=2,volume=2,tremolo=f=0.5:d=0.8",
+        "-ac", "2", "-c:a", "aac", "-b:a", "128k",
+        "-y", output_path
+    ], check=True)
+
+def measure_extraction(audio_path, scratch, repeat):
+    """音声の読み込み方法ごとの所要時間（秒、中央値）を計測する
+
+    pipe: FFmpegからパイプでPCMを受け取る現在の方法（load_audio）
+    mp3_roundtrip: 以前の方法。FFmpegで一時ファイルのMP3へエンコードし、
+                   Whisperがそれをもう一度FFmpegでデコードする
+    """
+    mp3_path = os.path.join(scratch, "bench_roundtrip.mp3")
+    times = {"pipe": [], "mp3_roundtrip": []}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        load_audio(audio_path)
+        times["pipe"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", "-i", audio_path, "-vn", "-acodec", "mp3",
+                        "-y", mp3_path], check=True)
+        whisper.load_audio(mp3_path)
+        times["mp3_roundtrip"].append(time.perf_counter() - start)
+        os.remove(mp3_path)
+    return {name: round(statistics.median(values), 4) for name, values in times.items()}
+
+def model_weight_bytes(model):
+    """モデルの重みが占めるメモリ量（バイト）
+
+    int8に量子化した全結合層の重みはパラメータとして列挙されないため、個別に加算する。
+    """
+    total = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers())
+                if not t.is_sparse)
+    for module in model.modules():
+        if hasattr(module, "_packed_params") and callable(getattr(module, "weight", None)):
+            weight = module.weight()
+            total += weight.numel() * weight.element_size()
+            bias = module.bias()
+            if bias is not None:
+                total += bias.numel() * bias.element_size()
+    return total
+
+def run_once(audio_path, model_size, dtype, device, threads, scratch):
+    """1回分の計測を行い、(段階ごとの時間（秒）, 音声長, モデルの重みのバイト数) を返す"""
+    torch.set_num_threads(threads)
+    timings = {}
+
+    start = time.perf_counter()
+    audio = load_audio(audio_path)
+    timings["decode"] = time.perf_counter() - start
+
+    # モデルロードはキャッシュを使わないコールドスタートの時間を計測する
+    model_cache.evict(model_size, device, dtype)
+    start = time.perf_counter()
+    model = model_cache.get(model_size, device, dtype)
+    timings["model_load"] = time.perf_counter() - start
+
+    # 再現性のため、温度0（フォールバックなし）で推論する
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    result = model.transcribe(audio, language="en", fp16=(device == "cuda"), temperature=0.0)
+    if device == "cuda":
+        torch.cuda.synchronize()
+    timings["inference"] = time.perf_counter() - start
+
+    # 保存メッセージは計測結果の表示の妨げになるため抑制する
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        write_output(result, os.path.join(scratch, "bench.srt"), "srt")
+        write_output(result, os.path.join(scratch, "bench.txt"), "txt")
+        timings["write"] = time.perf_counter() - start
+    return timings, len(audio) / SAMPLE_RATE, model_weight_bytes(model)
+
+def environment_info(device):
+    """計測環境の情報"""
+    info = {
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "whisper": whisper.__version__,
+        "device": device,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    if device == "cuda":
+        info["gpu"] = torch.cuda.get_device_name(0)
+    return info
+
+# これより小さい時間差（秒）は計測誤差とみなし、劣化として扱わない
+MIN_REGRESSION_SECONDS = 0.05
+
+def compare_results(current, baseline, tolerance):
+    """前回の結果と比較し、許容範囲を超えて遅くなった項目のリストを返す"""
+    def key(row):
+        return row["model"], row.get("dtype", "float32"), row["threads"], row["stage"]
+    baseline_rows = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for row in current["results"]:
+        base = baseline_rows.get(key(row))
+        if base is None or base["rtf"] <= 0:
+            continue
+        change = row["rtf"] / base["rtf"] - 1
+        if change > tolerance and row["seconds"] - base["seconds"] >= MIN_REGRESSION_SECONDS:
+            regressions.append((row, base, change))
+    return regressions
+
+def compare_startup(current, baseline, tolerance):
+    """起動時間を前回の結果と比較し、許容範囲を超えて遅くなった項目のリストを返す"""
+    regressions = []
+    for name, seconds in current.get("startup", {}).items():
+        base = baseline.get("startup", {}).get(name)
+        if not base:
+            continue
+        change = seconds / base - 1
+        if change > tolerance and seconds - base >= MIN_REGRESSION_SECONDS:
+            regressions.append((name, base, seconds, change))
+    return regressions
+
+def write_csv(path, rows):
+    """結果をCSVで保存"""
+    fields = ["model", "dtype", "threads", "stage", "seconds", "rtf", "audio_duration", "model_bytes", "repeat"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: row[k] for k in fields})
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="WhisperVox ベンチマーク - 処理段階ごとの実時間比を計測")
+    parser.add_argument("-i", "--input", help="計測に使う音声・動画ファイル（省略時はテスト音声を生成）", default=None)
+    parser.add_argument("--duration", help="生成するテスト音声の長さ（秒）", type=float, default=60.0)
+    parser.add_argument("--models", help="計測するモデルサイズ（カンマ区切り）", default="tiny,base")
+    parser.add_argument("--dtypes", help="計測するモデルの精度（カンマ区切り: float32, float16, int8, bfloat16）",
+                        default="float32,int8")
+    parser.add_argument("--threads", help="計測するtorchスレッド数（カンマ区切り）", default=str(torch.get_num_threads()))
+    parser.add_argument("--repeat", help="各条件の計測回数（中央値を採用）", type=int, default=3)
+    parser.add_argument("--json", help="結果をJSONで保存するパス", default=None)
+    parser.add_argument("--csv", help="結果をCSVで保存するパス", default=None)
+    parser.add_argument("--compare", help="比較する前回の結果（JSON）", default=None)
+    parser.add_argument("--tolerance", help="劣化とみなす実時間比の増加率（0.1 = 10%%）", type=float, default=0.1)
+    parser.add_argument("--cpu", help="CPUを強制的に使用する", action="store_true")
+    parser.add_argument("--startup-only", help="起動時間のみを計測する（モデルによる計測を行わない）",
+                        action="store_true")
+
+    args = parser.parse_args()
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    thread_counts = [int(t) for t in args.threads.split(",") if t.strip()]
+
+    device = resolve_device("cpu" if args.cpu else None)
+    # 使用できない精度はfloat32に置き換わるため、重複を除いて計測する
+    dtypes = list(dict.fromkeys(resolve_dtype(d.strip(), device) for d in args.dtypes.split(",") if d.strip()))
+    configs = [] if args.startup_only else [(m, d, t) for m in models for d in dtypes for t in thread_counts]
+
+    print("起動時間を計測中...")
+    startup = measure_startup(args.repeat)
+    rows = []
+    extraction = {}
+    with job_scratch() as scratch:
+        audio_path = args.input
+        if audio_path is None and configs:
+            audio_path = os.path.join(scratch, "bench_input.m4a")
+            print(f"テスト音声を生成中 ({format_duration(args.duration)})...")
+            generate_test_audio(audio_path, args.duration)
+        if audio_path is not None:
+            print("音声の読み込み方法ごとの時間を計測中...")
+            extraction = measure_extraction(audio_path, scratch, args.repeat)
+
+        for model_size, dtype, threads in configs:
+            runs = []
+            for i in range(args.repeat):
+                timings, audio_duration, model_bytes = run_once(audio_path, model_size, dtype, device, threads, scratch)
+                runs.append(timings)
+                print(f"  {model_size} / {dtype} / {threads}スレッド / {i + 1}回目: "
+                      + ", ".join(f"{stage} {timings[stage]:.3f}秒" for stage in STAGES))
+            for stage in STAGES + ["total"]:
+                if stage == "total":
+                    seconds = statistics.median(sum(run.values()) for run in runs)
+                else:
+                    seconds = statistics.median(run[stage] for run in runs)
+                rows.append({
+                    "model": model_size,
+                    "dtype": dtype,
+                    "threads": threads,
+                    "stage": stage,
+                    "seconds": round(seconds, 4),
+                    "rtf": round(seconds / audio_duration, 5) if audio_duration > 0 else 0.0,
+                    "audio_duration": round(audio_duration, 3),
+                    "model_bytes": model_bytes,
+                    "repeat": args.repeat,
+                })
+            model_cache.evict(model_size, device, dtype)
+
+    report = {"environment": environment_info(device), "startup": startup, "extraction": extraction, "results": rows}
+
+    print("\n===== 起動時間（中央値、新しいプロセスで計測） =====")
+    for name, seconds in startup.items():
+        print(f"{name:<24}{seconds:>10.3f}秒")
+
+    if extraction:
+        saved = extraction["mp3_roundtrip"] - extraction["pipe"]
+        print("\n===== 音声の読み込み（中央値） =====")
+        print(f"{'パイプ（現在）':<24}{extraction['pipe']:>10.3f}秒")
+        print(f"{'MP3一時ファイル経由':<24}{extraction['mp3_roundtrip']:>10.3f}秒")
+        print(f"{'短縮':<24}{saved:>10.3f}秒"
+              + (f" ({saved / extraction['mp3_roundtrip'] * 100:.1f}%)" if extraction["mp3_roundtrip"] > 0 else ""))
+
+    def cells(model_size, dtype, threads):
+        return {r["stage"]: r for r in rows if (r["model"], r["dtype"], r["threads"]) == (model_size, dtype, threads)}
+
+    if configs:
+        print("\n===== ベンチマーク結果（中央値、実時間比 = 処理時間 / 音声長） =====")
+        print(f"{'モデル':<8}{'精度':<10}{'スレッド':>8}  " + "".join(f"{stage:>12}" for stage in STAGES + ["total"]))
+    for model_size, dtype, threads in configs:
+        row = cells(model_size, dtype, threads)
+        print(f"{model_size:<8}{dtype:<10}{threads:>8}  " + "".join(f"{row[stage]['rtf']:>12.4f}" for stage in STAGES + ["total"]))
+
+    # float32に対する推論速度とモデルの重みのメモリ使用量
+    if configs and "float32" in dtypes and len(dtypes) > 1:
+        print("\n===== float32との比較 =====")
+        print(f"{'モデル':<8}{'精度':<10}{'スレッド':>8}  {'推論速度':>10}{'重み(MB)':>12}{'削減率':>10}")
+        for model_size, dtype, threads in configs:
+            row = cells(model_size, dtype, threads)["inference"]
+            base = cells(model_size, "float32", threads)["inference"]
+            speedup = base["seconds"] / row["seconds"] if row["seconds"] > 0 else 0.0
+            saved = 1 - row["model_bytes"] / base["model_bytes"] if base["model_bytes"] > 0 else 0.0
+            print(f"{model_size:<8}{dtype:<10}{threads:>8}  {speedup:>9.2f}x{row['model_bytes'] / 1024 ** 2:>12.1f}"
+                  f"{saved * 100:>9.1f}%")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"JSON保存: {args.json}")
+    if args.csv:
+        write_csv(args.csv, rows)
+        print(f"CSV保存: {args.csv}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        base_env = baseline.get("environment", {})
+        if base_env.get("host") != report["environment"]["host"] or base_env.get("device") != device:
+            print(f"警告: 前回の結果は別の環境（{base_env.get('host')} / {base_env.get('device')}）で計測されています")
+        regressions = compare_results(report, baseline, args.tolerance)
+        startup_regressions = compare_startup(report, baseline, args.tolerance)
+        if regressions or startup_regressions:
+            print(f"\n性能の劣化を検出しました（許容範囲: +{args.tolerance * 100:.0f}%）:")
+            for row, base, change in regressions:
+                print(f"  {row['model']} / {row['dtype']} / {row['threads']}スレッド / {row['stage']}: "
+                      f"{base['rtf']:.4f} -> {row['rtf']:.4f} (+{change * 100:.1f}%)")
+            for name, base, seconds, change in startup_regressions:
+                print(f"  起動時間 / {name}: {base:.3f}秒 -> {seconds:.3f}秒 (+{change * 100:.1f}%)")
+            sys.exit(1)
+        print(f"\n前回の結果からの劣化はありません（許容範囲: +{args.tolerance * 100:.0f}%）")
+
+if __name__ == "__main__":
+    main()
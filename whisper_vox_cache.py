@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+WhisperVox キャッシュ - 抽出した音声と文字起こし結果を入力ファイルのハッシュで保存する
+
+同じ動画を別の出力形式で再実行した場合やクラッシュ後の再実行で、
+音声抽出とWhisperによる推論を省略するために使用する。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# キャッシュの既定の容量上限（GB、環境変数 WHISPERVOX_CACHE_MAX_GB で変更可能）
+DEFAULT_MAX_SIZE_GB = float(os.environ.get("WHISPERVOX_CACHE_MAX_GB", "10"))
+
+# ハッシュ計算時の読み込み単位
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+def default_cache_dir():
+    """キャッシュディレクトリの既定値（環境変数 WHISPERVOX_CACHE_DIR で変更可能）"""
+    if os.environ.get("WHISPERVOX_CACHE_DIR"):
+        return os.environ["WHISPERVOX_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "whispervox")
+
+def _atomic_write(path, write_func, mode="wb"):
+    """一時ファイルに書き込んでから置き換える（同時実行でも壊れたファイルを残さない）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as f:
+            write_func(f)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class ResultCache:
+    """入力ファイルの内容ハッシュをキーにしたオンディスクキャッシュ
+
+    audio/   : 抽出済みPCM（入力ファイルのハッシュのみで決まる）
+    results/ : 文字起こし結果（入力ハッシュ＋モデル・言語・デコード設定で決まる）
+    digests/ : パス・サイズ・更新時刻から入力ハッシュを引くための記録
+
+    合計サイズが上限を超えた場合、最後に使われた時刻が古いものから削除する。
+    """
+    def __init__(self, cache_dir=None, max_size_gb=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        max_size_gb = DEFAULT_MAX_SIZE_GB if max_size_gb is None else max_size_gb
+        self.max_bytes = int(max_size_gb * 1024 ** 3)
+
+    def _path(self, kind, name):
+        return os.path.join(self.cache_dir, kind, name)
+
+    def input_digest(self, file_path):
+        """入力ファイルの内容のSHA-256を返す
+
+        パス・サイズ・更新時刻が前回と同じ場合は記録済みのハッシュを再利用する。
+        """
+        st = os.stat(file_path)
+        stamp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        path_key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+        record_path = self._path("digests", f"{path_key}.json")
+        try:
+            with open(record_path, encoding="utf-8") as f:
+                record = json.load(f)
+            if record.get("stamp") == stamp:
+                return record["digest"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        h = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        _atomic_write(record_path, lambda f: json.dump({"stamp": stamp, "digest": digest}, f), mode="w")
+        return digest
+
+    @staticmethod
+    def result_key(digest, **options):
+        """入力ハッシュと設定から文字起こし結果のキーを生成"""
+        payload = json.dumps({"input": digest, **options}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def load_audio(self, digest, sample_rate):
+        """キャッシュ済みの音声を読み込む（なければNone）"""
+        path = self._path("audio", f"{digest}-{sample_rate}.npy")
+        try:
+            audio = np.load(path)
+        except (OSError, ValueError):
+            return None
+        self._touch(path)
+        return audio
+
+    def store_audio(self, digest, sample_rate, audio):
+        """抽出した音声を保存"""
+        path = self._path("audio", f"{digest}-{sample_rate}.npy")
+        _atomic_write(path, lambda f: np.save(f, audio))
+        self.evict()
+
+    def has_result(self, key):
+        """文字起こし結果がキャッシュされているかどうか"""
+        return os.path.exists(self._path("results", f"{key}.json"))
+
+    def load_result(self, key):
+        """キャッシュ済みの文字起こし結果を読み込む（なければNone）"""
+        path = self._path("results", f"{key}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._touch(path)
+        return result
+
+    def store_result(self, key, result):
+        """文字起こし結果を保存"""
+        path = self._path("results", f"{key}.json")
+        _atomic_write(path, lambda f: json.dump(result, f, ensure_ascii=False), mode="w")
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for kind in ("audio", "results"):
+            directory = os.path.join(self.cache_dir, kind)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """容量上限を超えた分を最後に使われた時刻が古い順に削除する"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def purge(self):
+        """キャッシュ（int8量子化済みモデルのmodels/を含む）をすべて削除し、削除したバイト数を返す"""
+        paths = [path for _, _, path in self._entries()]
+        models_dir = os.path.join(self.cache_dir, "models")
+        if os.path.isdir(models_dir):
+            paths += [os.path.join(models_dir, name) for name in os.listdir(models_dir)]
+        freed = 0
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        return freed
+
+    @staticmethod
+    def _touch(path):
+        # 最後に使われた時刻として更新時刻を使う（atimeは無効化されていることが多い）
+        try:
+            os.utime(path)
+        except OSError:
+            pass
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+WhisperVox チェックポイント - 長時間の文字起こしを中断した位置から再開する
+
+チャンクの文字起こしが終わるたびに、その結果をJSON Lines形式のファイルへ追記する。
+1行目は入力と設定を表すヘッダーで、再開時にはヘッダーが一致する場合だけ保存済みの結果を使う。
+追記のみで書き込むため、チャンク数が多くても1回の保存にかかる時間は一定で、
+書き込み途中で強制終了した場合も壊れた最終行を捨てるだけで再開できる。
+"""
+import hashlib
+import json
+import os
+
+from whisper_vox_pcm import iter_windows
+
+# チェックポイントファイルの形式のバージョン
+CHECKPOINT_VERSION = 1
+
+# 出力ファイルのパスに付け加える拡張子
+CHECKPOINT_SUFFIX = ".checkpoint.jsonl"
+
+def checkpoint_path(output_path):
+    """出力ファイルに対応するチェックポイントファイルのパス"""
+    return output_path + CHECKPOINT_SUFFIX
+
+def audio_fingerprint(audio):
+    """音声データのハッシュ（チェックポイントの入力の照合用）
+
+    audioはnumpy.ndarrayまたはPcmFile。一定量ずつ読み込んでハッシュを計算する。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for window in iter_windows(audio):
+        h.update(memoryview(window))
+    return h.hexdigest()
+
+class ChunkCheckpoint:
+    """チャンクごとの文字起こし結果を追記していくチェックポイントファイル
+
+    Args:
+        path: チェックポイントファイルのパス
+        settings: 入力と設定を表す辞書（JSONに変換できる値のみ）。再開時の照合に使う
+    """
+    def __init__(self, path, settings):
+        self.path = path
+        # JSONを経由した形（タプルはリストになる）で比較する
+        self.settings = json.loads(json.dumps(settings))
+        self.file = None
+
+    def load(self):
+        """保存済みのチャンクの結果を先頭から順に返す
+
+        ファイルがない場合や、入力・設定が一致しない場合は空のリストを返す。
+
+        Returns:
+            {"index", "start", "end", "result"} の辞書のリスト
+        """
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return []
+            if header.get("version") != CHECKPOINT_VERSION or header.get("settings") != self.settings:
+                return []
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で中断した最終行
+                    break
+                if record.get("index") != len(records):
+                    break
+                records.append(record)
+        return records
+
+    def start(self, records=()):
+        """チェックポイントファイルを作り直し、以降の追記に備える
+
+        recordsには再開に使う保存済みの結果を渡す（壊れた最終行などは取り除かれる）。
+        """
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"version": CHECKPOINT_VERSION, "settings": self.settings}, ensure_ascii=False) + "\n")
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def append(self, index, start, end, result):
+        """チャンク1つの文字起こし結果を追記する（ディスクへの書き込みまで待つ）"""
+        record = {
+            "index": index,
+            "start": start,
+            "end": end,
+            "result": {"text": result["text"], "segments": result["segments"], "language": result.get("language")},
+        }
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        """完了後にチェックポイントファイルを削除する"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+WhisperVox 重複音声の再利用 - 以前に文字起こしした音声と同じ区間は推論せずに結果を再利用する
+
+連続番組や定例会議では、同じオープニング・エンディング・広告・ジングルが多くのファイルに含まれる。
+無音で区切られた発話区間ごとに音声の指紋（周波数帯域ごとのエネルギーの変化を1フレーム16ビットで表したもの）
+を求め、以前に文字起こしした区間の指紋の索引（キャッシュディレクトリのSQLiteデータベース）から
+一致する区間を探す。一致した区間は独立したチャンクとして切り出し、索引に保存したセグメントを
+時刻をずらして使う。一致しなかった区間は文字起こし後にセグメントとともに索引へ登録する。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from whisper_vox_cache import DEFAULT_MAX_SIZE_GB, default_cache_dir
+from whisper_vox_segments import shift_segments
+from whisper_vox_vad import SAMPLE_RATE, detect_speech
+
+# 索引のファイル名（キャッシュディレクトリ内）と形式のバージョン
+INDEX_FILE = "fingerprints.sqlite"
+INDEX_VERSION = 2
+
+# 索引の容量上限の、キャッシュの容量上限（--cache-max-size）に対する割合
+INDEX_SIZE_SHARE = 0.05
+
+# 1つの区間の照合で指紋を比べる候補の最大数（最後に使われた区間から順に比べる）
+MAX_CANDIDATES = 200
+
+# 照合の対象とする発話区間の長さ（秒）
+DEDUP_MIN_SECONDS = 3.0
+DEDUP_MAX_SECONDS = 30.0
+
+# 指紋のフレームの窓長と間隔（サンプル）、帯域の範囲（Hz）と数。
+# 区間の境界のずれに強くなるよう、窓を長く間隔を短くしてフレームを大きく重ねる
+FINGERPRINT_WINDOW = 4096
+FINGERPRINT_HOP = 320
+FINGERPRINT_BANDS = 17
+FINGERPRINT_MIN_FREQ = 300.0
+FINGERPRINT_MAX_FREQ = 3000.0
+
+# 一致とみなす指紋のビット誤り率の上限（無関係な音声では約0.5）と、照合時にずらして比べる最大のフレーム数
+MAX_BIT_ERROR_RATE = 0.2
+MAX_SHIFT_FRAMES = 25
+
+# 照合する区間の長さの許容差（秒）。無音の判定の違いで区間の境界は多少ずれる
+DURATION_TOLERANCE = 0.5
+
+# 索引に登録するとき、区間の境界からはみ出してよいセグメントの長さ（秒）
+SEGMENT_TOLERANCE = 0.5
+
+# 一致した区間の間に残る、これより短い断片（無音）は一致した区間のチャンクに含める（秒）
+MIN_PIECE_SECONDS = 1.0
+
+def default_index_path(cache_dir=None):
+    """索引のパス"""
+    return os.path.join(cache_dir or default_cache_dir(), INDEX_FILE)
+
+def fingerprint(audio):
+    """音声の指紋（0.02秒ごとに16ビット）を求める
+
+    隣り合う帯域のエネルギーの差が、前のフレームより増えたかどうかを1ビットとする
+    （音量や多少の音質の違いに影響されにくい）。
+
+    Returns:
+        uint16のnumpy.ndarray
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if len(audio) < FINGERPRINT_WINDOW + FINGERPRINT_HOP:
+        return np.zeros(0, dtype=np.uint16)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, FINGERPRINT_WINDOW)[::FINGERPRINT_HOP]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FINGERPRINT_WINDOW).astype(np.float32), axis=1)) ** 2
+    freqs = np.fft.rfftfreq(FINGERPRINT_WINDOW, 1 / SAMPLE_RATE)
+    edges = np.geomspace(FINGERPRINT_MIN_FREQ, FINGERPRINT_MAX_FREQ, FINGERPRINT_BANDS + 1)
+    bands = np.digitize(freqs, edges) - 1
+    energies = np.stack([spectrum[:, bands == b].sum(axis=1) for b in range(FINGERPRINT_BANDS)], axis=1)
+    diffs = energies[:, :-1] - energies[:, 1:]
+    bits = (diffs[1:] - diffs[:-1]) > 0
+    return np.packbits(bits, axis=1, bitorder="little").view("<u2").ravel()
+
+def compare_fingerprints(a, b, max_shift=MAX_SHIFT_FRAMES):
+    """2つの指紋をずらしながら比べ、最もビット誤り率の低いずれを返す
+
+    Returns:
+        (ビット誤り率, ずれのフレーム数)。ずれがkの場合、aのkフレーム目がbの先頭に対応する。
+        重なりが短い組み合わせしかない場合は (1.0, 0)
+    """
+    best = (1.0, 0)
+    min_overlap = int(min(len(a), len(b)) * 0.8)
+    for shift in range(-max_shift, max_shift + 1):
+        x = a[shift:] if shift >= 0 else a
+        y = b if shift >= 0 else b[-shift:]
+        n = min(len(x), len(y))
+        if n == 0 or n < min_overlap:
+            continue
+        errors = np.unpackbits(np.bitwise_xor(x[:n], y[:n]).view(np.uint8)).mean()
+        if errors < best[0]:
+            best = (float(errors), shift)
+    return best
+
+def dedup_spans(audio):
+    """照合の対象とする発話区間の (開始サンプル, 終了サンプル) のリスト"""
+    return [
+        (start, end) for start, end in detect_speech(audio)
+        if DEDUP_MIN_SECONDS * SAMPLE_RATE <= end - start <= DEDUP_MAX_SECONDS * SAMPLE_RATE
+    ]
+
+def carve_chunks(chunks, spans):
+    """一致した区間がそれぞれ1つのチャンクになるよう、チャンクを分割し直す
+
+    一致した区間の内側にあるチャンクの境界は取り除き、一致した区間の境界で分割する。
+    一致した区間の前後の短い断片（無音）は、その区間のチャンクに含める。
+
+    Args:
+        chunks: (開始サンプル, 終了サンプル) のリスト
+        spans: 一致した区間の (開始サンプル, 終了サンプル) の時刻順のリスト
+
+    Returns:
+        (開始サンプル, 終了サンプル, 一致した区間の番号またはNone) のリスト
+    """
+    bounds = {start for start, _ in chunks} | {chunks[-1][1]}
+    bounds = {b for b in bounds if not any(start < b < end for start, end in spans)}
+    bounds |= {start for start, _ in spans} | {end for _, end in spans}
+    bounds = sorted(bounds)
+    span_numbers = {span: number for number, span in enumerate(spans)}
+    min_piece = int(MIN_PIECE_SECONDS * SAMPLE_RATE)
+    pieces = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        number = span_numbers.get((start, end))
+        if pieces:
+            previous = pieces[-1]
+            if number is None and end - start < min_piece and previous[2] is not None:
+                previous[1] = end
+                continue
+            if number is not None and previous[2] is None and previous[1] - previous[0] < min_piece:
+                previous[1] = end
+                previous[2] = number
+                continue
+        pieces.append([start, end, number])
+    return [tuple(piece) for piece in pieces]
+
+def reused_result(stored, chunk_start, chunk_end, span_start, shift):
+    """索引に保存した区間の結果を、切り出したチャンクの結果（時刻はチャンクの先頭から）に変換する"""
+    offset = (span_start - chunk_start + shift * FINGERPRINT_HOP) / SAMPLE_RATE
+    duration = (chunk_end - chunk_start) / SAMPLE_RATE
+    segments = []
+    for segment in shift_segments(stored["segments"], offset):
+        segment["start"] = min(max(segment["start"], 0.0), duration)
+        segment["end"] = min(max(segment["end"], segment["start"]), duration)
+        segments.append(segment)
+    return {"text": stored["text"], "segments": segments, "language": stored.get("language")}
+
+def span_result(segments, span, language=None):
+    """文字起こし結果から区間内のセグメントを取り出す（時刻は区間の先頭から）
+
+    区間の境界をまたぐセグメントがある場合（区間だけを文字起こしした結果とみなせない場合）や、
+    テキストがない場合はNoneを返す。
+    """
+    start = span[0] / SAMPLE_RATE
+    end = span[1] / SAMPLE_RATE
+    inside = [s for s in segments if s["end"] > start and s["start"] < end]
+    if not inside or not "".join(s["text"] for s in inside).strip():
+        return None
+    if any(s["start"] < start - SEGMENT_TOLERANCE or s["end"] > end + SEGMENT_TOLERANCE for s in inside):
+        return None
+    relative = shift_segments(inside, -start)
+    for segment in relative:
+        segment["start"] = max(segment["start"], 0.0)
+        segment.pop("id", None)
+    return {"text": "".join(s["text"] for s in relative), "segments": relative, "language": language}
+
+class FingerprintIndex:
+    """文字起こし済みの区間の指紋と結果を保存する索引（SQLite）
+
+    複数のスレッド・プロセスから同時に使用できる。文字起こし結果に影響する設定（settings）ごとに区別する。
+    照合の候補は設定のハッシュと区間の長さの区分（DURATION_TOLERANCE刻み）で索引から絞り込み、
+    最後に使われた順に最大MAX_CANDIDATES件だけ指紋を比べる。
+    索引の大きさがキャッシュの容量上限のINDEX_SIZE_SHARE倍を超えると、最後に使われた時刻が古い区間から削除する。
+    """
+    def __init__(self, path=None, max_size_gb=None):
+        self.path = path or default_index_path()
+        max_size_gb = DEFAULT_MAX_SIZE_GB if max_size_gb is None else max_size_gb
+        self.max_bytes = int(max_size_gb * 1024 ** 3 * INDEX_SIZE_SHARE)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                # 以前の形式の索引は作り直す
+                self._conn.execute("DROP TABLE IF EXISTS chunks")
+                self._conn.execute("DROP TABLE IF EXISTS spans")
+                self._conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS spans ("
+                "id INTEGER PRIMARY KEY, settings TEXT NOT NULL, bucket INTEGER NOT NULL, duration REAL NOT NULL, "
+                "fingerprint BLOB NOT NULL, result TEXT NOT NULL, source TEXT, "
+                "hits INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS spans_lookup ON spans (settings, bucket, used)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS spans_used ON spans (used)")
+
+    @staticmethod
+    def settings_key(settings):
+        payload = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def bucket(duration):
+        """区間の長さの区分"""
+        return int(duration // DURATION_TOLERANCE)
+
+    def lookup(self, audio_print, duration, settings):
+        """指紋が一致する区間を探す
+
+        Returns:
+            (保存した結果, ずれのフレーム数)。一致する区間がない場合はNone
+        """
+        # 長さの差がDURATION_TOLERANCE以内の区間は、前後の区分までに含まれる
+        bucket = self.bucket(duration)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, fingerprint, result FROM spans "
+                "WHERE settings = ? AND bucket BETWEEN ? AND ? AND duration BETWEEN ? AND ? "
+                "ORDER BY used DESC LIMIT ?",
+                (self.settings_key(settings), bucket - 1, bucket + 1,
+                 duration - DURATION_TOLERANCE, duration + DURATION_TOLERANCE, MAX_CANDIDATES)
+            ).fetchall()
+        best = None
+        for row_id, blob, result in rows:
+            error_rate, shift = compare_fingerprints(audio_print, np.frombuffer(blob, dtype="<u2"))
+            if error_rate <= MAX_BIT_ERROR_RATE and (best is None or error_rate < best[0]):
+                best = (error_rate, shift, row_id, result)
+        if best is None:
+            return None
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE spans SET hits = hits + 1, used = ? WHERE id = ?", (time.time(), best[2]))
+        return json.loads(best[3]), best[1]
+
+    def add(self, audio_print, duration, settings, result, source=None):
+        """文字起こしした区間を登録し、容量上限を超えた分を削除する"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO spans (settings, bucket, duration, fingerprint, result, source, created, used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.settings_key(settings), self.bucket(duration), duration, audio_print.astype("<u2").tobytes(),
+                 json.dumps(result, ensure_ascii=False), source, now, now)
+            )
+        self.evict()
+
+    def _used_bytes(self):
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def evict(self):
+        """容量上限を超えた分を最後に使われた時刻が古い順に削除し、削除した区間の数を返す
+
+        削除した領域はファイルを縮めずに以降の登録に再利用する。
+        """
+        removed = 0
+        with self._lock:
+            while self._used_bytes() > self.max_bytes:
+                rows = self._conn.execute("SELECT COUNT(*) FROM spans").fetchone()[0]
+                if rows == 0:
+                    break
+                # 超過分に見合う数の区間をまとめて削除する（1回あたり1割以上）
+                excess = 1 - self.max_bytes / self._used_bytes()
+                count = max(1, int(rows * max(excess, 0.1)))
+                with self._conn:
+                    self._conn.execute(
+                        "DELETE FROM spans WHERE id IN (SELECT id FROM spans ORDER BY used LIMIT ?)", (count,))
+                removed += count
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+WhisperVox イベント - 文字起こしの進捗と処理段階ごとの計測値を構造化イベントとして通知する
+
+generate_subtitlesはprintの代わりにProgressReporterへメッセージと計測値を送る。
+受け取り側（GUI、サーバー、監視用のエクスポーターなど）はコールバックとして登録する。
+標準出力を横取りしないため、同時に実行中の複数のジョブの出力が混ざることはない。
+
+イベントは次のキーを持つ辞書:
+    event: "log"、"stage_start"、"stage_end"、"progress"、"summary" など
+    time: 発生時刻（UNIX時刻）
+    その他: イベントごとの値（stage、duration、peak_rss_bytes、torch_threads、audio_seconds など）
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def torch_num_threads():
+    """torchのスレッド数を返す（torchをまだ読み込んでいない場合は読み込まずにNone）"""
+    torch = sys.modules.get("torch")
+    return torch.get_num_threads() if torch is not None else None
+
+def peak_rss_bytes():
+    """プロセス開始からの最大常駐メモリ量（バイト）を返す（取得できない場合はNone）"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # LinuxはKB単位、macOSはバイト単位
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+class ProgressReporter:
+    """進捗メッセージと処理段階の計測値をコールバックへ通知するクラス
+
+    Args:
+        callbacks: イベントの辞書を受け取る関数のリスト
+        echo: Trueの場合、メッセージを従来どおり標準出力にも表示する
+        context: すべてのイベントに付け加える値（ジョブIDなど）
+        prefix: メッセージの先頭に付ける文字列
+    """
+    def __init__(self, callbacks=None, echo=True, context=None, prefix=""):
+        self.callbacks = list(callbacks or [])
+        self.echo = echo
+        self.context = dict(context or {})
+        self.prefix = prefix
+
+    def child(self, prefix="", **context):
+        """コールバックを共有し、メッセージの接頭辞とイベントに付け加える値を追加した通知先を返す
+
+        同じファイルの複数の音声トラックを並行して処理するときなど、メッセージの出所を区別するために使う。
+        """
+        return ProgressReporter(self.callbacks, self.echo, dict(self.context, **context), self.prefix + prefix)
+
+    def add_callback(self, callback):
+        """コールバックを追加する"""
+        self.callbacks.append(callback)
+
+    def emit(self, event, **fields):
+        """イベントを通知する"""
+        record = {"event": event, "time": time.time()}
+        record.update(self.context)
+        record.update(fields)
+        for callback in self.callbacks:
+            callback(record)
+        return record
+
+    def log(self, message):
+        """進捗メッセージを通知する（echo時は標準出力にも表示）"""
+        message = self.prefix + message
+        if self.echo:
+            print(message)
+        self.emit("log", message=message)
+
+    def progress(self, processed_seconds, total_seconds):
+        """音声のうち処理済みの割合を通知する"""
+        percent = min(100.0, processed_seconds / total_seconds * 100) if total_seconds > 0 else 100.0
+        self.emit("progress", processed_seconds=processed_seconds, total_seconds=total_seconds, percent=percent)
+        return percent
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """処理段階の開始と終了を通知するコンテキストマネージャ
+
+        ブロック内で返された辞書に値（audio_secondsなど）を追加すると、
+        終了イベントに含めて通知する。終了後はこの辞書の"duration"に所要時間（秒）が入る。
+        """
+        self.emit("stage_start", stage=name, **fields)
+        extra = dict(fields)
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield extra
+            ok = True
+        finally:
+            extra.update(
+                duration=time.perf_counter() - start,
+                ok=ok,
+                peak_rss_bytes=peak_rss_bytes(),
+                torch_threads=torch_num_threads(),
+            )
+            self.emit("stage_end", stage=name, **extra)
+
+class JsonLinesWriter:
+    """イベントをJSON Lines形式でファイルに追記するコールバック"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class PrometheusExporter:
+    """処理段階ごとの所要時間などを集計し、Prometheusのテキスト形式で出力するコールバック
+
+    node_exporterのtextfileコレクタで読み込めるよう、ファイルへの書き出しは置き換えで行う。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_seconds = {}
+        self.stage_count = {}
+        self.stage_last = {}
+        self.audio_seconds = 0.0
+        self.peak_rss = None
+
+    def __call__(self, record):
+        with self.lock:
+            if record["event"] == "stage_end":
+                stage = record["stage"]
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + record["duration"]
+                self.stage_count[stage] = self.stage_count.get(stage, 0) + 1
+                self.stage_last[stage] = record["duration"]
+                if record.get("peak_rss_bytes") is not None:
+                    self.peak_rss = max(self.peak_rss or 0, record["peak_rss_bytes"])
+            elif record["event"] == "summary":
+                self.audio_seconds += record.get("audio_duration", 0.0)
+
+    def render(self):
+        """Prometheusのテキスト形式のメトリクス"""
+        with self.lock:
+            lines = [
+                "# HELP whispervox_stage_seconds_total Seconds spent in each pipeline stage.",
+                "# TYPE whispervox_stage_seconds_total counter",
+            ]
+            lines += [f'whispervox_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}'
+                      for stage, seconds in sorted(self.stage_seconds.items())]
+            lines += [
+                "# HELP whispervox_stage_runs_total Number of times each pipeline stage ran.",
+                "# TYPE whispervox_stage_runs_total counter",
+            ]
+            lines += [f'whispervox_stage_runs_total{{stage="{stage}"}} {count}'
+                      for stage, count in sorted(self.stage_count.items())]
+            lines += [
+                "# HELP whispervox_stage_last_seconds Duration of the most recent run of each pipeline stage.",
+                "# TYPE whispervox_stage_last_seconds gauge",
+            ]
+            lines += [f'whispervox_stage_last_seconds{{stage="{stage}"}} {seconds:.6f}'
+                      for stage, seconds in sorted(self.stage_last.items())]
+            lines += [
+                "# HELP whispervox_transcribed_audio_seconds_total Seconds of input audio processed.",
+                "# TYPE whispervox_transcribed_audio_seconds_total counter",
+                f"whispervox_transcribed_audio_seconds_total {self.audio_seconds:.3f}",
+            ]
+            if self.peak_rss is not None:
+                lines += [
+                    "# HELP whispervox_peak_rss_bytes Peak resident set size of the process.",
+                    "# TYPE whispervox_peak_rss_bytes gauge",
+                    f"whispervox_peak_rss_bytes {self.peak_rss}",
+                ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """メトリクスをファイルに書き出す"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
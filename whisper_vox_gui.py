@@ -1,87 +1,295 @@
 #!/usr/bin/env python3
 """
 WhisperVox GUI - ドラッグアンドドロップで文字起こしを実行するGUIアプリケーション
+
+複数のファイルをキューに積み、モデルを1回だけロードして順に文字起こしする。
+現在のファイルの文字起こし中に次のファイルの音声を先読みし、
+キューの項目ごとに並べ替え・キャンセルができる。
+ウィンドウの表示後、選択中のモデルをバックグラウンドでロードしておき、
+最初の文字起こしを開始するまでの待ち時間を短くする。
 """
 import sys
 import os
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
     QLabel, QComboBox, QPushButton, QTextEdit, QProgressBar, 
-    QFileDialog, QMessageBox, QGroupBox, QRadioButton
+    QFileDialog, QMessageBox, QGroupBox, QCheckBox, QListWidget, QListWidgetItem, QAbstractItemView
 )
 from PyQt6.QtCore import Qt, QMimeData, pyqtSignal, QObject, QUrl
 from PyQt6.QtGui import QDragEnterEvent, QDropEvent
 
 # whisper_vox.pyから関数をインポート
-from whisper_vox import generate_subtitles, format_duration
+from whisper_vox import (
+    format_duration, generate_subtitles, model_cache, output_paths, prefetch_audio, probe_duration,
+    resolve_device, resolve_word_timestamps, result_key_options
+)
+from whisper_vox_cache import ResultCache
+from whisper_vox_events import ProgressReporter
+
+# 出力形式のチェックボックスの表示名
+FORMAT_CHOICES = {
+    "srt": "SRT",
+    "vtt": "WebVTT",
+    "txt": "テキスト",
+    "tsv": "TSV",
+    "json": "JSON（単語の時刻付き）",
+}
+
+# 処理段階の表示名
+STAGE_LABELS = {
+    "cache_lookup": "キャッシュ確認",
+    "extract": "音声抽出",
+    "language_detect": "言語判定",
+    "vad": "発話区間検出",
+    "dedup_lookup": "重複音声の照合",
+    "model_load": "モデルロード",
+    "transcribe": "文字起こし",
+    "write": "ファイル保存",
+}
+
+class QueueItem:
+    """キューに積まれたファイル1つ分の状態"""
+    def __init__(self, item_id, video_path):
+        self.id = item_id
+        self.video_path = video_path
+        # queued / running / completed / failed / cancelled
+        self.status = "queued"
+        self.cancel_event = threading.Event()
+        self.audio_duration = None
+        self.output_path = None
+
+class TranscriptionQueue:
+    """GUIとワーカースレッドで共有する処理待ちのファイルの列
+
+    並び順はGUIで変更でき、ワーカーは次のファイルを取り出すときの順序に従う。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}
+        self.order = []
+        self._next_id = 0
 
-class WorkerSignals(QObject):
-    """ワーカースレッドからのシグナルを定義するクラス"""
+    def add(self, video_path):
+        with self.lock:
+            item = QueueItem(self._next_id, video_path)
+            self._next_id += 1
+            self.items[item.id] = item
+            self.order.append(item.id)
+            return item
+
+    def remove(self, item_id):
+        with self.lock:
+            self.items.pop(item_id, None)
+            if item_id in self.order:
+                self.order.remove(item_id)
+
+    def set_order(self, item_ids):
+        with self.lock:
+            self.order = [i for i in item_ids if i in self.items]
+
+    def pending(self):
+        """処理待ちのファイルを並び順に返す"""
+        with self.lock:
+            return [self.items[i] for i in self.order if self.items[i].status == "queued"]
+
+    def take_next(self):
+        """先頭の処理待ちのファイルを処理中にして返す（なければNone）"""
+        with self.lock:
+            for i in self.order:
+                item = self.items[i]
+                if item.status == "queued":
+                    item.status = "running"
+                    return item
+        return None
+
+    def cancel(self, item_id):
+        """処理待ちのファイルは取り消し、処理中のファイルにはキャンセルを要求する"""
+        with self.lock:
+            item = self.items.get(item_id)
+            if item is None:
+                return
+            if item.status == "queued":
+                item.status = "cancelled"
+            item.cancel_event.set()
+
+class QueueSignals(QObject):
+    """キューのワーカースレッドからのシグナルを定義するクラス"""
     progress = pyqtSignal(str)
-    finished = pyqtSignal(str)
-    error = pyqtSignal(str)
+    stage = pyqtSignal(str)
+    percent = pyqtSignal(float)
+    # (項目のID, 状態の表示)
+    item_status = pyqtSignal(int, str)
+    # キュー全体の残り時間の見込み（秒、不明な場合は負の値）
+    eta = pyqtSignal(float)
+    finished = pyqtSignal()
+
+class WarmupSignals(QObject):
+    """モデルの事前ロードのスレッドからのシグナルを定義するクラス"""
+    # (モデルサイズ, エラーメッセージ（成功した場合は空文字列）)
+    finished = pyqtSignal(str, str)
+
+class ModelWarmup(threading.Thread):
+    """起動直後にモデルをバックグラウンドでロードしておくスレッド
 
-class TranscriptionWorker(threading.Thread):
-    """バックグラウンドで文字起こしを実行するワーカースレッド"""
-    def __init__(self, video_path, model_size, language, output_format):
+    ロードしたモデルはmodel_cacheに残るため、QueueWorkerは同じモデルをロードし直さずに使う。
+    ロード中に文字起こしを開始した場合も、model_cacheのロックで待ち合わせるため二重にはロードされない。
+    """
+    def __init__(self, model_size):
         super().__init__()
-        self.video_path = video_path
+        self.model_size = model_size
+        self.signals = WarmupSignals()
+        self.daemon = True
+
+    def run(self):
+        try:
+            device = resolve_device(None, lambda message: None)
+            model_cache.get(self.model_size, device)
+        except Exception as e:
+            self.signals.finished.emit(self.model_size, str(e))
+            return
+        self.signals.finished.emit(self.model_size, "")
+
+class QueueWorker(threading.Thread):
+    """キューのファイルを順に文字起こしするワーカースレッド
+
+    モデルは最初に1回だけロードして使い回し、現在のファイルの文字起こし中に
+    次のファイルの音声抽出を先読みする。残り時間は計測した処理速度比から見積もる。
+    """
+    def __init__(self, queue, model_size, language, output_formats):
+        super().__init__()
+        self.queue = queue
         self.model_size = model_size
         self.language = language
-        self.output_format = output_format
-        self.signals = WorkerSignals()
+        self.output_formats = output_formats
+        self.signals = QueueSignals()
         self.daemon = True  # メインスレッドが終了したら一緒に終了
-        
+        self.cache = ResultCache()
+        # 完了したファイルの (処理時間, 音声長) の合計（処理速度比の算出用）
+        self.processed_time = 0.0
+        self.processed_audio = 0.0
+
+    def measured_rtf(self):
+        """完了したファイルの処理速度比（まだない場合はNone）"""
+        if self.processed_audio <= 0:
+            return None
+        return self.processed_time / self.processed_audio
+
+    def remaining_after_current(self, rtf):
+        """現在のファイルより後の処理待ちのファイルの残り時間の見込み（秒）"""
+        return sum(item.audio_duration * rtf for item in self.queue.pending() if item.audio_duration)
+
     def run(self):
-        """文字起こしを実行"""
+        """キューが空になるまで文字起こしを実行"""
         try:
-            # 出力ファイル名を生成
-            base_name = os.path.splitext(os.path.basename(self.video_path))[0]
-            extension = ".srt" if self.output_format == "srt" else ".txt"
-            output_path = f"{base_name}{extension}"
-            
-            # 進捗状況を表示するためのカスタムコールバック
-            def progress_callback(message):
-                self.signals.progress.emit(message)
-            
-            # 文字起こしを実行
-            start_time = time.time()
-            self.signals.progress.emit(f"文字起こしを開始: {self.video_path}")
-            self.signals.progress.emit(f"モデル: {self.model_size}, 言語: {self.language}, 形式: {self.output_format}")
-            
-            # 標準出力をキャプチャするためのリダイレクト
-            import io
-            import contextlib
-            from contextlib import redirect_stdout
-            
-            f = io.StringIO()
-            with redirect_stdout(f):
-                generate_subtitles(
-                    video_path=self.video_path,
-                    output_path=output_path,
-                    model_size=self.model_size,
-                    language=self.language,
-                    device=None,  # 自動検出
-                    output_format=self.output_format
-                )
-            
-            # キャプチャした出力を取得
-            output = f.getvalue()
-            for line in output.split('\n'):
-                if line.strip():
-                    self.signals.progress.emit(line)
-            
-            total_time = time.time() - start_time
-            self.signals.progress.emit(f"文字起こし完了: {output_path}")
-            self.signals.progress.emit(f"合計処理時間: {format_duration(total_time)}")
-            
-            # 完了シグナルを発行
-            self.signals.finished.emit(output_path)
-            
+            device = resolve_device(None, self.signals.progress.emit)
+            self.signals.stage.emit(STAGE_LABELS["model_load"])
+            self.signals.progress.emit(f"{self.model_size}モデルをロード中...")
+            model_cache.get(self.model_size, device)
+            key_options = result_key_options(
+                self.model_size, self.language,
+                word_timestamps=resolve_word_timestamps(None, self.output_formats))
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                prefetched = None
+                while True:
+                    item = self.queue.take_next()
+                    if item is None:
+                        break
+                    audio = None
+                    if prefetched is not None and prefetched[0] == item.id:
+                        try:
+                            audio, _ = prefetched[1].result()
+                        except Exception:
+                            # 抽出に失敗した場合は文字起こしの中で改めて抽出し、エラーを表示する
+                            audio = None
+                    prefetched = None
+                    # 現在のファイルの文字起こし中に、次のファイルの音声を抽出しておく
+                    pending = self.queue.pending()
+                    if pending:
+                        prefetched = (pending[0].id,
+                                      pool.submit(prefetch_audio, pending[0].video_path, self.cache, key_options))
+                    self.transcribe(item, device, audio)
         except Exception as e:
-            self.signals.error.emit(f"エラー: {str(e)}")
+            self.signals.progress.emit(f"エラー: {str(e)}")
+        finally:
+            self.signals.finished.emit()
+
+    def transcribe(self, item, device, audio=None):
+        """キューの項目1つを文字起こしする"""
+        # 残り時間の見積もり用に、処理待ちのファイルの長さを調べておく
+        for pending in self.queue.pending():
+            if pending.audio_duration is None:
+                pending.audio_duration = probe_duration(pending.video_path) or 0.0
+
+        base_name = os.path.splitext(os.path.basename(item.video_path))[0]
+        output_path = f"{base_name}.{self.output_formats[0]}"
+        start_time = time.time()
+
+        # 進捗メッセージと処理段階をイベントとして受け取り、その都度GUIに送る
+        def on_event(record):
+            if record["event"] == "log":
+                self.signals.progress.emit(record["message"])
+            elif record["event"] == "stage_start":
+                self.signals.stage.emit(STAGE_LABELS.get(record["stage"], record["stage"]))
+            elif record["event"] == "progress":
+                percent = record["percent"]
+                total = record["total_seconds"]
+                item.audio_duration = total
+                self.signals.percent.emit(percent)
+                # 処理速度比は現在のファイルの経過時間から求め、まだ進んでいなければ完了済みのファイルの値を使う
+                elapsed = time.time() - start_time
+                rtf = elapsed / record["processed_seconds"] if record["processed_seconds"] > 0 else self.measured_rtf()
+                if rtf is None:
+                    self.signals.item_status.emit(item.id, f"処理中 {percent:.0f}%")
+                    self.signals.eta.emit(-1.0)
+                    return
+                remaining = (total - record["processed_seconds"]) * rtf
+                self.signals.item_status.emit(
+                    item.id, f"処理中 {percent:.0f}%（残り約{format_duration(remaining)}）")
+                self.signals.eta.emit(remaining + self.remaining_after_current(self.measured_rtf() or rtf))
+
+        self.signals.item_status.emit(item.id, "処理中")
+        self.signals.progress.emit(f"文字起こしを開始: {item.video_path}")
+        self.signals.progress.emit(
+            f"モデル: {self.model_size}, 言語: {self.language}, 形式: {', '.join(self.output_formats)}")
+        try:
+            stats = generate_subtitles(
+                video_path=item.video_path,
+                output_path=output_path,
+                model_size=self.model_size,
+                language=self.language,
+                device=device,
+                output_format=self.output_formats,
+                audio=audio,
+                cache=self.cache,
+                reporter=ProgressReporter([on_event], echo=False),
+                cancel_event=item.cancel_event
+            )
+        except Exception as e:
+            self.signals.progress.emit(f"エラー: {str(e)}")
+            stats = None
+
+        if stats is None and item.cancel_event.is_set():
+            item.status = "cancelled"
+            self.signals.item_status.emit(item.id, "キャンセル")
+            return
+        if stats is None:
+            item.status = "failed"
+            self.signals.item_status.emit(item.id, "失敗")
+            return
+
+        total_time = time.time() - start_time
+        if not stats["cached"] and stats["audio_duration"] > 0:
+            self.processed_time += total_time
+            self.processed_audio += stats["audio_duration"]
+        item.status = "completed"
+        item.output_path = output_path
+        for path in output_paths(output_path, self.output_formats).values():
+            self.signals.progress.emit(f"文字起こし完了: {path}")
+        self.signals.progress.emit(f"合計処理時間: {format_duration(total_time)}")
+        self.signals.item_status.emit(item.id, f"完了（処理速度比 {stats['rtf']:.2f}x）")
 
 class DropArea(QWidget):
     """ファイルをドロップできるエリア"""
@@ -118,11 +326,11 @@ class DropArea(QWidget):
         """アイテムがドロップされたときの処理"""
         mime_data = event.mimeData()
         if mime_data.hasUrls():
+            # 有効なファイルはすべてキューに追加する
             for url in mime_data.urls():
                 file_path = url.toLocalFile()
                 if self._is_valid_video_extension(file_path):
-                    self.main_window.set_video_file(file_path)
-                    break
+                    self.main_window.add_video_file(file_path)
             event.acceptProposedAction()
     
     def _is_valid_video_file(self, mime_data: QMimeData) -> bool:
@@ -144,14 +352,15 @@ class WhisperVoxGUI(QMainWindow):
     """WhisperVox GUIのメインウィンドウ"""
     def __init__(self):
         super().__init__()
-        self.init_ui()
-        self.current_video_file = None
+        self.queue = TranscriptionQueue()
         self.worker = None
+        self.warmup = None
+        self.init_ui()
     
     def init_ui(self):
         """UIの初期化"""
         self.setWindowTitle("WhisperVox GUI")
-        self.setMinimumSize(800, 600)
+        self.setMinimumSize(800, 700)
         
         # メインウィジェットとレイアウト
         main_widget = QWidget()
@@ -162,7 +371,7 @@ class WhisperVoxGUI(QMainWindow):
         main_layout.addWidget(self.drop_area)
         
         # 設定グループ
-        settings_group = QGroupBox("設定")
+        self.settings_group = settings_group = QGroupBox("設定")
         settings_layout = QHBoxLayout()
         
         # モデルサイズ
@@ -185,16 +394,17 @@ class WhisperVoxGUI(QMainWindow):
         language_layout.addWidget(self.language_combo)
         settings_layout.addLayout(language_layout)
         
-        # 出力形式
+        # 出力形式（複数選択すると1回の文字起こしからまとめて書き出す）
         format_layout = QVBoxLayout()
         format_label = QLabel("出力形式:")
         self.format_group = QWidget()
         format_group_layout = QHBoxLayout()
-        self.srt_radio = QRadioButton("SRT")
-        self.txt_radio = QRadioButton("テキスト")
-        self.srt_radio.setChecked(True)
-        format_group_layout.addWidget(self.srt_radio)
-        format_group_layout.addWidget(self.txt_radio)
+        self.format_checks = {}
+        for output_format, label in FORMAT_CHOICES.items():
+            check = QCheckBox(label)
+            check.setChecked(output_format == "srt")
+            format_group_layout.addWidget(check)
+            self.format_checks[output_format] = check
         self.format_group.setLayout(format_group_layout)
         format_layout.addWidget(format_label)
         format_layout.addWidget(self.format_group)
@@ -203,10 +413,30 @@ class WhisperVoxGUI(QMainWindow):
         settings_group.setLayout(settings_layout)
         main_layout.addWidget(settings_group)
         
-        # ファイル選択ボタン
-        file_button = QPushButton("ファイルを選択...")
+        # 処理待ちのファイルの一覧（ドラッグで並べ替え可能）
+        queue_group = QGroupBox("キュー")
+        queue_layout = QVBoxLayout()
+        self.queue_list = QListWidget()
+        self.queue_list.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.queue_list.model().rowsMoved.connect(self.sync_queue_order)
+        queue_layout.addWidget(self.queue_list)
+        
+        queue_buttons = QHBoxLayout()
+        file_button = QPushButton("ファイルを追加...")
         file_button.clicked.connect(self.select_file)
-        main_layout.addWidget(file_button)
+        queue_buttons.addWidget(file_button)
+        up_button = QPushButton("上へ")
+        up_button.clicked.connect(lambda: self.move_selected(-1))
+        queue_buttons.addWidget(up_button)
+        down_button = QPushButton("下へ")
+        down_button.clicked.connect(lambda: self.move_selected(1))
+        queue_buttons.addWidget(down_button)
+        cancel_button = QPushButton("キャンセル・削除")
+        cancel_button.clicked.connect(self.cancel_selected)
+        queue_buttons.addWidget(cancel_button)
+        queue_layout.addLayout(queue_buttons)
+        queue_group.setLayout(queue_layout)
+        main_layout.addWidget(queue_group)
         
         # 実行ボタン
         self.run_button = QPushButton("文字起こしを実行")
@@ -218,6 +448,17 @@ class WhisperVoxGUI(QMainWindow):
         progress_group = QGroupBox("進捗状況")
         progress_layout = QVBoxLayout()
         
+        # 現在の処理段階
+        self.stage_label = QLabel("待機中")
+        progress_layout.addWidget(self.stage_label)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(0)
+        progress_layout.addWidget(self.progress_bar)
+        # キュー全体の残り時間の見込み
+        self.eta_label = QLabel("")
+        progress_layout.addWidget(self.eta_label)
+        
         self.progress_text = QTextEdit()
         self.progress_text.setReadOnly(True)
         progress_layout.addWidget(self.progress_text)
@@ -230,43 +471,114 @@ class WhisperVoxGUI(QMainWindow):
         self.setCentralWidget(main_widget)
     
     def select_file(self):
-        """ファイル選択ダイアログを表示"""
-        file_path, _ = QFileDialog.getOpenFileName(
+        """ファイル選択ダイアログを表示（複数選択可能）"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self, "動画ファイルを選択", "", 
             "動画ファイル (*.mp4 *.avi *.mov *.mkv *.wmv *.flv *.webm);;すべてのファイル (*)"
         )
-        if file_path:
-            self.set_video_file(file_path)
+        for file_path in file_paths:
+            self.add_video_file(file_path)
+    
+    def add_video_file(self, file_path):
+        """動画ファイルをキューに追加"""
+        item = self.queue.add(file_path)
+        list_item = QListWidgetItem()
+        list_item.setData(Qt.ItemDataRole.UserRole, item.id)
+        self.queue_list.addItem(list_item)
+        self.on_item_status(item.id, "待機中")
+        self.drop_area.label.setText(f"キュー: {self.queue_list.count()}ファイル（さらにドロップして追加）")
+        # 実行中に追加したファイルは、現在の処理に続けて文字起こしする
+        self.run_button.setEnabled(self.worker is None)
+        self.log_message(f"ファイルをキューに追加しました: {file_path}")
+    
+    def _list_item(self, item_id):
+        for row in range(self.queue_list.count()):
+            list_item = self.queue_list.item(row)
+            if list_item.data(Qt.ItemDataRole.UserRole) == item_id:
+                return list_item
+        return None
     
-    def set_video_file(self, file_path):
-        """動画ファイルをセット"""
-        self.current_video_file = file_path
-        self.drop_area.label.setText(f"選択されたファイル: {os.path.basename(file_path)}")
-        self.run_button.setEnabled(True)
-        self.log_message(f"ファイルが選択されました: {file_path}")
+    def sync_queue_order(self, *args):
+        """一覧の並び順をキューに反映する"""
+        self.queue.set_order([
+            self.queue_list.item(row).data(Qt.ItemDataRole.UserRole) for row in range(self.queue_list.count())
+        ])
+    
+    def move_selected(self, offset):
+        """選択したファイルを上下に移動"""
+        row = self.queue_list.currentRow()
+        target = row + offset
+        if row < 0 or not 0 <= target < self.queue_list.count():
+            return
+        list_item = self.queue_list.takeItem(row)
+        self.queue_list.insertItem(target, list_item)
+        self.queue_list.setCurrentRow(target)
+        self.sync_queue_order()
+    
+    def cancel_selected(self):
+        """選択したファイルをキャンセルする（処理待ち・処理済みのファイルは一覧から削除）"""
+        list_item = self.queue_list.currentItem()
+        if list_item is None:
+            return
+        item_id = list_item.data(Qt.ItemDataRole.UserRole)
+        item = self.queue.items.get(item_id)
+        if item is not None and item.status == "running":
+            # 処理中のファイルは次のチャンクの区切りで中止する
+            self.queue.cancel(item_id)
+            self.on_item_status(item_id, "キャンセル中...")
+            return
+        self.queue.cancel(item_id)
+        self.queue.remove(item_id)
+        self.queue_list.takeItem(self.queue_list.row(list_item))
+        if self.worker is None:
+            self.run_button.setEnabled(bool(self.queue.pending()))
+    
+    def start_warmup(self):
+        """選択中のモデルのバックグラウンドでのロードを開始"""
+        self.warmup = ModelWarmup(self.model_combo.currentText())
+        self.warmup.signals.finished.connect(self.on_warmup_finished)
+        self.stage_label.setText(f"{self.warmup.model_size}モデルを準備中...")
+        self.warmup.start()
+    
+    def on_warmup_finished(self, model_size, error):
+        """モデルの事前ロードが終わったときの処理"""
+        self.warmup = None
+        if error:
+            self.log_message(f"{model_size}モデルの事前ロードに失敗しました: {error}")
+        if self.worker is not None:
+            # 文字起こしの進捗表示を上書きしない
+            return
+        self.stage_label.setText("待機中" if error else f"待機中（{model_size}モデル準備完了）")
     
     def run_transcription(self):
-        """文字起こしを実行"""
-        if not self.current_video_file:
-            QMessageBox.warning(self, "エラー", "動画ファイルが選択されていません。")
+        """キューの文字起こしを実行"""
+        if not self.queue.pending():
+            QMessageBox.warning(self, "エラー", "処理待ちの動画ファイルがありません。")
             return
         
         # 設定を取得
         model_size = self.model_combo.currentText()
         language = self.language_combo.currentText()
-        output_format = "srt" if self.srt_radio.isChecked() else "txt"
+        output_formats = [f for f, check in self.format_checks.items() if check.isChecked()]
+        if not output_formats:
+            QMessageBox.warning(self, "エラー", "出力形式を1つ以上選択してください。")
+            return
         
-        # UIを無効化
+        # UIを無効化（設定はキューの処理が終わるまで変更できない）
         self.run_button.setEnabled(False)
+        self.settings_group.setEnabled(False)
         self.progress_text.clear()
+        # 入力の長さが分かるまでは進捗バーを動かし続ける
+        self.progress_bar.setRange(0, 0)
         
         # ワーカースレッドを作成して実行
-        self.worker = TranscriptionWorker(
-            self.current_video_file, model_size, language, output_format
-        )
+        self.worker = QueueWorker(self.queue, model_size, language, output_formats)
         self.worker.signals.progress.connect(self.log_message)
-        self.worker.signals.finished.connect(self.on_transcription_finished)
-        self.worker.signals.error.connect(self.on_transcription_error)
+        self.worker.signals.stage.connect(self.on_stage_changed)
+        self.worker.signals.percent.connect(self.on_progress)
+        self.worker.signals.item_status.connect(self.on_item_status)
+        self.worker.signals.eta.connect(self.on_eta)
+        self.worker.signals.finished.connect(self.on_queue_finished)
         self.worker.start()
     
     def log_message(self, message):
@@ -277,20 +589,61 @@ class WhisperVoxGUI(QMainWindow):
             self.progress_text.verticalScrollBar().maximum()
         )
     
-    def on_transcription_finished(self, output_path):
-        """文字起こしが完了したときの処理"""
-        self.run_button.setEnabled(True)
+    def on_stage_changed(self, stage_name):
+        """処理段階が変わったときの処理"""
+        self.stage_label.setText(f"処理中: {stage_name}")
+    
+    def on_progress(self, percent):
+        """処理済みの割合（音声の長さに対する%）を進捗バーに表示"""
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setValue(int(percent * 10))
+        self.progress_bar.setFormat(f"{percent:.1f}%")
+    
+    def on_item_status(self, item_id, status):
+        """キューの項目の状態表示を更新"""
+        list_item = self._list_item(item_id)
+        item = self.queue.items.get(item_id)
+        if list_item is None or item is None:
+            return
+        list_item.setText(f"{os.path.basename(item.video_path)} - {status}")
+    
+    def on_eta(self, seconds):
+        """キュー全体の残り時間の見込みを表示"""
+        self.eta_label.setText(f"全体の残り時間: 約{format_duration(seconds)}" if seconds >= 0 else "")
+    
+    def _reset_progress(self, status):
+        """進捗表示を停止状態に戻す"""
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(1 if status == "完了" else 0)
+        self.progress_bar.setFormat("%p%")
+        self.stage_label.setText(status)
+        self.eta_label.setText("")
+    
+    def on_queue_finished(self):
+        """キューの処理がすべて終わったときの処理"""
+        self.worker = None
+        self.settings_group.setEnabled(True)
+        self.run_button.setEnabled(bool(self.queue.pending()))
+        
+        items = list(self.queue.items.values())
+        completed = [item for item in items if item.status == "completed"]
+        failed = [item for item in items if item.status == "failed"]
+        cancelled = [item for item in items if item.status == "cancelled"]
+        self._reset_progress("完了" if completed and not failed else "エラー" if failed else "待機中")
         
         # 完了メッセージを表示
         QMessageBox.information(
             self, "完了", 
-            f"文字起こしが完了しました。\n出力ファイル: {output_path}"
+            f"文字起こしが完了しました。\n成功: {len(completed)}、失敗: {len(failed)}、キャンセル: {len(cancelled)}"
         )
+        if len(completed) != 1:
+            return
+        output_path = completed[0].output_path
         
         # 出力ファイルを開くかどうか確認
         reply = QMessageBox.question(
             self, "ファイルを開く", 
-            "出力ファイルを開きますか？",
+            f"出力ファイルを開きますか？\n{output_path}",
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
             QMessageBox.StandardButton.Yes
         )
@@ -303,18 +656,13 @@ class WhisperVoxGUI(QMainWindow):
                 os.system(f'open "{output_path}"')
             else:  # Linux
                 os.system(f'xdg-open "{output_path}"')
-    
-    def on_transcription_error(self, error_message):
-        """文字起こし中にエラーが発生したときの処理"""
-        self.run_button.setEnabled(True)
-        self.log_message(f"エラーが発生しました: {error_message}")
-        QMessageBox.critical(self, "エラー", f"文字起こし中にエラーが発生しました:\n{error_message}")
 
 def main():
     """メイン関数"""
     app = QApplication(sys.argv)
     window = WhisperVoxGUI()
     window.show()
+    window.start_warmup()
     sys.exit(app.exec())
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+WhisperVox 言語の自動判定 - 小さいモデルで発話の一部から言語を判定する
+
+言語に"auto"を指定した場合、Whisperは文字起こしに使う大きいモデルで窓ごとに言語を判定するが、
+判定に必要なのは音声の一部だけで、モデルも小さいもので十分な精度が出る。
+ここでは発話区間から短いサンプルを数か所切り出し、小さいモデル（既定はtiny）でまとめて判定して
+確率を平均した言語を、ファイル全体の文字起こしに使う。
+
+複数の言語が混在するファイル向けに、チャンクごとに言語を判定する関数も用意する。
+"""
+import numpy as np
+
+from whisper_vox_vad import SAMPLE_RATE
+
+# 言語を自動判定する場合に指定する値
+AUTO_LANGUAGE = "auto"
+
+# 判定に使うモデルの既定値
+DEFAULT_DETECT_MODEL = "tiny"
+
+# 判定に使うサンプルの数と長さ（秒）
+DETECT_SAMPLES = 3
+DETECT_SAMPLE_SECONDS = 10.0
+
+# チャンクごとの判定で、1回の推論にまとめるサンプル数
+DETECT_BATCH_SIZE = 8
+
+def language_samples(audio, spans, count=DETECT_SAMPLES, seconds=DETECT_SAMPLE_SECONDS):
+    """発話区間から判定に使うサンプルを切り出す
+
+    発話区間だけをつなげた音声を考え、その全体から等間隔に指定の長さのサンプルを選ぶ
+    （発話の合計が短い場合は、サンプルの数を減らして発話全体を重ならないように分ける）。
+
+    Args:
+        audio: float32のモノラル音声（numpy.ndarrayまたはPcmFile）
+        spans: 発話区間の (開始サンプル, 終了サンプル) のリスト（detect_speechの戻り値）
+        count: サンプルの数
+        seconds: サンプル1つの長さ（秒）
+
+    Returns:
+        float32のnumpy.ndarrayのリスト
+    """
+    length = int(seconds * SAMPLE_RATE)
+    if not spans:
+        # 発話区間が見つからない場合は音声全体を1つの区間とみなす
+        spans = [(0, len(audio))]
+    total = sum(end - start for start, end in spans)
+    if total <= length * count:
+        count = max(1, min(count, total // length))
+        length = total // count
+    samples = []
+    for i in range(count):
+        # 発話だけをつなげた音声上の位置から、元の音声の範囲を求めて切り出す
+        offset = (total - length) * i // max(1, count - 1) if count > 1 else (total - length) // 2
+        pieces = []
+        remaining = length
+        for start, end in spans:
+            if offset >= end - start:
+                offset -= end - start
+                continue
+            start += offset
+            offset = 0
+            end = min(end, start + remaining)
+            pieces.append(np.asarray(audio[start:end], dtype=np.float32))
+            remaining -= end - start
+            if remaining <= 0:
+                break
+        samples.append(np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32))
+    return samples
+
+def detect_probabilities(model, samples, fp16=False):
+    """サンプルごとの言語の確率を求める（すべてのサンプルを1回の推論にまとめる）
+
+    Returns:
+        {言語コード: 確率} の辞書のリスト
+    """
+    import torch
+    from whisper.audio import N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+
+    mel = torch.stack([
+        pad_or_trim(log_mel_spectrogram(sample, model.dims.n_mels, padding=N_SAMPLES, device=model.device), N_FRAMES)
+        for sample in samples
+    ])
+    if fp16:
+        mel = mel.half()
+    with torch.no_grad():
+        _, probabilities = model.detect_language(mel)
+    return probabilities
+
+def identify_language(model, samples, fp16=False):
+    """サンプルの言語の確率を平均し、最も確率の高い言語を返す
+
+    Returns:
+        (言語コード, 確率, 確率の高い順の上位5件の [言語コード, 確率] のリスト)
+    """
+    totals = {}
+    for probabilities in detect_probabilities(model, samples, fp16):
+        for language, probability in probabilities.items():
+            totals[language] = totals.get(language, 0.0) + probability / len(samples)
+    ranking = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    language, probability = ranking[0]
+    return language, probability, [[code, round(p, 4)] for code, p in ranking[:5]]
+
+def chunk_languages(model, audio, chunks, fp16=False, seconds=DETECT_SAMPLE_SECONDS,
+                    batch_size=DETECT_BATCH_SIZE):
+    """チャンクごとに言語を判定する（チャンクの発話の中央付近をサンプルとして判定する）
+
+    Args:
+        model: 判定に使うWhisperモデル
+        audio: float32のモノラル音声（numpy.ndarrayまたはPcmFile）
+        chunks: (開始サンプル, 終了サンプル) のリスト。Noneの要素は判定を省略する
+        fp16: 半精度で推論するかどうか
+        seconds: チャンクごとのサンプルの長さ（秒）
+        batch_size: 1回の推論にまとめるサンプル数
+
+    Returns:
+        チャンクごとの言語コードのリスト（省略したチャンクはNone）
+    """
+    from whisper_vox_vad import detect_speech
+
+    languages = [None] * len(chunks)
+    targets = [(index, chunk) for index, chunk in enumerate(chunks) if chunk is not None]
+    for i in range(0, len(targets), batch_size):
+        batch = targets[i:i + batch_size]
+        samples = []
+        for _, (start, end) in batch:
+            chunk_audio = np.asarray(audio[start:end], dtype=np.float32)
+            samples.extend(language_samples(chunk_audio, detect_speech(chunk_audio), 1, seconds))
+        for (index, _), probabilities in zip(batch, detect_probabilities(model, samples, fp16)):
+            languages[index] = max(probabilities, key=probabilities.get)
+    return languages
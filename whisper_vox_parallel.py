@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+WhisperVox 並列処理 - 長時間の音声を無音部分で分割し、複数プロセスで並列に文字起こしする
+
+CPUのみの環境で1プロセスの逐次デコードではコアが余るため、
+チャンクごとにプロセスプールへ割り当ててコア数に応じて処理速度を伸ばす。
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from whisper_vox_pcm import iter_windows
+from whisper_vox_segments import merge_results
+from whisper_vox_vad import SAMPLE_RATE
+
+# 並列処理時のチャンク長の既定値（秒）
+DEFAULT_CHUNK_LENGTH = 120.0
+
+# ワーカープロセス内で使用するモデル
+_worker_model = None
+
+def _init_worker(model_size, dtype, threads, cache_dir=None):
+    """ワーカープロセスの初期化（モデルを1回だけロードして常駐させる）"""
+    global _worker_model
+    import torch
+    from whisper_vox import model_cache
+    torch.set_num_threads(threads)
+    # spawnしたプロセスには親プロセスの設定が引き継がれないため、量子化済みモデルの保存先を渡す
+    model_cache.cache_dir = cache_dir
+    _worker_model = model_cache.get(model_size, "cpu", dtype)
+
+def _transcribe_chunk(audio_path, index, start, end, language, word_timestamps=False):
+    """チャンク1つを文字起こしする（ワーカープロセス内で実行）"""
+    import torch
+    audio = np.load(audio_path, mmap_mode="r")
+    chunk = np.array(audio[start:end], dtype=np.float32)
+    # 途中から再開しても同じ結果になるよう、乱数のシードをチャンクごとに固定する
+    torch.manual_seed(index)
+    result = _worker_model.transcribe(chunk, language=language, fp16=False, word_timestamps=word_timestamps)
+    return {"text": result["text"], "segments": result["segments"], "language": result.get("language")}
+
+def default_threads_per_worker(workers):
+    """ワーカー1つあたりのtorchスレッド数の既定値（論理コア数を均等に分配）"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+# 設定ごとに作成済みのプロセスプール（複数ファイルの処理でモデルを再ロードしないよう使い回す）
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(model_size, dtype, workers, threads_per_worker=None):
+    """モデルをロード済みのワーカープロセスのプールを取得する"""
+    from whisper_vox import model_cache
+    threads = threads_per_worker or default_threads_per_worker(workers)
+    key = (model_size, dtype, workers, threads, model_cache.cache_dir)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            # Windowsとtorchのスレッドの安全性のため、forkではなくspawnを使用する
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_size, dtype, threads, model_cache.cache_dir),
+            )
+            _pools[key] = pool
+        return pool
+
+def shutdown_pools():
+    """作成済みのプロセスプールをすべて終了する"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+def transcribe_parallel(audio, scratch_dir, chunks, model_size="large", language="ja", dtype=None, workers=2,
+                        threads_per_worker=None, on_chunk=None, completed=(), word_timestamps=False, languages=None):
+    """無音部分で分割した音声のチャンクを、プロセスプールで並列に文字起こしする
+
+    Args:
+        audio: float32のモノラル音声
+        scratch_dir: ワーカーと音声を共有するための一時作業ディレクトリ
+        chunks: (開始サンプル, 終了サンプル) のリスト（find_split_pointsの戻り値）
+        model_size: 使用するWhisperモデルのサイズ
+        language: 文字起こしの言語
+        dtype: モデルの重みの精度
+        workers: ワーカープロセス数
+        threads_per_worker: ワーカー1つあたりのtorchスレッド数（Noneはコア数から自動設定）
+        on_chunk: チャンクの結果が先頭から順に揃うたびに (番号, 開始サンプル, 終了サンプル, 結果) で呼ばれる関数
+        completed: 先頭から順に文字起こし済みのチャンクの結果（チェックポイントからの再開用）
+        word_timestamps: 単語ごとのタイムスタンプを求めるかどうか
+        languages: チャンクごとの言語のリスト（Noneの要素と省略時はlanguageを使う）
+
+    Returns:
+        model.transcribeと同じ形式の辞書（タイムスタンプは元の音声の時刻）
+    """
+    # 音声は一時ファイル経由でワーカーと共有し、各ワーカーは必要な範囲だけを読み込む
+    # 音声がPcmFileの場合もメモリに載せずに済むよう、一定量ずつ書き出す
+    audio_path = os.path.join(scratch_dir, "audio.npy")
+    with open(audio_path, "wb") as f:
+        np.lib.format.write_array_header_1_0(f, {"descr": "<f4", "fortran_order": False, "shape": (len(audio),)})
+        for window in iter_windows(audio):
+            f.write(window.tobytes())
+
+    parts = [(start / SAMPLE_RATE, result) for (start, _), result in zip(chunks, completed)]
+    pool = get_pool(model_size, dtype, workers, threads_per_worker)
+    futures = {
+        index: pool.submit(_transcribe_chunk, audio_path, index, *chunks[index],
+                           (languages[index] if languages else None) or language, word_timestamps)
+        for index in range(len(completed), len(chunks))
+    }
+    try:
+        for index, future in futures.items():
+            start, end = chunks[index]
+            result = future.result()
+            parts.append((start / SAMPLE_RATE, result))
+            if on_chunk is not None:
+                on_chunk(index, start, end, result)
+    except BaseException:
+        # 中断時は未着手のチャンクを取り消し、プールを次の処理に使えるようにする
+        for future in futures.values():
+            future.cancel()
+        raise
+    return merge_results(parts, language)
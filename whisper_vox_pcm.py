@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+WhisperVox PCMファイル - 長時間の音声をメモリに載せずに扱う
+
+FFmpegの出力を一定量ずつ一時ファイルへ書き出し、文字起こしや発話区間検出では
+必要な範囲（ウィンドウ）だけを読み込む。読み込んだ範囲は使い終わると解放されるため、
+入力が長くても常駐メモリはほぼ一定になる。
+
+一時ファイルは名前のないファイル（tempfile.TemporaryFile）として作成するため、
+閉じたときや強制終了したときにOSが自動的に削除する。
+メモリマップを使わずに読み込むのは、マップしたページが読み込み後も常駐メモリに数えられるためである。
+"""
+import subprocess
+import tempfile
+import threading
+import numpy as np
+
+from whisper_vox_vad import SAMPLE_RATE
+
+# 一度に読み書きするサンプル数（60秒分、約3.8MB）
+WINDOW_SAMPLES = SAMPLE_RATE * 60
+
+# float32の1サンプルのバイト数
+SAMPLE_BYTES = 4
+
+def ffmpeg_pcm_command(video_path, sample_rate=SAMPLE_RATE, audio_track=None):
+    """動画の音声をモノラルfloat32 PCMとして標準出力に書き出すFFmpegのコマンド
+
+    audio_trackは音声トラックだけを数えた0始まりの番号（Noneは既定のトラック）
+    """
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-threads", "0",
+        "-i", video_path,
+        "-vn",
+    ]
+    if audio_track is not None:
+        cmd += ["-map", f"0:a:{audio_track}"]
+    return cmd + [
+        "-f", "f32le",
+        "-ac", "1",
+        "-ar", str(sample_rate),
+        "-"
+    ]
+
+class PcmFile:
+    """一時ファイル上のfloat32モノラルPCM
+
+    長さの取得とスライス（audio[start:end]）に対応し、スライスした範囲だけを
+    numpy.ndarrayとして読み込む。numpy.ndarrayの音声の代わりに各処理へ渡せる。
+
+    Args:
+        scratch_dir: 一時ファイルを作成する場所（Noneは環境変数またはOSの既定）
+    """
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, scratch_dir=None):
+        self.file = tempfile.TemporaryFile(prefix="whispervox-pcm-", dir=scratch_dir)
+        self.length = 0
+        # 先読みスレッドと文字起こしのスレッドから同時に読み込まれても位置がずれないようにする
+        self.lock = threading.Lock()
+
+    def append(self, samples):
+        """末尾にサンプルを追加する"""
+        data = np.ascontiguousarray(samples, dtype=np.float32)
+        with self.lock:
+            self.file.seek(0, 2)
+            self.file.write(data.tobytes())
+            self.length += len(data)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("PcmFileは連続した範囲のスライスのみ対応しています")
+        start, stop, _ = key.indices(self.length)
+        count = max(0, stop - start)
+        if count == 0:
+            return np.zeros(0, dtype=np.float32)
+        with self.lock:
+            self.file.flush()
+            self.file.seek(start * SAMPLE_BYTES)
+            data = self.file.read(count * SAMPLE_BYTES)
+        return np.frombuffer(data, np.float32).copy()
+
+    def close(self):
+        self.file.close()
+
+def iter_windows(audio, size=WINDOW_SAMPLES):
+    """音声（numpy.ndarrayまたはPcmFile）をsizeサンプルずつ先頭から返す"""
+    for start in range(0, len(audio), size):
+        yield np.asarray(audio[start:start + size], dtype=np.float32)
+
+def extract_pcm(video_path, scratch_dir=None, sample_rate=SAMPLE_RATE, audio_track=None):
+    """動画の音声をFFmpegのパイプから一定量ずつ読み込み、PcmFileに書き出す
+
+    Raises:
+        subprocess.CalledProcessError: FFmpegが失敗した場合（stderrにFFmpegの出力）
+        FileNotFoundError: FFmpegが見つからない場合
+    """
+    cmd = ffmpeg_pcm_command(video_path, sample_rate, audio_track)
+    pcm = PcmFile(scratch_dir)
+    block_bytes = WINDOW_SAMPLES * SAMPLE_BYTES
+    # 標準エラー出力はパイプが詰まらないよう一時ファイルに受ける
+    with tempfile.TemporaryFile(dir=scratch_dir) as stderr:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            pending = b""
+            while True:
+                block = process.stdout.read(block_bytes)
+                if not block:
+                    break
+                block = pending + block
+                usable = len(block) - len(block) % SAMPLE_BYTES
+                pcm.append(np.frombuffer(block[:usable], np.float32))
+                pending = block[usable:]
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            pcm.close()
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr.read())
+    return pcm
+
+def compact_speech_pcm(audio, spans, scratch_dir=None, sample_rate=SAMPLE_RATE):
+    """compact_speechと同じ処理を、つなげた音声をPcmFileに書き出して行う
+
+    Returns:
+        (つなげた音声のPcmFile, [(つなげた音声上の開始秒, 元の音声上の開始秒, 長さ秒), ...])
+    """
+    pcm = PcmFile(scratch_dir)
+    time_map = []
+    for start, end in spans:
+        time_map.append((len(pcm) / sample_rate, start / sample_rate, (end - start) / sample_rate))
+        for window_start in range(start, end, WINDOW_SAMPLES):
+            pcm.append(audio[window_start:min(end, window_start + WINDOW_SAMPLES)])
+    return pcm, time_map
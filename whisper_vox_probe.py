@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+WhisperVox 入力の事前調査 - ffprobeで入力ファイルの長さ・コーデック・音声トラックを調べる
+
+モデルをロードする前に入力を調べ、音声トラックのないファイルはすぐにエラーにする。
+すでに16kHzモノラルの16bit PCM WAV（--keep-audioで保存した音声など）はFFmpegで
+変換し直さず、そのまま読み込む。ffprobeがない環境では調査を省略し、従来どおりFFmpegで抽出する。
+"""
+import json
+import subprocess
+import wave
+import numpy as np
+
+from whisper_vox_pcm import WINDOW_SAMPLES
+from whisper_vox_vad import SAMPLE_RATE
+
+class NoAudioStreamError(Exception):
+    """入力ファイルに音声トラックがない場合の例外"""
+
+def probe_media(video_path):
+    """ffprobeで入力ファイルを調べる
+
+    Returns:
+        {"duration": 長さ（秒、不明な場合はNone）, "format_name": コンテナ形式,
+         "audio_streams": [{"index", "codec", "sample_rate", "channels", "language", "title", "default"}, ...],
+         "video_streams": 映像トラック数} の辞書。ffprobeがない・失敗した場合はNone
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-show_format",
+        "-show_streams",
+        "-of", "json",
+        video_path
+    ]
+    try:
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+        data = json.loads(out.decode("utf-8", errors="replace"))
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+        return None
+
+    fmt = data.get("format", {})
+    streams = data.get("streams", [])
+    audio_streams = []
+    for stream in streams:
+        if stream.get("codec_type") != "audio":
+            continue
+        tags = stream.get("tags", {})
+        audio_streams.append({
+            "index": stream.get("index"),
+            "codec": stream.get("codec_name"),
+            "sample_rate": int(stream.get("sample_rate") or 0),
+            "channels": stream.get("channels"),
+            "language": tags.get("language"),
+            "title": tags.get("title"),
+            "default": bool(stream.get("disposition", {}).get("default")),
+        })
+    try:
+        duration = float(fmt["duration"])
+    except (KeyError, ValueError):
+        duration = None
+    return {
+        "duration": duration,
+        "format_name": fmt.get("format_name", ""),
+        "audio_streams": audio_streams,
+        "video_streams": sum(s.get("codec_type") == "video" for s in streams),
+    }
+
+def select_stream(info, audio_track=None):
+    """使用する音声トラックの情報を返す
+
+    Args:
+        info: probe_mediaの戻り値
+        audio_track: 音声トラックの番号（音声トラックだけを数えた0始まりの番号、Noneは既定のトラック）
+
+    Raises:
+        NoAudioStreamError: 音声トラックがない場合
+        ValueError: 指定した番号の音声トラックがない場合
+    """
+    streams = info["audio_streams"]
+    if not streams:
+        raise NoAudioStreamError("音声トラックがありません")
+    if audio_track is None:
+        # FFmpegが既定で選ぶトラックと同じく、既定のトラック（なければ先頭）を使う
+        return next((s for s in streams if s["default"]), streams[0])
+    if not 0 <= audio_track < len(streams):
+        raise ValueError(f"音声トラック{audio_track}がありません（音声トラック数: {len(streams)}）")
+    return streams[audio_track]
+
+def describe_stream(number, stream):
+    """音声トラックの表示用の説明"""
+    parts = [stream["codec"] or "不明", f"{stream['sample_rate']}Hz", f"{stream['channels']}ch"]
+    label = " / ".join(filter(None, [stream["language"], stream["title"]]))
+    return f"音声トラック{number}: {' '.join(parts)}" + (f" ({label})" if label else "")
+
+def is_direct_wav(info, audio_track=None, sample_rate=SAMPLE_RATE):
+    """FFmpegで変換せずにそのまま読み込めるWAV（16kHzモノラルの16bit PCM）かどうか"""
+    if info is None or "wav" not in info["format_name"].split(","):
+        return False
+    if len(info["audio_streams"]) != 1 or audio_track not in (None, 0):
+        return False
+    stream = info["audio_streams"][0]
+    return stream["codec"] == "pcm_s16le" and stream["sample_rate"] == sample_rate and stream["channels"] == 1
+
+def read_wav(path, pcm=None):
+    """16bit PCMのモノラルWAVをfloat32の音声として読み込む
+
+    値の変換はFFmpegの出力（1/32768倍）と同じため、抽出した音声と一致する。
+
+    Args:
+        path: WAVファイルのパス
+        pcm: 指定した場合、メモリに載せずにこのPcmFileへ一定量ずつ追加する
+
+    Returns:
+        numpy.ndarray（pcm指定時はpcm）
+
+    Raises:
+        wave.Error: 対応していない形式の場合
+    """
+    with wave.open(path, "rb") as f:
+        if f.getnchannels() != 1 or f.getsampwidth() != 2:
+            raise wave.Error("16bitモノラルのWAVではありません")
+        audio = pcm if pcm is not None else np.empty(f.getnframes(), dtype=np.float32)
+        position = 0
+        while True:
+            frames = f.readframes(WINDOW_SAMPLES)
+            if not frames:
+                break
+            window = np.frombuffer(frames, "<i2").astype(np.float32) * np.float32(1 / 32768)
+            if pcm is not None:
+                pcm.append(window)
+            else:
+                audio[position:position + len(window)] = window
+            position += len(window)
+    return audio if pcm is not None else audio[:position]
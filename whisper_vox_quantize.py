@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+WhisperVox 量子化 - CPU推論を高速化する低精度モード
+
+int8      : 全結合層の重みをint8に動的量子化する。量子化したモデルはディスクに保存し、
+            2回目以降は量子化済みのモデルを直接読み込む
+bfloat16  : 重みはfloat32のまま、エンコーダーとデコーダーの計算をbfloat16で行う（対応CPUのみ）
+
+torchとwhisperは起動を速くするため、使用する関数の中でインポートする。
+"""
+import dataclasses
+import os
+
+from whisper_vox_cache import _atomic_write, default_cache_dir
+
+# CPUでのみ使用できる精度
+CPU_DTYPES = ("int8", "bfloat16")
+
+def bf16_supported():
+    """CPUがbfloat16の演算に対応しているかどうか"""
+    import torch
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+def quantized_model_path(model_size, cache_dir=None):
+    """int8量子化済みモデルの重みの保存先（Whisperとtorchのバージョンごとに別のファイル）"""
+    import torch
+    import whisper
+    name = f"{model_size}-int8-whisper{whisper.__version__}-torch{torch.__version__}.weights.pt"
+    return os.path.join(cache_dir or default_cache_dir(), "models", name)
+
+def quantize_int8(model):
+    """モデルの全結合層をint8に動的量子化する
+
+    Whisperの全結合層はnn.Linearのサブクラスで、そのままでは量子化の対象にならないため、
+    処理が同じnn.Linearに置き換えてから量子化する（float32のモデルでは計算結果は変わらない）。
+    """
+    import torch
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_int8_model(model_size, cache_dir=None):
+    """int8量子化済みのモデルを読み込む（初回は量子化してディスクに保存する）
+
+    保存するのはモデルの構成と量子化済みの重み（state_dict）だけで、読み込みはweights_only=Trueで行う
+    （キャッシュのファイルが書き換えられていても任意のコードは実行されない）。
+    読み込むときは構成から量子化したモデルを組み立てて重みを戻すため、元のモデルのファイルは読まない。
+    """
+    import torch
+    import whisper
+    from whisper.model import ModelDimensions, Whisper
+    path = quantized_model_path(model_size, cache_dir)
+    if os.path.exists(path):
+        saved = torch.load(path, map_location="cpu", weights_only=True)
+        model = quantize_int8(Whisper(ModelDimensions(**saved["dims"])))
+        model.load_state_dict(saved["state_dict"])
+        # 単語のタイムスタンプに使うアライメントヘッドは重みに含まれないため、load_modelと同じく設定し直す
+        alignment_heads = whisper._ALIGNMENT_HEADS.get(model_size)
+        if alignment_heads is not None:
+            model.set_alignment_heads(alignment_heads)
+        return model.eval()
+    model = quantize_int8(whisper.load_model(model_size, device="cpu")).eval()
+    saved = {"dims": dataclasses.asdict(model.dims), "state_dict": model.state_dict()}
+    _atomic_write(path, lambda f: torch.save(saved, f))
+    return model
+
+def enable_bf16_autocast(model):
+    """エンコーダーとデコーダーの計算をbfloat16で行うようにする
+
+    Whisperのデコード処理はfloat32の入出力を前提としているため、
+    各部の出力はfloat32に戻して返す。
+    """
+    import torch
+    for part in (model.encoder, model.decoder):
+        def forward(*args, _forward=part.forward, **kwargs):
+            with torch.autocast("cpu", dtype=torch.bfloat16):
+                return _forward(*args, **kwargs).float()
+        part.forward = forward
+    return model
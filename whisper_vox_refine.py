@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+WhisperVox 2段階の文字起こし - 速いモデルで下書きし、確信度の低い区間だけを大きいモデルで文字起こしし直す
+
+音声の大部分が明瞭な発話であれば、smallなどの速いモデルでも十分な精度が出る。
+下書きのセグメントのうち、単語の確率の対数の平均が低いもの（聞き取りに自信がない・幻覚の疑い）と
+テキストの圧縮率が高いもの（同じ語の繰り返し）を精査の対象とし、その区間だけを大きいモデルで
+文字起こしして下書きのセグメントと置き換える。
+
+Whisperの結果のavg_logprob・compression_ratio・no_speech_probは30秒の窓ごとに求めた値を
+窓内のすべてのセグメントに写したものなので、セグメントごとの判定には使えない。
+そのため下書きは単語のタイムスタンプ付きで文字起こしし、単語ごとの確率で判定する。
+"""
+import math
+import zlib
+
+# 精査の対象とするしきい値（下書きのセグメントがいずれかを満たす場合に大きいモデルで文字起こしし直す）
+# 単語の確率の対数の平均（-0.8は確率の幾何平均で約0.45）と、テキストの圧縮率
+REFINE_WORD_LOGPROB_THRESHOLD = -0.8
+REFINE_COMPRESSION_RATIO_THRESHOLD = 2.4
+
+# 確率0の単語でも対数が発散しないようにする下限
+MIN_WORD_PROBABILITY = 1e-6
+
+# 精査する区間の前後に文脈として加える音声の長さ（秒、この部分の結果は採用しない）
+REFINE_CONTEXT_SECONDS = 0.5
+
+# 精査の対象どうしの間隔がこれより短い場合は1つの区間にまとめる（秒）
+REFINE_MERGE_GAP = 1.0
+
+def word_logprob(segment):
+    """セグメントの単語の確率の対数の平均（単語がない場合はNone）"""
+    words = segment.get("words") or []
+    if not words:
+        return None
+    return sum(math.log(max(word["probability"], MIN_WORD_PROBABILITY)) for word in words) / len(words)
+
+def text_compression_ratio(text):
+    """テキストの圧縮率（Whisperのcompression_ratioと同じ求め方をセグメント単位で行う）"""
+    data = text.strip().encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+def needs_refinement(segment):
+    """下書きのセグメントを大きいモデルで文字起こしし直すべきかどうか
+
+    テキストがあるのに単語がない（単語のタイムスタンプを求めていない）セグメントは対象にしない。
+    """
+    logprob = word_logprob(segment)
+    return ((logprob is not None and logprob < REFINE_WORD_LOGPROB_THRESHOLD)
+            or text_compression_ratio(segment["text"]) > REFINE_COMPRESSION_RATIO_THRESHOLD)
+
+def refine_regions(segments, merge_gap=REFINE_MERGE_GAP):
+    """精査の対象のセグメントを含む区間の (開始秒, 終了秒) のリストを返す
+
+    近い区間はまとめ、大きいモデルの呼び出し回数を減らす。
+    """
+    regions = []
+    for segment in segments:
+        if not needs_refinement(segment):
+            continue
+        if regions and segment["start"] - regions[-1][1] < merge_gap:
+            regions[-1][1] = max(regions[-1][1], segment["end"])
+        else:
+            regions.append([segment["start"], segment["end"]])
+    return [tuple(region) for region in regions]
+
+def _midpoint(segment):
+    return (segment["start"] + segment["end"]) / 2
+
+def _clip(segment, start, end):
+    """セグメント（と単語）の時刻を [start, end] の範囲に収めたコピーを返す"""
+    clipped = dict(segment, start=min(max(segment["start"], start), end), end=max(min(segment["end"], end), start))
+    if segment.get("words"):
+        clipped["words"] = [
+            dict(word, start=min(max(word["start"], start), end), end=max(min(word["end"], end), start))
+            for word in segment["words"]
+        ]
+    return clipped
+
+def merge_refined(segments, replacements):
+    """下書きのセグメントのうち精査した区間のものを、大きいモデルの結果で置き換える
+
+    セグメントの中央の時刻が区間に含まれるかどうかで、置き換える（採用する）セグメントを決める。
+    字幕が重ならないよう、採用した大きいモデルのセグメントは区間の中に収め、
+    残した下書きのセグメントは区間に入り込んだ部分を切り詰める。
+
+    Args:
+        segments: 下書きのセグメントのリスト
+        replacements: ((開始秒, 終了秒), 区間内のセグメントのリスト) のリスト（時刻はsegmentsと同じ基準）
+
+    Returns:
+        時刻順のセグメントのリスト
+    """
+    def in_region(segment, region):
+        return region[0] <= _midpoint(segment) <= region[1]
+
+    regions = [region for region, _ in replacements]
+    merged = []
+    for segment in segments:
+        if any(in_region(segment, region) for region in regions):
+            continue
+        start, end = segment["start"], segment["end"]
+        for region_start, region_end in regions:
+            if start < region_end and end > region_start:
+                if _midpoint(segment) < region_start:
+                    end = region_start
+                else:
+                    start = region_end
+        merged.append(_clip(segment, start, end) if (start, end) != (segment["start"], segment["end"]) else segment)
+    for region, refined in replacements:
+        merged.extend(_clip(s, *region) for s in refined if in_region(s, region))
+    merged.sort(key=lambda s: s["start"])
+    return merged
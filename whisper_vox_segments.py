@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+WhisperVox セグメント操作 - 部分ごとの文字起こし結果のタイムスタンプ調整と結合
+"""
+
+def shift_segments(segments, offset):
+    """セグメント（と単語）のタイムスタンプをoffset秒ずらした新しいリストを返す"""
+    shifted = []
+    for segment in segments:
+        segment = dict(segment)
+        segment["start"] = segment["start"] + offset
+        segment["end"] = segment["end"] + offset
+        if segment.get("words"):
+            segment["words"] = [
+                dict(word, start=word["start"] + offset, end=word["end"] + offset)
+                for word in segment["words"]
+            ]
+        shifted.append(segment)
+    return shifted
+
+def merge_results(parts, language=None):
+    """時刻順に並んだ (開始秒, 文字起こし結果) のリストを1つの結果に結合する
+
+    各結果のセグメントを開始秒だけずらし、IDを振り直す。
+
+    Returns:
+        model.transcribeと同じ形式の辞書（"text", "segments", "language"）
+    """
+    segments = []
+    texts = []
+    for offset, result in parts:
+        segments.extend(shift_segments(result["segments"], offset))
+        texts.append(result["text"])
+        if language is None:
+            language = result.get("language")
+    for i, segment in enumerate(segments):
+        segment["id"] = i
+    return {"text": "".join(texts), "segments": segments, "language": language}
+
+def remap_segments(segments, map_func):
+    """セグメント（と単語）のタイムスタンプをmap_funcで変換した新しいリストを返す"""
+    remapped = []
+    for segment in segments:
+        segment = dict(segment)
+        segment["start"] = map_func(segment["start"])
+        segment["end"] = map_func(segment["end"])
+        if segment.get("words"):
+            segment["words"] = [
+                dict(word, start=map_func(word["start"]), end=map_func(word["end"]))
+                for word in segment["words"]
+            ]
+        remapped.append(segment)
+    return remapped
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+WhisperVox サーバー - モデルを常駐させたローカルHTTP文字起こしサービス
+
+ジョブをキューに積み、設定した同時実行数で順に処理する。
+ロードバランサーの背後に置けるよう、ヘルスチェックとキュー長などのメトリクスを提供する。
+
+エンドポイント:
+    POST   /jobs                  ジョブの登録（本文に動画ファイル、またはJSONでローカルパスを指定）
+    GET    /jobs                  ジョブの一覧
+    GET    /jobs/<id>             ジョブの状態と進捗
+    GET    /jobs/<id>/result      結果の取得（?format=srt|vtt|txt|tsv|json）
+    DELETE /jobs/<id>             ジョブの取り消し（実行中の場合は中断）・削除
+    GET    /health                ヘルスチェック
+    GET    /metrics               Prometheus形式のメトリクス
+"""
+import argparse
+import json
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from whisper_vox import generate_subtitles, job_scratch, model_cache, resolve_device
+from whisper_vox_cache import ResultCache
+from whisper_vox_events import ProgressReporter, PrometheusExporter
+
+# 結果として返せる形式とContent-Type
+RESULT_TYPES = {
+    "srt": "application/x-subrip; charset=utf-8",
+    "vtt": "text/vtt; charset=utf-8",
+    "txt": "text/plain; charset=utf-8",
+    "tsv": "text/tab-separated-values; charset=utf-8",
+    "json": "application/json; charset=utf-8",
+}
+
+# リクエストで指定できるモデルサイズ
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large"]
+
+# アップロードを読み込む単位
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+class Job:
+    """文字起こしジョブ"""
+    def __init__(self, job_dir, input_path, options, owns_input):
+        self.id = os.path.basename(job_dir)
+        self.dir = job_dir
+        self.input_path = input_path
+        self.options = options
+        # アップロードされたファイルはジョブの削除時に一緒に削除する
+        self.owns_input = owns_input
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.stats = None
+        # セットすると実行中の文字起こしをチャンクの区切りで中止する
+        self.cancel_event = threading.Event()
+        self.log = []
+        # 処理済みの割合（音声の長さに対する%）
+        self.progress = 0.0
+
+    def to_dict(self, queue_position=None):
+        info = {
+            "id": self.id,
+            "status": self.status,
+            "input": os.path.basename(self.input_path),
+            "options": self.options,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "progress": round(self.progress, 1),
+            "log": self.log[-20:],
+        }
+        if queue_position is not None:
+            info["queue_position"] = queue_position
+        if self.stats is not None:
+            info["stats"] = {k: v for k, v in self.stats.items() if k not in ("result", "video_path", "output_path", "output_paths")}
+        return info
+
+class JobManager:
+    """ジョブのキューと、それを処理するワーカースレッドを管理するクラス"""
+    def __init__(self, work_dir, concurrency=1, max_queue=100, job_ttl=3600, device=None, cache=None):
+        self.work_dir = work_dir
+        self.max_queue = max_queue
+        self.job_ttl = job_ttl
+        self.device = device
+        self.cache = cache
+        self.jobs = {}
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.counters = {"completed": 0, "failed": 0, "cancelled": 0}
+        self.audio_seconds = 0.0
+        self.processing_seconds = 0.0
+        # 全ジョブの処理段階ごとの所要時間を集計する
+        self.stage_metrics = PrometheusExporter()
+        os.makedirs(work_dir, exist_ok=True)
+        self.workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(concurrency)]
+        for worker in self.workers:
+            worker.start()
+
+    def queue_depth(self):
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if job.status == "queued")
+
+    def running(self):
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if job.status == "running")
+
+    def create_job_dir(self):
+        return tempfile.mkdtemp(prefix="job-", dir=self.work_dir)
+
+    def submit(self, job_dir, input_path, options, owns_input):
+        """ジョブを登録する（キューが満杯の場合はNone）"""
+        # ワーカーがジョブを取り出さない間（すべて実行中など）も、保持期間を過ぎたジョブを削除する
+        self._expire()
+        if self.queue_depth() >= self.max_queue:
+            return None
+        job = Job(job_dir, input_path, options, owns_input)
+        with self.lock:
+            self.jobs[job.id] = job
+        self.pending.put(job.id)
+        return job
+
+    def list_jobs(self):
+        """保持期間を過ぎたジョブを削除してから、ジョブの一覧を返す"""
+        self._expire()
+        with self.lock:
+            return list(self.jobs.values())
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def queue_position(self, job):
+        if job.status != "queued":
+            return None
+        with self.lock:
+            queued = sorted((j for j in self.jobs.values() if j.status == "queued"), key=lambda j: j.created)
+        return next(i for i, j in enumerate(queued) if j is job)
+
+    def delete(self, job_id):
+        """ジョブを取り消して削除する（ジョブがない場合はFalse）
+
+        実行中のジョブは中止を指示し、作業ディレクトリは文字起こしが中止された後に削除する。
+        """
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+            if job is None:
+                return False
+            running = job.started is not None and job.finished is None
+            if job.status in ("queued", "running"):
+                job.status = "cancelled"
+                self.counters["cancelled"] += 1
+        if running:
+            job.cancel_event.set()
+        else:
+            shutil.rmtree(job.dir, ignore_errors=True)
+        return True
+
+    def _expire(self):
+        """保持期間を過ぎた完了済みジョブを削除する"""
+        now = time.time()
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.finished is not None and now - job.finished > self.job_ttl]
+        for job_id in expired:
+            self.delete(job_id)
+
+    def _worker(self):
+        while True:
+            job_id = self.pending.get()
+            self._expire()
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None or job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started = time.time()
+            self._run(job)
+
+    def _run(self, job):
+        output_path = os.path.join(job.dir, "output.srt")
+        # 進捗メッセージはジョブごとのログに、処理段階の計測値はメトリクスに送る
+        def append_log(record):
+            if record["event"] == "log":
+                job.log.append(record["message"])
+            elif record["event"] == "progress":
+                job.progress = record["percent"]
+        reporter = ProgressReporter([append_log, self.stage_metrics], echo=False, context={"job": job.id})
+        try:
+            stats = generate_subtitles(
+                video_path=job.input_path,
+                output_path=output_path,
+                model_size=job.options["model"],
+                language=job.options["language"],
+                device=self.device,
+                # 結果として返せるすべての形式を1回の文字起こしから書き出す
+                # （単語のタイムスタンプは処理時間が延びるため求めない）
+                output_format=list(RESULT_TYPES),
+                word_timestamps=False,
+                cache=self.cache,
+                vad=job.options["vad"],
+                reporter=reporter,
+                cancel_event=job.cancel_event
+            )
+            if stats is None and not job.cancel_event.is_set():
+                raise RuntimeError(job.log[-1] if job.log else "文字起こしに失敗しました")
+            with self.lock:
+                # 取り消されたジョブの状態と件数はdeleteで更新済み
+                if not job.cancel_event.is_set():
+                    job.stats = stats
+                    job.status = "completed"
+                    self.counters["completed"] += 1
+                    self.audio_seconds += stats["audio_duration"]
+                    self.processing_seconds += stats["total_time"]
+        except Exception as e:
+            with self.lock:
+                if not job.cancel_event.is_set():
+                    job.error = str(e)
+                    job.status = "failed"
+                    self.counters["failed"] += 1
+        finally:
+            with self.lock:
+                job.finished = time.time()
+                deleted = self.jobs.get(job.id) is not job
+            if deleted:
+                shutil.rmtree(job.dir, ignore_errors=True)
+            elif job.owns_input and os.path.exists(job.input_path):
+                os.remove(job.input_path)
+
+    def metrics(self):
+        """Prometheusのテキスト形式のメトリクス"""
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+            counters = dict(self.counters)
+            audio_seconds = self.audio_seconds
+            processing_seconds = self.processing_seconds
+        lines = [
+            "# HELP whispervox_queue_depth Number of jobs waiting in the queue.",
+            "# TYPE whispervox_queue_depth gauge",
+            f"whispervox_queue_depth {statuses.count('queued')}",
+            "# HELP whispervox_jobs_running Number of jobs being processed.",
+            "# TYPE whispervox_jobs_running gauge",
+            f"whispervox_jobs_running {statuses.count('running')}",
+            "# HELP whispervox_workers Number of job worker threads.",
+            "# TYPE whispervox_workers gauge",
+            f"whispervox_workers {len(self.workers)}",
+            "# HELP whispervox_jobs_total Number of finished jobs by status.",
+            "# TYPE whispervox_jobs_total counter",
+        ]
+        for status, count in counters.items():
+            lines.append(f'whispervox_jobs_total{{status="{status}"}} {count}')
+        lines += [
+            "# HELP whispervox_audio_seconds_total Seconds of audio transcribed.",
+            "# TYPE whispervox_audio_seconds_total counter",
+            f"whispervox_audio_seconds_total {audio_seconds:.3f}",
+            "# HELP whispervox_processing_seconds_total Wall-clock seconds spent on jobs.",
+            "# TYPE whispervox_processing_seconds_total counter",
+            f"whispervox_processing_seconds_total {processing_seconds:.3f}",
+            "# HELP whispervox_models_loaded Number of resident Whisper models.",
+            "# TYPE whispervox_models_loaded gauge",
+            f"whispervox_models_loaded {len(model_cache.loaded_keys())}",
+        ]
+        return "\n".join(lines) + "\n" + self.stage_metrics.render()
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """WhisperVoxサーバーのHTTPリクエストハンドラ"""
+    manager = None
+    defaults = None
+    allow_local_paths = False
+
+    def log_message(self, format, *args):
+        sys.stderr.write("%s - %s\n" % (self.address_string(), format % args))
+
+    def _send(self, status, body, content_type="application/json; charset=utf-8"):
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body, ensure_ascii=False)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, {"error": message})
+
+    def _route(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        return parts, {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+    def do_GET(self):
+        parts, query = self._route()
+        manager = self.manager
+        if parts == ["health"]:
+            self._send(200, {
+                "status": "ok",
+                "queue_depth": manager.queue_depth(),
+                "running": manager.running(),
+                "models": [list(key) for key in model_cache.loaded_keys()],
+            })
+        elif parts == ["metrics"]:
+            self._send(200, manager.metrics(), "text/plain; version=0.0.4; charset=utf-8")
+        elif parts == ["jobs"]:
+            self._send(200, {"jobs": [job.to_dict() for job in manager.list_jobs()]})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = manager.get(parts[1])
+            if job is None:
+                return self._error(404, "ジョブが見つかりません")
+            self._send(200, job.to_dict(manager.queue_position(job)))
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            job = manager.get(parts[1])
+            if job is None:
+                return self._error(404, "ジョブが見つかりません")
+            if job.status != "completed":
+                return self._error(409, f"ジョブは完了していません（状態: {job.status}）")
+            output_format = query.get("format", "srt")
+            if output_format not in RESULT_TYPES:
+                return self._error(400, f"未対応の形式です: {output_format}")
+            try:
+                with open(os.path.join(job.dir, f"output.{output_format}"), "rb") as f:
+                    body = f.read()
+            except FileNotFoundError:
+                # 保持期間を過ぎて削除された場合など
+                return self._error(410, "結果のファイルがありません")
+            self._send(200, body, RESULT_TYPES[output_format])
+        else:
+            self._error(404, "見つかりません")
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._error(404, "見つかりません")
+        if not self.manager.delete(parts[1]):
+            return self._error(404, "ジョブが見つかりません")
+        self._send(200, {"id": parts[1], "deleted": True})
+
+    def do_POST(self):
+        parts, query = self._route()
+        if parts != ["jobs"]:
+            return self._error(404, "見つかりません")
+        if self.manager.queue_depth() >= self.manager.max_queue:
+            return self._error(503, "キューが満杯です")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._error(400, "Content-Lengthが不正です")
+        if length < 0:
+            return self._error(400, "Content-Lengthが不正です")
+        content_type = self.headers.get("Content-Type", "")
+
+        job_dir = self.manager.create_job_dir()
+        if content_type.startswith("application/json"):
+            # ローカルパスを指定したジョブ
+            try:
+                params = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                return self._error(400, "JSONを解釈できません")
+            if not self.allow_local_paths:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                return self._error(403, "ローカルパスの指定は無効です（--allow-local-paths で有効化）")
+            input_path = params.get("path")
+            if not input_path or not os.path.isfile(input_path):
+                shutil.rmtree(job_dir, ignore_errors=True)
+                return self._error(400, "path に存在するファイルを指定してください")
+            owns_input = False
+        else:
+            # 本文をそのまま動画ファイルとして受け取る
+            params = query
+            if length <= 0:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                return self._error(400, "本文に動画ファイルを指定してください")
+            filename = os.path.basename(query.get("filename", "upload"))
+            input_path = os.path.join(job_dir, f"input{os.path.splitext(filename)[1]}")
+            with open(input_path, "wb") as f:
+                remaining = length
+                while remaining > 0:
+                    block = self.rfile.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                    if not block:
+                        break
+                    f.write(block)
+                    remaining -= len(block)
+            if remaining > 0:
+                # 送信の途中でクライアントが切断した場合は、途中までのファイルを受け付けない
+                shutil.rmtree(job_dir, ignore_errors=True)
+                return self._error(400, "本文がContent-Lengthより短いため受け付けません")
+            owns_input = True
+
+        options = {
+            "model": params.get("model", self.defaults["model"]),
+            "language": params.get("language", self.defaults["language"]),
+            "vad": str(params.get("vad", self.defaults["vad"])).lower() in ("1", "true", "yes"),
+        }
+        if options["model"] not in MODEL_SIZES:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return self._error(400, f"未対応のモデルです: {options['model']}")
+        job = self.manager.submit(job_dir, input_path, options, owns_input)
+        if job is None:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return self._error(503, "キューが満杯です")
+        self._send(202, job.to_dict(self.manager.queue_position(job)))
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="WhisperVox サーバー - ローカルHTTP文字起こしサービス")
+    parser.add_argument("--host", help="待ち受けるアドレス", default="127.0.0.1")
+    parser.add_argument("--port", help="待ち受けるポート", type=int, default=8765)
+    parser.add_argument("-m", "--model", help="既定のWhisperモデルのサイズ",
+                        choices=MODEL_SIZES, default="large")
+    parser.add_argument("-l", "--language", help="既定の文字起こしの言語", default="ja")
+    parser.add_argument("--vad", help="既定で非発話区間をスキップする", action="store_true")
+    parser.add_argument("--concurrency", help="同時に処理するジョブ数", type=int, default=1)
+    parser.add_argument("--max-queue", help="キューに積めるジョブ数の上限", type=int, default=100)
+    parser.add_argument("--job-ttl", help="完了したジョブの結果を保持する時間（秒）", type=int, default=3600)
+    parser.add_argument("--work-dir", help="ジョブ（アップロードと結果）の保存先（既定は終了時に削除される一時作業ディレクトリ）",
+                        default=None)
+    parser.add_argument("--scratch-dir", help="一時作業ディレクトリを作成する場所", default=None)
+    parser.add_argument("--allow-local-paths", help="サーバー上のローカルパスを指定したジョブを許可する",
+                        action="store_true")
+    parser.add_argument("--no-cache", help="抽出音声と文字起こし結果のキャッシュを使用しない", action="store_true")
+    parser.add_argument("--cpu", help="CPUを強制的に使用する", action="store_true")
+
+    args = parser.parse_args()
+
+    device = resolve_device("cpu" if args.cpu else None)
+    # 起動時に既定のモデルをロードしておき、最初のリクエストからすぐに処理できるようにする
+    print(f"{args.model}モデルをロード中...")
+    model_cache.get(args.model, device)
+    print("モデルロード完了")
+
+    # --work-dir を省略した場合は、終了時（強制終了後は次回起動時）に削除される一時作業ディレクトリを使う
+    with nullcontext(args.work_dir) if args.work_dir is not None else job_scratch(args.scratch_dir) as work_dir:
+        manager = JobManager(
+            work_dir,
+            concurrency=max(1, args.concurrency),
+            max_queue=args.max_queue,
+            job_ttl=args.job_ttl,
+            device=device,
+            cache=None if args.no_cache else ResultCache()
+        )
+        RequestHandler.manager = manager
+        RequestHandler.defaults = {"model": args.model, "language": args.language, "vad": args.vad}
+        RequestHandler.allow_local_paths = args.allow_local_paths
+
+        server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+        print(f"WhisperVox サーバー起動: http://{args.host}:{args.port} (同時実行数: {args.concurrency})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+if __name__ == "__main__":
+    main()
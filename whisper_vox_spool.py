@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+WhisperVox スプーラー - 共有ディレクトリに置かれたファイルを複数のノードのワーカーで文字起こしする
+
+NFSなどで共有するスプールディレクトリの構成:
+    inbox/       文字起こしするファイルを置く場所
+    processing/  ワーカーが処理中のファイル（<名前>.leaseがリース、<名前>.work/が作業ディレクトリ）
+    outbox/      字幕などの出力と、処理結果のメタデータ（<名前>/<名前>.job.json）
+    done/        処理が終わった入力ファイル
+    retry/       失敗したファイル（待ち時間の後に再度処理する）
+    dead/        失敗が上限の回数に達したファイル（<名前>.job.jsonに失敗の記録）
+
+ワーカーはinboxからprocessingへのrename（同じファイルシステム内では不可分）でファイルを取得し、
+取得したワーカーだけがそのファイルを処理する。処理中は一定間隔でリースの期限を延長し、
+ワーカーが異常終了して期限が切れたファイルは、他のワーカーがretryへ移して処理し直す。
+作業ディレクトリのチェックポイントは残るため、処理し直すときは中断した位置から再開する。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+
+from whisper_vox import (
+    MEDIA_EXTENSIONS, default_output_path, format_duration, generate_subtitles, model_cache, parse_formats,
+    resolve_device, resolve_dtype
+)
+from whisper_vox_autotune import MODEL_SIZES
+from whisper_vox_cache import ResultCache, _atomic_write
+from whisper_vox_events import ProgressReporter
+from whisper_vox_parallel import default_threads_per_worker
+
+# スプールディレクトリ内の状態ごとのディレクトリ
+SPOOL_STATES = ["inbox", "processing", "outbox", "done", "retry", "dead"]
+
+# リースの長さ（秒）。処理中はこの1/3の間隔で延長する
+DEFAULT_LEASE_SECONDS = 300.0
+
+# 失敗したファイルを処理する最大の回数と、再度処理するまでの待ち時間（秒、失敗するたびに2倍にする）
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 60.0
+
+# inboxを確認する間隔（秒）
+DEFAULT_POLL_INTERVAL = 5.0
+
+# 更新からこの時間（秒）が経っていないファイルはコピー中とみなして取得しない
+DEFAULT_SETTLE_SECONDS = 5.0
+
+# リース・処理の記録・作業ディレクトリの接尾辞
+LEASE_SUFFIX = ".lease"
+RECORD_SUFFIX = ".job.json"
+WORK_SUFFIX = ".work"
+
+def worker_name():
+    """ワーカーを区別する名前（ホスト名:プロセスID）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path, data):
+    _atomic_write(path, lambda f: json.dump(data, f, ensure_ascii=False, indent=2), mode="w")
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class Spool:
+    """スプールディレクトリ上のファイルの取得・リース・移動を行うクラス
+
+    Args:
+        root: スプールディレクトリ
+        owner: リースの所有者として記録する名前（Noneはworker_name()）
+        lease_seconds: リースの長さ（秒）
+        max_attempts: 失敗したファイルを処理する最大の回数
+        retry_delay: 失敗したファイルを再度処理するまでの待ち時間（秒）
+        settle_seconds: 更新からこの時間が経っていないinboxのファイルは取得しない（秒）
+    """
+    def __init__(self, root, owner=None, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 retry_delay=DEFAULT_RETRY_DELAY, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.root = root
+        self.owner = owner or worker_name()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.settle_seconds = settle_seconds
+        for state in SPOOL_STATES:
+            os.makedirs(self.path(state), exist_ok=True)
+
+    def path(self, state, name=""):
+        """状態ごとのディレクトリ内のパス"""
+        return os.path.join(self.root, state, name)
+
+    def files(self, state):
+        """状態ごとのディレクトリ内の入力ファイル名の一覧（リースや記録などは除く）"""
+        try:
+            names = os.listdir(self.path(state))
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name for name in names
+            if not name.startswith(".") and os.path.splitext(name)[1].lower() in MEDIA_EXTENSIONS
+        )
+
+    def counts(self):
+        """状態ごとのファイル数"""
+        return {state: len(self.files(state)) for state in SPOOL_STATES if state != "outbox"}
+
+    def is_idle(self):
+        """処理待ち・処理中のファイルがないかどうか"""
+        return not any(self.files(state) for state in ("inbox", "processing", "retry"))
+
+    def _candidates(self):
+        """取得できるファイルの (状態, 名前) の一覧（古い順）"""
+        now = time.time()
+        candidates = []
+        for name in self.files("inbox"):
+            try:
+                mtime = os.stat(self.path("inbox", name)).st_mtime
+            except FileNotFoundError:
+                continue
+            if now - mtime >= self.settle_seconds:
+                candidates.append((mtime, "inbox", name))
+        for name in self.files("retry"):
+            record = _read_json(self.path("retry", name + RECORD_SUFFIX)) or {}
+            retry_after = record.get("retry_after", 0.0)
+            if retry_after <= now:
+                candidates.append((retry_after, "retry", name))
+        return [(state, name) for _, state, name in sorted(candidates)]
+
+    def _move(self, name, source, destination, record=None):
+        """入力ファイルを別の状態のディレクトリへ移し、処理の記録を書き込む
+
+        Returns:
+            移動できた場合True（他のワーカーが先に移した場合False）
+        """
+        try:
+            os.rename(self.path(source, name), self.path(destination, name))
+        except FileNotFoundError:
+            return False
+        if record is None:
+            record = _read_json(self.path(source, name + RECORD_SUFFIX))
+        _remove(self.path(source, name + RECORD_SUFFIX))
+        if record is not None:
+            _write_json(self.path(destination, name + RECORD_SUFFIX), record)
+        return True
+
+    def claim(self):
+        """処理するファイルを1つ取得し、リースを作成する
+
+        Returns:
+            処理の記録の辞書（"name"・"attempts"・"history"）。取得できるファイルがない場合はNone
+        """
+        for state, name in self._candidates():
+            if os.path.exists(self.path("processing", name)):
+                # 同じ名前のファイルを処理中の場合は、終わるまで取得しない
+                continue
+            record = _read_json(self.path(state, name + RECORD_SUFFIX)) or {"name": name, "attempts": 0, "history": []}
+            if not self._move(name, state, "processing", record):
+                continue
+            record["attempts"] += 1
+            record["history"].append({"worker": self.owner, "started": time.time()})
+            record.pop("retry_after", None)
+            _write_json(self.path("processing", name + RECORD_SUFFIX), record)
+            self._write_lease(name, record["attempts"])
+            return record
+        return None
+
+    def _write_lease(self, name, attempt):
+        _write_json(self.path("processing", name + LEASE_SUFFIX), {
+            "owner": self.owner,
+            "attempt": attempt,
+            "expires": time.time() + self.lease_seconds,
+        })
+
+    def renew(self, name, attempt):
+        """リースの期限を延長する
+
+        期限切れのファイルを回収するワーカー（reclaim_expired）と競合しないよう、
+        期限内の自分のリースだけを一時ファイルからの置き換えで書き直し、書き直した後に読み直して
+        所有者と回数が変わっていないこと（回収されていないこと）を確認する。
+
+        Returns:
+            延長できた場合True（期限切れで他のワーカーに回収された場合False）
+        """
+        lease_path = self.path("processing", name + LEASE_SUFFIX)
+        lease = _read_json(lease_path)
+        if not self._owns(lease, attempt) or lease.get("expires", 0.0) <= time.time():
+            # 期限が切れたリースは他のワーカーが回収している最中の可能性があるため延長しない
+            return False
+        self._write_lease(name, attempt)
+        return self._owns(_read_json(lease_path), attempt) and os.path.exists(self.path("processing", name))
+
+    def _owns(self, lease, attempt):
+        return lease is not None and lease.get("owner") == self.owner and lease.get("attempt") == attempt
+
+    def work_dir(self, name):
+        """処理中のファイルの作業ディレクトリ（出力ファイルとチェックポイントを置く）"""
+        path = self.path("processing", name + WORK_SUFFIX)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def complete(self, record, stats):
+        """入力ファイルをdoneへ移し、出力ファイルと処理結果のメタデータをoutbox/<名前>/へ移す
+
+        リースの名前を変えて（reclaim_expiredと同じく名前を変えられたワーカーだけが進める）自分のリースで
+        あることを確かめてから入力ファイルを移す。期限切れで他のワーカーに回収された場合は、
+        回収したワーカーのリースや作業ディレクトリには触れず、出力も公開しない。
+
+        Returns:
+            outboxへ移した出力ファイルのパスのリスト。リースを失っていた場合はNone
+        """
+        name = record["name"]
+        lease_path = self.path("processing", name + LEASE_SUFFIX)
+        if not self._owns(_read_json(lease_path), record["attempts"]):
+            return None
+        held_path = f"{lease_path}.{uuid.uuid4().hex}.completing"
+        try:
+            os.rename(lease_path, held_path)
+        except FileNotFoundError:
+            return None
+        if not self._owns(_read_json(held_path), record["attempts"]):
+            # 確認してから名前を変えるまでの間に回収・再取得された場合は、取得したワーカーのリースを戻す
+            os.rename(held_path, lease_path)
+            return None
+        record["history"][-1]["finished"] = time.time()
+        moved = self._move(name, "processing", "done", record)
+        _remove(held_path)
+        if not moved:
+            return None
+        output_dir = self._output_dir(name)
+        outputs = []
+        for path in stats["output_paths"].values():
+            destination = os.path.join(output_dir, os.path.basename(path))
+            shutil.move(path, destination)
+            outputs.append(destination)
+        metadata = dict(
+            record,
+            status="completed",
+            worker=self.owner,
+            outputs=[os.path.basename(path) for path in outputs],
+            **{key: stats.get(key) for key in ("audio_duration", "total_time", "rtf", "language", "cached")}
+        )
+        _write_json(os.path.join(output_dir, name + RECORD_SUFFIX), metadata)
+        self._cleanup(name)
+        return outputs
+
+    def _output_dir(self, name):
+        """出力を置くoutbox/<名前>/を作成する
+
+        拡張子だけが異なる入力（a.mp4とa.mkvなど）の出力が同じ名前にならないよう、入力ファイル名ごとに分ける。
+        同じ名前のファイルを再度処理した場合も以前の出力を上書きしないよう、<名前>.2/ のように番号を付ける。
+        """
+        path = self.path("outbox", name)
+        number = 1
+        while True:
+            try:
+                os.mkdir(path)
+                return path
+            except FileExistsError:
+                number += 1
+                path = self.path("outbox", f"{name}.{number}")
+
+    def fail(self, record, error):
+        """失敗したファイルをretryへ（上限の回数に達した場合はdeadへ）移す
+
+        Returns:
+            移した先の状態（"retry"または"dead"）。他のワーカーが先に移した場合はNone
+        """
+        name = record["name"]
+        record["history"][-1].update(finished=time.time(), error=error)
+        if record["attempts"] >= self.max_attempts:
+            destination = "dead"
+        else:
+            destination = "retry"
+            record["retry_after"] = time.time() + self.retry_delay * 2 ** (record["attempts"] - 1)
+        if not self._move(name, "processing", destination, record):
+            return None
+        if destination == "dead":
+            shutil.rmtree(self.path("processing", name + WORK_SUFFIX), ignore_errors=True)
+        _remove(self.path("processing", name + LEASE_SUFFIX))
+        return destination
+
+    def release(self, record):
+        """処理を中断したファイルをinboxへ戻す（失敗の回数には数えない）"""
+        name = record["name"]
+        record["attempts"] -= 1
+        record["history"].pop()
+        if self._move(name, "processing", "inbox", record):
+            _remove(self.path("processing", name + LEASE_SUFFIX))
+
+    def reclaim_expired(self, log=print):
+        """リースの期限が切れたファイル（ワーカーが異常終了したもの）を回収し、retryまたはdeadへ移す"""
+        now = time.time()
+        for name in self.files("processing"):
+            lease_path = self.path("processing", name + LEASE_SUFFIX)
+            lease = _read_json(lease_path)
+            if lease is None:
+                # 取得直後でリースがまだない場合と区別するため、移動された時刻から判断する
+                try:
+                    if now - os.stat(self.path("processing", name)).st_ctime < self.lease_seconds:
+                        continue
+                except FileNotFoundError:
+                    continue
+                owner = "不明"
+            else:
+                if lease.get("expires", 0.0) > now:
+                    continue
+                # リースの名前を変えられたワーカーだけが回収する（複数のワーカーが同時に回収しないように）
+                try:
+                    os.rename(lease_path, f"{lease_path}.{uuid.uuid4().hex}.expired")
+                except FileNotFoundError:
+                    continue
+                owner = lease.get("owner")
+            record = _read_json(self.path("processing", name + RECORD_SUFFIX)) or {
+                "name": name, "attempts": 1, "history": [{"worker": owner}]}
+            destination = self.fail(record, f"リースの期限切れ（ワーカー: {owner}）")
+            if destination is not None:
+                log(f"リースの期限が切れたファイルを回収しました: {name}（{destination}へ移動）")
+        for name in os.listdir(self.path("processing")):
+            if name.endswith(".expired"):
+                _remove(self.path("processing", name))
+
+    def _cleanup(self, name):
+        _remove(self.path("processing", name + LEASE_SUFFIX))
+        _remove(self.path("processing", name + RECORD_SUFFIX))
+        shutil.rmtree(self.path("processing", name + WORK_SUFFIX), ignore_errors=True)
+
+def process_job(spool, record, options, reporter):
+    """取得したファイルを文字起こしし、結果に応じてoutbox・retry・deadへ移す
+
+    処理中は別のスレッドでリースを延長し、延長できなくなった場合（期限切れで回収された場合）は
+    チャンクの区切りで文字起こしを中止して、ファイルには触れずに戻る。
+
+    Returns:
+        "completed"・"retry"・"dead"・"lost"（リースを失った場合）のいずれか
+    """
+    name = record["name"]
+    log = reporter.log
+    messages = []
+    job_reporter = reporter.child(f"[{name}] ", job=name)
+    job_reporter.add_callback(lambda r: messages.append(r["message"]) if r["event"] in ("log", "error") else None)
+
+    cancel_event = threading.Event()
+    stop = threading.Event()
+    def heartbeat():
+        while not stop.wait(spool.lease_seconds / 3):
+            if not spool.renew(name, record["attempts"]):
+                log(f"警告: {name} のリースを失いました。文字起こしを中止します")
+                cancel_event.set()
+                return
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+
+    log(f"処理を開始します: {name}（{record['attempts']}回目）")
+    output_path = default_output_path(name, options["output_format"], spool.work_dir(name))
+    stats = None
+    try:
+        stats = generate_subtitles(
+            video_path=spool.path("processing", name),
+            output_path=output_path,
+            reporter=job_reporter,
+            cancel_event=cancel_event,
+            # 期限切れで回収されたファイルは、前回のワーカーのチェックポイントから再開する
+            resume=True,
+            **options
+        )
+    except Exception as e:
+        messages.append(str(e))
+    except BaseException:
+        # 停止の指示で中断した場合は、ファイルをinboxへ戻して他のワーカーに任せる
+        stop.set()
+        spool.release(record)
+        log(f"処理を中断し、inboxへ戻しました: {name}")
+        raise
+    finally:
+        stop.set()
+        heartbeat_thread.join()
+
+    if cancel_event.is_set():
+        return "lost"
+    if stats is None:
+        error = messages[-1] if messages else "文字起こしに失敗しました"
+        destination = spool.fail(record, error)
+        log(f"処理に失敗しました: {name}（{destination}へ移動）: {error}")
+        return destination or "lost"
+    if spool.complete(record, stats) is None:
+        log(f"警告: {name} は他のワーカーに回収されたため、出力を破棄しました")
+        return "lost"
+    log(f"処理が完了しました: {name}（音声長 {format_duration(stats['audio_duration'])}、"
+        f"処理時間 {format_duration(stats['total_time'])}）")
+    return "completed"
+
+def run_worker(spool, options, poll_interval=DEFAULT_POLL_INTERVAL, once=False, reporter=None):
+    """スプールディレクトリのファイルを順に処理する
+
+    Args:
+        spool: Spool
+        options: generate_subtitlesに渡す設定
+        poll_interval: 取得できるファイルがない場合にinboxを確認し直す間隔（秒）
+        once: Trueの場合、処理待ち・処理中のファイルがなくなったら終了する
+        reporter: 進捗の通知先（ProgressReporter）
+
+    Returns:
+        処理結果ごとのファイル数の辞書
+    """
+    reporter = reporter or ProgressReporter()
+    counts = {}
+    while True:
+        spool.reclaim_expired(reporter.log)
+        record = spool.claim()
+        if record is None:
+            if once and spool.is_idle():
+                break
+            time.sleep(poll_interval)
+            continue
+        status = process_job(spool, record, options, reporter)
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+def _worker_main(root, spool_options, options, model_size, device, dtype, threads, poll_interval, once, label):
+    """ワーカープロセスの処理（モデルをロードしてからファイルの処理を始める）"""
+    # SIGTERMでも処理中のファイルをinboxへ戻してから終了する
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    reporter = ProgressReporter(prefix=label)
+    if threads is not None:
+        import torch
+        torch.set_num_threads(threads)
+    spool = Spool(root, **spool_options)
+    reporter.log(f"ワーカー起動: {spool.owner}（{model_size}モデルをロード中...）")
+    model_cache.get(model_size, device, dtype)
+    try:
+        counts = run_worker(spool, options, poll_interval, once, reporter)
+    except KeyboardInterrupt:
+        return
+    reporter.log("ワーカー終了: " + ", ".join(f"{status} {count}件" for status, count in sorted(counts.items())))
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="WhisperVox スプーラー - 共有ディレクトリのファイルを複数のワーカーで文字起こしする")
+    parser.add_argument("spool_dir", help="スプールディレクトリ（inbox/にファイルを置く）")
+    parser.add_argument("-m", "--model", help="使用するWhisperモデルのサイズ", choices=MODEL_SIZES, default="large")
+    parser.add_argument("-l", "--language", help="文字起こしの言語（autoで自動判定）", default="ja")
+    parser.add_argument("-f", "--format", help="出力形式（カンマ区切りで複数指定可能）", type=parse_formats, default=["srt"])
+    parser.add_argument("--cpu", help="CPUを強制的に使用する", action="store_true")
+    parser.add_argument("--dtype", help="モデルの精度（float16はGPUのみ、int8・bfloat16はCPUのみ）",
+                        choices=["float32", "float16", "int8", "bfloat16"], default=None)
+    parser.add_argument("--vad", help="発話のない区間を除外してから文字起こしする", action="store_true")
+    parser.add_argument("--draft-model", help="このサイズのモデルで下書きし、確信度の低い区間だけを -m のモデルで文字起こしし直す",
+                        choices=MODEL_SIZES, default=None)
+    parser.add_argument("--low-memory", help="音声を一時ファイルに置き、必要な範囲だけを読み込んで処理する",
+                        action="store_true")
+    parser.add_argument("--no-cache", help="抽出音声と文字起こし結果のキャッシュを使用しない", action="store_true")
+    parser.add_argument("--workers", help="このノードで起動するワーカープロセス数", type=int, default=1)
+    parser.add_argument("--lease", help="リースの長さ（秒）。ワーカーが異常終了した場合、この時間の後に他のワーカーが回収する",
+                        type=float, default=DEFAULT_LEASE_SECONDS)
+    parser.add_argument("--max-attempts", help="失敗したファイルを処理する最大の回数（超えるとdead/へ移す）",
+                        type=int, default=DEFAULT_MAX_ATTEMPTS)
+    parser.add_argument("--retry-delay", help="失敗したファイルを再度処理するまでの待ち時間（秒、失敗するたびに2倍）",
+                        type=float, default=DEFAULT_RETRY_DELAY)
+    parser.add_argument("--poll-interval", help="inboxを確認する間隔（秒）", type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument("--settle", help="更新からこの時間（秒）が経っていないファイルはコピー中とみなして処理しない",
+                        type=float, default=DEFAULT_SETTLE_SECONDS)
+    parser.add_argument("--once", help="処理待ち・処理中のファイルがなくなったら終了する", action="store_true")
+    parser.add_argument("--status", help="状態ごとのファイル数を表示して終了する", action="store_true")
+
+    args = parser.parse_args()
+
+    spool_options = dict(lease_seconds=args.lease, max_attempts=args.max_attempts, retry_delay=args.retry_delay,
+                         settle_seconds=args.settle)
+    if args.status:
+        spool = Spool(args.spool_dir, **spool_options)
+        for state, count in spool.counts().items():
+            print(f"{state}: {count}")
+        return
+
+    device = resolve_device("cpu" if args.cpu else None)
+    dtype = resolve_dtype(args.dtype, device)
+    options = dict(
+        model_size=args.model,
+        language=args.language,
+        device=device,
+        dtype=dtype,
+        output_format=args.format,
+        vad=args.vad,
+        draft_model=args.draft_model,
+        low_memory=args.low_memory,
+        cache=None if args.no_cache else ResultCache(),
+    )
+    workers = max(1, args.workers)
+    # 1つのノードで複数のワーカーを動かす場合は、CPUのコアをワーカー間で分け合う
+    threads = default_threads_per_worker(workers) if workers > 1 and device == "cpu" else None
+    worker_args = (args.spool_dir, spool_options, options, args.model, device, dtype, threads,
+                   args.poll_interval, args.once)
+    if workers == 1:
+        _worker_main(*worker_args, "")
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker_main, args=worker_args + (f"[ワーカー{i}] ",))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # ワーカーにも同じSIGINTが届き、処理中のファイルをinboxへ戻して終了する
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()
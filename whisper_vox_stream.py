@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+WhisperVox ストリーミング - パイプや配信URL、書き込み中のファイルからリアルタイムに字幕を生成する
+
+音声を少しずつ読み込み、直近の一定時間（ウィンドウ）を繰り返し文字起こしして、
+内容が確定したセグメントからSRTの字幕として出力する。
+確定した部分の音声は破棄するため、入力がどれだけ長くてもメモリ使用量は一定に保たれる。
+
+ローカルでの動作確認例:
+    ffmpeg -re -i 動画.mp4 -f f32le -ac 1 -ar 16000 - | python whisper_vox_stream.py --stdin -o live.srt
+"""
+import argparse
+import contextlib
+import subprocess
+import sys
+import time
+import numpy as np
+
+from whisper_vox import SAMPLE_RATE, format_duration, model_cache, resolve_device
+from whisper_vox_vad import detect_speech
+from whisper_vox_writers import SrtCueWriter
+
+# 既定のウィンドウ長（秒、Whisperが一度に処理できる最大長）
+DEFAULT_WINDOW = 30.0
+# 既定の文字起こし間隔（秒、字幕が出るまでのおおよその遅延）
+DEFAULT_STEP = 5.0
+# ウィンドウ末尾のこの時間内に終わるセグメントは、続きの音声を待ってから確定する（秒）
+DEFAULT_HOLDBACK = 2.0
+
+class StreamingTranscriber:
+    """ローリングウィンドウで音声を文字起こしし、確定したセグメントを返すクラス"""
+    def __init__(self, model, language="ja", window=DEFAULT_WINDOW, holdback=DEFAULT_HOLDBACK, fp16=False,
+                 log=None):
+        self.model = model
+        self.log = log or (lambda message: None)
+        self.language = language
+        self.window_samples = int(window * SAMPLE_RATE)
+        self.holdback = holdback
+        self.fp16 = fp16
+        self.buffer = np.zeros(0, dtype=np.float32)
+        # バッファ先頭の、ストリーム開始からの時刻（秒）
+        self.buffer_start = 0.0
+        # 直前に確定したテキスト（次のウィンドウの文脈として使用）
+        self.prompt = ""
+
+    def feed(self, samples):
+        """音声を追加して文字起こしし、確定したセグメントのリストを返す"""
+        self.buffer = np.concatenate([self.buffer, samples])
+        return self._transcribe(final=False)
+
+    def flush(self):
+        """入力の終了時に、残りのセグメントをすべて確定して返す"""
+        if len(self.buffer) == 0:
+            return []
+        return self._transcribe(final=True)
+
+    def _advance(self, seconds):
+        """確定した部分の音声を破棄する"""
+        drop = min(len(self.buffer), int(seconds * SAMPLE_RATE))
+        self.buffer = self.buffer[drop:]
+        self.buffer_start += drop / SAMPLE_RATE
+
+    def _transcribe(self, final):
+        buffer_seconds = len(self.buffer) / SAMPLE_RATE
+        full = len(self.buffer) >= self.window_samples
+
+        # 発話がなければ推論を省略し、ウィンドウからあふれた分だけ捨てる
+        if not detect_speech(self.buffer):
+            if final:
+                self._advance(buffer_seconds)
+            else:
+                self._advance(max(0.0, buffer_seconds - self.holdback))
+            return []
+
+        result = self.model.transcribe(
+            self.buffer[:self.window_samples],
+            language=self.language,
+            fp16=self.fp16,
+            condition_on_previous_text=False,
+            initial_prompt=self.prompt or None
+        )
+        segments = [s for s in result["segments"] if s["text"].strip()]
+
+        if final:
+            ready = segments
+        else:
+            # ウィンドウ末尾付近で終わるセグメントは、途中で切れている可能性があるため保留する
+            limit = min(buffer_seconds, self.window_samples / SAMPLE_RATE) - self.holdback
+            ready = [s for s in segments if s["end"] <= limit]
+            if not ready and full and segments:
+                # ウィンドウが埋まっても確定できない場合は、最後以外（なければ先頭）を確定する
+                ready = segments[:-1] or segments[:1]
+
+        consumed = (buffer_seconds if final else ready[-1]["end"]) if ready else 0.0
+        # 確定できるセグメントがない場合でも、ウィンドウを超えた分は捨ててメモリを一定に保つ。
+        # 捨てる音声にかかる保留中のセグメントは、続きの音声を待たずに確定してから捨てる
+        drop_until = buffer_seconds - self.window_samples / SAMPLE_RATE
+        if drop_until > consumed:
+            forced = [s for s in segments if s not in ready and consumed <= s["start"] < drop_until]
+            ready = ready + forced
+            covered = max([consumed] + [s["end"] for s in forced])
+            dropped = self.buffer[int(covered * SAMPLE_RATE):int(drop_until * SAMPLE_RATE)]
+            if len(dropped) > 0 and detect_speech(dropped):
+                self.log(f"警告: 文字起こしが追いつかないため、{format_duration(self.buffer_start + covered)}〜"
+                         f"{format_duration(self.buffer_start + drop_until)}の音声を字幕にせずに破棄しました")
+            consumed = max(covered, drop_until)
+
+        finalized = [
+            {"start": self.buffer_start + s["start"], "end": self.buffer_start + s["end"], "text": s["text"].strip()}
+            for s in ready
+        ]
+        if ready:
+            self.prompt = " ".join(s["text"] for s in finalized)[-200:]
+        self._advance(consumed)
+        return finalized
+
+def open_source(args):
+    """入力元を開き、(PCMを読み出すバイナリストリーム, FFmpegのプロセスまたはNone) を返す"""
+    if args.stdin:
+        return sys.stdin.buffer, None
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+    if args.realtime:
+        # ファイルを実時間の速度で読み込む（ライブ入力の再現用）
+        cmd += ["-re"]
+    if args.follow:
+        # 書き込み中のファイルを末尾に追記され続ける限り読み続ける
+        cmd += ["-follow", "1", "-i", f"file:{args.input}"]
+    else:
+        cmd += ["-i", args.input]
+    cmd += ["-vn", "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    return process.stdout, process
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="WhisperVox ストリーミング - リアルタイム字幕生成")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--stdin", help="標準入力から16kHzモノラルのfloat32 PCM（f32le）を読み込む", action="store_true")
+    source.add_argument("-i", "--input", help="入力ファイルまたは配信URL（FFmpegで読み込む）")
+    parser.add_argument("--follow", help="書き込み中のファイルを追記され続ける限り読み続ける", action="store_true")
+    parser.add_argument("--realtime", help="入力ファイルを実時間の速度で読み込む（動作確認用）", action="store_true")
+    parser.add_argument("-o", "--output", help="SRTの出力先（省略時は標準出力）", default=None)
+    parser.add_argument("-m", "--model", help="使用するWhisperモデルのサイズ",
+                        choices=["tiny", "base", "small", "medium", "large"], default="small")
+    parser.add_argument("-l", "--language", help="文字起こしの言語", default="ja")
+    parser.add_argument("--window", help="一度に文字起こしする音声の最大長（秒、30以下）",
+                        type=float, default=DEFAULT_WINDOW)
+    parser.add_argument("--step", help="文字起こしの間隔（秒）。字幕が出るまでの目標遅延",
+                        type=float, default=DEFAULT_STEP)
+    parser.add_argument("--holdback", help="ウィンドウ末尾で確定を保留する時間（秒）",
+                        type=float, default=DEFAULT_HOLDBACK)
+    parser.add_argument("--cpu", help="CPUを強制的に使用する", action="store_true")
+
+    args = parser.parse_args()
+    if not 0 < args.window <= DEFAULT_WINDOW:
+        parser.error(f"--window は0より大きく{DEFAULT_WINDOW:.0f}以下で指定してください")
+    if not 0 < args.step < args.window:
+        parser.error("--step は0より大きく --window より小さい値を指定してください")
+
+    # 進捗などのメッセージはSRTと混ざらないよう標準エラー出力に表示する
+    log = sys.stderr
+    with contextlib.redirect_stdout(log):
+        device = resolve_device("cpu" if args.cpu else None)
+        print(f"{args.model}モデルをロード中...")
+        model = model_cache.get(args.model, device)
+
+    transcriber = StreamingTranscriber(model, args.language, args.window, args.holdback, fp16=(device == "cuda"),
+                                       log=lambda message: print(message, file=log))
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    writer = SrtCueWriter(output)
+    stream, process = open_source(args)
+    step_bytes = int(args.step * SAMPLE_RATE) * 4
+    start_time = time.time()
+    received = 0.0
+    last_warning = 0.0
+    try:
+        while True:
+            data = stream.read(step_bytes)
+            if not data:
+                break
+            samples = np.frombuffer(data[:len(data) // 4 * 4], np.float32)
+            received += len(samples) / SAMPLE_RATE
+            cues = transcriber.feed(samples)
+            if cues:
+                writer.write(cues)
+                # 確定した字幕はすぐに表示する
+                output.flush()
+            # 処理が実時間に追いついていない場合は警告する（ライブ入力では遅延が増え続ける）
+            elapsed = time.time() - start_time
+            behind = elapsed - received
+            if behind > args.step and elapsed - last_warning > 30:
+                print(f"警告: 処理が実時間より{format_duration(behind)}遅れています。小さいモデルを使用してください", file=log)
+                last_warning = elapsed
+        writer.write(transcriber.flush())
+    except KeyboardInterrupt:
+        writer.write(transcriber.flush())
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if output is not sys.stdout:
+            output.close()
+    print(f"ストリーム終了: {format_duration(received)}の音声を処理、{writer.index}件の字幕を出力", file=log)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+WhisperVox VAD - エネルギーベースの軽量な音声区間検出
+
+長時間の音声を無音部分で分割するために使用する。
+"""
+import numpy as np
+
+# Whisperが想定する入力サンプリングレート（whisper.audio.SAMPLE_RATEと同じ）
+SAMPLE_RATE = 16000
+
+# エネルギー計算のフレーム長（秒）
+FRAME_SECONDS = 0.02
+
+def frame_energies_db(audio, sample_rate=SAMPLE_RATE, frame_seconds=FRAME_SECONDS):
+    """フレームごとのRMSエネルギー（dBFS）を計算する
+
+    Args:
+        audio: float32のモノラル音声
+        sample_rate: サンプリングレート
+        frame_seconds: フレーム長（秒）
+
+    Returns:
+        フレームごとのエネルギー（dB）のnumpy.ndarray
+    """
+    frame_len = int(sample_rate * frame_seconds)
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    # 長時間の音声でもメモリを使いすぎないよう、一定フレーム数ずつ計算する
+    energies = np.empty(n_frames, dtype=np.float32)
+    block = 65536
+    for start in range(0, n_frames, block):
+        end = min(start + block, n_frames)
+        frames = np.asarray(audio[start * frame_len:end * frame_len], dtype=np.float32).reshape(-1, frame_len)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        energies[start:end] = 20 * np.log10(np.maximum(rms, 1e-10))
+    return energies
+
+def _smooth(values, width):
+    """移動平均で平滑化する"""
+    if width <= 1 or len(values) < width:
+        return values
+    kernel = np.ones(width, dtype=np.float32) / width
+    return np.convolve(values, kernel, mode="same")
+
+def find_split_points(audio, chunk_seconds, sample_rate=SAMPLE_RATE, search_seconds=None):
+    """音声を無音部分で区切り、おおよそchunk_seconds秒ごとのチャンクに分割する
+
+    各目標位置の前後search_seconds秒の範囲で、最もエネルギーが低い位置を境界とする。
+    これにより発話の途中でチャンクが切れることを避ける。
+
+    Args:
+        audio: float32のモノラル音声
+        chunk_seconds: 目標とするチャンク長（秒）
+        sample_rate: サンプリングレート
+        search_seconds: 境界を探す範囲（秒、Noneはチャンク長の1/4、最大10秒）
+
+    Returns:
+        (開始サンプル, 終了サンプル) のリスト
+    """
+    total = len(audio)
+    chunk_len = int(chunk_seconds * sample_rate)
+    if chunk_len <= 0 or total <= chunk_len:
+        return [(0, total)]
+    if search_seconds is None:
+        search_seconds = min(10.0, chunk_seconds / 4)
+
+    energies = _smooth(frame_energies_db(audio, sample_rate), int(0.3 / FRAME_SECONDS))
+    frame_len = int(sample_rate * FRAME_SECONDS)
+    search = int(search_seconds / FRAME_SECONDS)
+
+    boundaries = [0]
+    while total - boundaries[-1] > chunk_len + search * frame_len:
+        target = (boundaries[-1] + chunk_len) // frame_len
+        lo = max(target - search, boundaries[-1] // frame_len + 1)
+        hi = min(target + search, len(energies))
+        if hi <= lo:
+            split = target * frame_len
+        else:
+            split = (lo + int(np.argmin(energies[lo:hi]))) * frame_len
+        boundaries.append(split)
+    boundaries.append(total)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+# 音声区間検出の既定値
+DEFAULT_VAD_PADDING = 0.2
+DEFAULT_VAD_MIN_SILENCE = 0.5
+DEFAULT_VAD_MIN_SPEECH = 0.25
+
+def _runs(mask):
+    """真偽値配列から連続するTrueの区間 (開始, 終了) を返す"""
+    padded = np.concatenate(([False], mask, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(changes[::2], changes[1::2]))
+
+def detect_speech(audio, threshold_db=None, padding=DEFAULT_VAD_PADDING, min_silence=DEFAULT_VAD_MIN_SILENCE,
+                  min_speech=DEFAULT_VAD_MIN_SPEECH, sample_rate=SAMPLE_RATE):
+    """発話と思われる区間を検出する
+
+    Args:
+        audio: float32のモノラル音声
+        threshold_db: 発話とみなすエネルギーのしきい値（dBFS）。Noneは背景雑音レベルから自動設定
+        padding: 検出した区間の前後に付け足す余白（秒）
+        min_silence: これより短い無音は発話の一部とみなす（秒）
+        min_speech: これより短い発話は雑音とみなして除外する（秒）
+        sample_rate: サンプリングレート
+
+    Returns:
+        (開始サンプル, 終了サンプル) のリスト
+    """
+    energies = frame_energies_db(audio, sample_rate)
+    if len(energies) == 0:
+        return []
+    if threshold_db is None:
+        # 下位10%を背景雑音レベルとみなし、それより12dB大きいものを発話とする
+        noise_floor = float(np.percentile(energies, 10))
+        threshold_db = max(noise_floor + 12.0, -50.0)
+    speech = _smooth(energies, 3) > threshold_db
+
+    # 短い無音を埋める
+    for start, end in _runs(~speech):
+        if start > 0 and end < len(speech) and (end - start) * FRAME_SECONDS < min_silence:
+            speech[start:end] = True
+
+    frame_len = int(sample_rate * FRAME_SECONDS)
+    pad = int(padding * sample_rate)
+    spans = []
+    for start, end in _runs(speech):
+        if (end - start) * FRAME_SECONDS < min_speech:
+            continue
+        span_start = max(0, int(start) * frame_len - pad)
+        span_end = min(len(audio), int(end) * frame_len + pad)
+        if spans and span_start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], span_end)
+        else:
+            spans.append((span_start, span_end))
+    return spans
+
+def compact_speech(audio, spans, sample_rate=SAMPLE_RATE):
+    """発話区間だけをつなげた音声と、時刻の対応表を返す
+
+    Returns:
+        (つなげた音声, [(つなげた音声上の開始秒, 元の音声上の開始秒, 長さ秒), ...])
+    """
+    pieces = []
+    time_map = []
+    position = 0
+    for start, end in spans:
+        pieces.append(audio[start:end])
+        time_map.append((position / sample_rate, start / sample_rate, (end - start) / sample_rate))
+        position += end - start
+    if not pieces:
+        return np.zeros(0, dtype=np.float32), []
+    return np.concatenate(pieces).astype(np.float32, copy=False), time_map
+
+def time_mapper(time_map):
+    """つなげた音声上の時刻を元の音声上の時刻に変換する関数を返す"""
+    starts = np.array([compact_start for compact_start, _, _ in time_map])
+
+    def map_time(t):
+        if not time_map:
+            return t
+        index = max(0, int(np.searchsorted(starts, t, side="right")) - 1)
+        compact_start, original_start, length = time_map[index]
+        return original_start + min(max(t - compact_start, 0.0), length)
+    return map_time
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+WhisperVox 出力 - 確定したセグメントを字幕ファイルへ逐次書き出す
+
+セグメントを受け取るたびに追記し、呼び出し元がチャンクの区切りでflushするため、処理の途中でも
+出力ファイルを開いて（tail -f などで）確定済みの字幕を確認できる。
+処理が中断した場合も、それまでに確定した字幕はファイルに残る。
+
+1回の文字起こし結果から複数の形式（SRT、WebVTT、テキスト、TSV、JSON）を同時に書き出せる。
+書き込みは受け取ったセグメントをまとめて1つの文字列にしてから行い、
+セグメント数が多くても行ごとの書き込みが処理時間の大半を占めないようにしている。
+"""
+import json
+
+# 出力ファイルの書き込みバッファのサイズ（バイト）。flushするまではこのサイズまで書き込みをまとめる
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+def format_time(seconds, decimal_marker=","):
+    """秒数を SRT 形式の時間文字列に変換（WebVTTではdecimal_markerに"."を指定）"""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    millis = int((seconds % 1) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{decimal_marker}{millis:03d}"
+
+class SrtCueWriter:
+    """確定したセグメントをSRTの字幕として逐次書き出すクラス"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.index = 0
+
+    def write(self, segments):
+        if not segments:
+            return
+        lines = []
+        for segment in segments:
+            self.index += 1
+            lines.append(f"{self.index}\n{format_time(segment['start'])} --> {format_time(segment['end'])}\n"
+                         f"{segment['text'].strip()}\n\n")
+        self.stream.write("".join(lines))
+
+class VttCueWriter:
+    """確定したセグメントをWebVTTの字幕として逐次書き出すクラス"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.index = 0
+        self.stream.write("WEBVTT\n\n")
+
+    def write(self, segments):
+        if not segments:
+            return
+        lines = []
+        for segment in segments:
+            self.index += 1
+            lines.append(f"{format_time(segment['start'], '.')} --> {format_time(segment['end'], '.')}\n"
+                         f"{segment['text'].strip()}\n\n")
+        self.stream.write("".join(lines))
+
+class TextWriter:
+    """確定したセグメントのテキストを逐次書き出すクラス（全文を連結した形式）"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.index = 0
+
+    def write(self, segments):
+        if not segments:
+            return
+        self.index += len(segments)
+        self.stream.write("".join(segment["text"] for segment in segments))
+
+class TsvWriter:
+    """確定したセグメントを「開始（ミリ秒）、終了（ミリ秒）、テキスト」のタブ区切りで逐次書き出すクラス"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.index = 0
+        self.stream.write("start\tend\ttext\n")
+
+    def write(self, segments):
+        if not segments:
+            return
+        self.index += len(segments)
+        self.stream.write("".join(
+            f"{round(segment['start'] * 1000)}\t{round(segment['end'] * 1000)}\t"
+            f"{' '.join(segment['text'].split())}\n"
+            for segment in segments
+        ))
+
+class JsonWriter:
+    """セグメントを単語のタイムスタンプとともにJSONで書き出すクラス
+
+    JSONは全体で1つの値のため、セグメントはメモリに溜めておき、close時にまとめて書き出す。
+    """
+    def __init__(self, stream, language=None):
+        self.stream = stream
+        self.language = language
+        self.segments = []
+
+    @property
+    def index(self):
+        return len(self.segments)
+
+    def write(self, segments):
+        for segment in segments:
+            item = {
+                "id": len(self.segments),
+                "start": segment["start"],
+                "end": segment["end"],
+                "text": segment["text"],
+            }
+            # チャンクごとに言語を判定した場合のみ、セグメントの言語を記録する
+            if segment.get("language"):
+                item["language"] = segment["language"]
+            if segment.get("words"):
+                item["words"] = [
+                    {"word": word["word"], "start": word["start"], "end": word["end"],
+                     "probability": word.get("probability")}
+                    for word in segment["words"]
+                ]
+            self.segments.append(item)
+
+    def close(self):
+        result = {
+            "language": self.language,
+            "text": "".join(segment["text"] for segment in self.segments),
+            "segments": self.segments,
+        }
+        self.stream.write(json.dumps(result, ensure_ascii=False))
+
+# 出力形式ごとの書き出しクラス
+SEGMENT_WRITERS = {
+    "srt": SrtCueWriter,
+    "vtt": VttCueWriter,
+    "txt": TextWriter,
+    "tsv": TsvWriter,
+    "json": JsonWriter,
+}
+
+# 出力できる形式（拡張子と同じ）
+OUTPUT_FORMATS = tuple(SEGMENT_WRITERS)
+
+class SegmentFileWriter:
+    """出力ファイルを開き、セグメントを指定した形式で逐次書き出すクラス
+
+    with文で使用すると、終了時（例外で中断した場合も）にファイルを閉じる。
+    """
+    def __init__(self, output_path, output_format="srt", language=None):
+        self.output_path = output_path
+        self.output_format = output_format
+        self.file = open(output_path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+        if output_format == "json":
+            self.writer = JsonWriter(self.file, language)
+        else:
+            self.writer = SEGMENT_WRITERS[output_format](self.file)
+
+    @property
+    def count(self):
+        """書き出したセグメント数"""
+        return self.writer.index
+
+    def write(self, segments):
+        self.writer.write(segments)
+
+    def flush(self):
+        """書き込んだ字幕をファイルへ書き出す（JSONはclose時にまとめて書き出すため何もしない）"""
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            if hasattr(self.writer, "close"):
+                self.writer.close()
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class MultiFormatWriter:
+    """同じセグメントを複数の出力ファイルへそれぞれの形式で逐次書き出すクラス
+
+    Args:
+        outputs: 出力形式から出力ファイルのパスへの辞書
+        language: JSONに記録する言語
+    """
+    def __init__(self, outputs, language=None):
+        self.writers = []
+        try:
+            for output_format, output_path in outputs.items():
+                self.writers.append(SegmentFileWriter(output_path, output_format, language))
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def count(self):
+        """書き出したセグメント数"""
+        return self.writers[0].count if self.writers else 0
+
+    def write(self, segments):
+        for writer in self.writers:
+            writer.write(segments)
+
+    def flush(self):
+        """チャンクの区切りで、書き込んだ字幕を各ファイルへ書き出す"""
+        for writer in self.writers:
+            writer.flush()
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()